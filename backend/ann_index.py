@@ -0,0 +1,188 @@
+"""
+Approximate nearest-neighbour index for Smart Vision Clinic
+Inverted-file (IVF) index in pure NumPy over FaceGallery rows
+"""
+
+import os
+import numpy as np
+from typing import Optional, List, Dict
+
+
+class IVFIndex:
+    """
+    Partitions gallery rows into k-means cells of the unit sphere
+    A query only scores the rows in its `nprobe` closest cells
+    
+    Tuning:
+      nlist   - number of cells (default ~4*sqrt(N) at training time)
+      nprobe  - cells scanned per query; higher means better recall, slower
+      min_size - galleries smaller than this use exact search instead
+    """
+    
+    def __init__(self, nlist: Optional[int] = None, nprobe: int = 8,
+                 min_size: int = 5000, train_iterations: int = 10, seed: int = 0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_size = min_size
+        self.train_iterations = train_iterations
+        self.seed = seed
+        
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_size = 0
+        self._lists: List[List[int]] = []
+        self._list_arrays: List[Optional[np.ndarray]] = []
+        self._assignment: Dict[int, int] = {}
+    
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+    
+    def should_search(self, size: int) -> bool:
+        """Exact search is cheaper (and exact) for small galleries"""
+        return self.is_trained and size >= self.min_size
+    
+    def needs_training(self, size: int) -> bool:
+        """Train once the gallery is big enough and retrain after it quadruples"""
+        if size < self.min_size:
+            return False
+        return not self.is_trained or size >= 4 * self.trained_size
+    
+    def train(self, matrix: np.ndarray, rows: Optional[np.ndarray] = None):
+        """
+        Fit cell centroids with spherical k-means and assign every row
+        rows: gallery rows to index (default all); skips deleted rows
+        """
+        if rows is None:
+            rows = np.arange(matrix.shape[0])
+        size = len(rows)
+        nlist = self.nlist or max(1, int(4 * np.sqrt(size)))
+        nlist = min(nlist, size)
+        
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(size, 64 * nlist)
+        sample = matrix[np.sort(rng.choice(rows, sample_size, replace=False))]
+        
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(self.train_iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            filled = norms[:, 0] > 0
+            # Empty cells keep their previous centroid
+            centroids[filled] = sums[filled] / norms[filled]
+        
+        self.centroids = centroids.astype(np.float32)
+        self.trained_size = size
+        self.clear_rows()
+        self.add_batch(rows, matrix)
+    
+    def clear_rows(self):
+        """Forget every row assignment but keep the trained cells"""
+        count = self.centroids.shape[0]
+        self._lists = [[] for _ in range(count)]
+        self._list_arrays = [None] * count
+        self._assignment = {}
+    
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        """Closest cell for each row of vectors"""
+        return np.argmax(np.atleast_2d(vectors) @ self.centroids.T, axis=1)
+    
+    def add_batch(self, rows: np.ndarray, matrix: np.ndarray, batch_size: int = 8192):
+        """Assign many gallery rows at once"""
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            cells = self.assign(matrix[batch])
+            for row, cell in zip(batch, cells):
+                self._insert(int(row), int(cell))
+    
+    def add(self, row: int, vector: np.ndarray):
+        """Insert or re-assign a single gallery row"""
+        if not self.is_trained:
+            return
+        self.remove(row)
+        self._insert(row, int(self.assign(vector)[0]))
+    
+    def _insert(self, row: int, cell: int):
+        self._lists[cell].append(row)
+        self._list_arrays[cell] = None
+        self._assignment[row] = cell
+    
+    def remove(self, row: int):
+        """Drop a gallery row from its cell"""
+        cell = self._assignment.pop(row, None)
+        if cell is not None:
+            self._lists[cell].remove(row)
+            self._list_arrays[cell] = None
+    
+    def _cell_rows(self, cell: int) -> np.ndarray:
+        rows = self._list_arrays[cell]
+        if rows is None:
+            rows = np.array(self._lists[cell], dtype=np.int64)
+            self._list_arrays[cell] = rows
+        return rows
+    
+    def candidates(self, query: np.ndarray) -> np.ndarray:
+        """Gallery rows stored in the query's nprobe closest cells"""
+        nprobe = min(self.nprobe, self.centroids.shape[0])
+        cell_scores = self.centroids @ query
+        if nprobe < len(cell_scores):
+            cells = np.argpartition(-cell_scores, nprobe - 1)[:nprobe]
+        else:
+            cells = np.arange(len(cell_scores))
+        return np.concatenate([self._cell_rows(int(c)) for c in cells])
+    
+    def save(self, path: str, patient_ids: List[Optional[str]]):
+        """Persist centroids and cell assignments with the patient id of each row"""
+        if not self.is_trained:
+            return
+        rows = np.array(sorted(self._assignment), dtype=np.int64)
+        temp_path = path + ".tmp.npz"
+        np.savez(
+            temp_path,
+            centroids=self.centroids,
+            trained_size=np.int64(self.trained_size),
+            rows=rows,
+            patient_ids=np.array([patient_ids[r] for r in rows], dtype=str),
+            cells=np.array([self._assignment[r] for r in rows], dtype=np.int64),
+        )
+        os.replace(temp_path, path)
+    
+    def load(self, path: str, patient_ids: List[Optional[str]], live_rows: np.ndarray,
+             matrix: np.ndarray) -> bool:
+        """
+        Restore a saved index onto the current gallery rows
+        A saved assignment is kept only if its row still holds the same
+        patient's template; rows added since the last save are assigned in one batch
+        """
+        if not os.path.exists(path):
+            return False
+        
+        with np.load(path) as data:
+            self.centroids = data['centroids'].astype(np.float32)
+            self.trained_size = int(data['trained_size'])
+            # Indexes saved before multi-template galleries have no row numbers
+            saved_rows = data['rows'] if 'rows' in data.files else np.empty(0, dtype=np.int64)
+            saved_ids = data['patient_ids'] if 'rows' in data.files else []
+            saved_cells = data['cells']
+        
+        self.clear_rows()
+        for row, patient_id, cell in zip(saved_rows, saved_ids, saved_cells):
+            row = int(row)
+            if row < len(patient_ids) and patient_ids[row] == str(patient_id):
+                self._insert(row, int(cell))
+        
+        self.sync_rows(live_rows, matrix)
+        return True
+    
+    def sync_rows(self, live_rows: np.ndarray, matrix: np.ndarray):
+        """
+        Bring the assignments up to date with the gallery: drop rows that are no
+        longer live and assign live rows added since training (or the last save)
+        """
+        assigned = np.fromiter(self._assignment, dtype=np.int64, count=len(self._assignment))
+        for row in np.setdiff1d(assigned, live_rows):
+            self.remove(int(row))
+        missing = np.setdiff1d(np.asarray(live_rows, dtype=np.int64), assigned)
+        if len(missing):
+            self.add_batch(missing, matrix)
@@ -2,6 +2,7 @@
 """
 Helper script for auth face recognition module
 Usage: python3 auth_face_helper.py <operation> <image_path> [patient_id]
+Pass "-" as image_path to stream the encoded image on stdin
 """
 import sys
 import os
@@ -22,16 +23,19 @@ try:
     patient_id = sys.argv[3] if len(sys.argv) > 3 else None
     
     # Check if image exists
-    if not os.path.exists(image_path):
+    if image_path != '-' and not os.path.exists(image_path):
         print(json.dumps({"error": f"Image file not found: {image_path}"}))
         sys.exit(1)
     
+    # Read streamed image bytes once, before the model loads
+    image = sys.stdin.buffer.read() if image_path == '-' else image_path
+    
     # Initialize face recognition system
     frs = FaceRecognitionSystem()
     
     if operation == 'extract':
         # Extract face embedding
-        embedding = frs.extract_face_embedding(image_path)
+        embedding = frs.extract_face_embedding(image)
         
         if embedding is None:
             print(json.dumps({"error": "Could not detect face in image"}))
@@ -48,24 +52,17 @@ try:
         
     elif operation == 'recognize':
         # Recognize face
-        embedding = frs.extract_face_embedding(image_path)
+        embedding = frs.extract_face_embedding(image)
         
         if embedding is None:
             print(json.dumps({"recognized": False, "error": "Could not detect face"}))
             sys.exit(0)
         
-        # Find matching patient
-        best_match = None
-        best_similarity = 0.0
-        threshold = 0.6
-        
-        for pid, enc in frs.patient_encodings.items():
-            similarity = frs.cosine_similarity(embedding, enc)
-            if similarity > best_similarity and similarity >= threshold:
-                best_similarity = similarity
-                best_match = pid
+        # Find matching patient (threshold: the model's default or $FACE_MATCH_THRESHOLD)
+        match = frs.match_patient(embedding)
         
-        if best_match:
+        if match:
+            best_match, best_similarity = match
             result = {
                 "recognized": True,
                 "patient_id": best_match,
@@ -81,7 +78,7 @@ try:
         
     elif operation == 'register' and patient_id:
         # Register face
-        embedding = frs.extract_face_embedding(image_path)
+        embedding = frs.extract_face_embedding(image)
         
         if embedding is None:
             print(json.dumps({"error": "Could not detect face in image"}))
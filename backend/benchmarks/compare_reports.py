@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Compare two benchmark suite reports for Smart Vision Clinic
+Prints every measurement found in both reports with its relative change and
+flags the ones that got worse by more than --tolerance (scaled up for tail
+quantiles); latency changes smaller than --min-change-ms are timer noise and
+never count
+Usage: python3 benchmarks/compare_reports.py <baseline.json> <candidate.json> [--tolerance 0.1]
+                                             [--min-change-ms 0.05]
+"""
+
+import sys
+import json
+import argparse
+from typing import Dict, Optional
+
+# Tail quantiles rest on a handful of samples, so they may move further before they count
+TOLERANCE_SCALE = {'p95_ms': 2.0, 'p99_ms': 3.0}
+
+
+def flatten(value, prefix: str = "") -> Dict[str, float]:
+    """Numeric leaves by dotted path; gallery runs are keyed by their size"""
+    if isinstance(value, dict):
+        items = {}
+        for key, child in value.items():
+            items.update(flatten(child, f"{prefix}.{key}" if prefix else key))
+        return items
+    if isinstance(value, list):
+        items = {}
+        for i, child in enumerate(value):
+            label = f"patients={child['patients']}" if isinstance(child, dict) and 'patients' in child else i
+            items.update(flatten(child, f"{prefix}[{label}]"))
+        return items
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: float(value)}
+    return {}
+
+
+def direction(path: str) -> Optional[int]:
+    """+1 if higher is better, -1 if lower is better, None for sizes and counts"""
+    name = path.rsplit(".", 1)[-1]
+    if name.endswith("_per_s") or name == "accuracy":
+        return 1
+    if name.endswith("_ms") or name.endswith("_s"):
+        return -1
+    return None
+
+
+def absolute_change_ms(path: str, old: float, new: float) -> Optional[float]:
+    """Size of a latency change in milliseconds (None for rates and accuracy)"""
+    name = path.rsplit(".", 1)[-1]
+    if name.endswith("_ms"):
+        return abs(new - old)
+    if name.endswith("_s") and not name.endswith("_per_s"):
+        return abs(new - old) * 1e3
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Diff two benchmark reports")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative change counted as a regression")
+    parser.add_argument("--min-change-ms", type=float, default=0.05,
+                        help="latency changes smaller than this are never regressions")
+    args = parser.parse_args()
+    
+    reports = []
+    for path in (args.baseline, args.candidate):
+        try:
+            with open(path) as f:
+                reports.append(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"Error: Could not read report {path}: {e}")
+            sys.exit(1)
+    baseline, candidate = (flatten(report.get('results', {})) for report in reports)
+    
+    for label, report in zip(("baseline", "candidate"), reports):
+        environment = report.get('environment', {})
+        print(f"{label:<9} {report.get('created', '?')}  commit {str(environment.get('git_commit'))[:10]}  "
+              f"{environment.get('processor', '?')} x{environment.get('cpu_count', '?')}")
+    print()
+    
+    regressions = []
+    print(f"{'measurement':<58} {'baseline':>12} {'candidate':>12} {'change':>8}")
+    for path in sorted(set(baseline) & set(candidate)):
+        better = direction(path)
+        if better is None:
+            continue
+        old, new = baseline[path], candidate[path]
+        change = (new - old) / abs(old) if old else 0.0
+        tolerance = args.tolerance * TOLERANCE_SCALE.get(path.rsplit(".", 1)[-1], 1.0)
+        worse = change * better < -tolerance
+        delta_ms = absolute_change_ms(path, old, new)
+        if delta_ms is not None and delta_ms < args.min_change_ms:
+            worse = False
+        if worse:
+            regressions.append(path)
+        print(f"{path:<58} {old:>12.4g} {new:>12.4g} {change:>+7.1%}{'  REGRESSION' if worse else ''}")
+    
+    missing = sorted(set(baseline) - set(candidate))
+    if missing:
+        print(f"\nOnly in baseline: {', '.join(missing)}")
+    if regressions:
+        print(f"\nError: {len(regressions)} measurement(s) worse by more than {args.tolerance:.0%} "
+              f"(and {args.min_change_ms:g} ms)")
+        sys.exit(1)
+    print("\nSuccess: No regressions beyond the tolerance")
+
+
+if __name__ == "__main__":
+    main()
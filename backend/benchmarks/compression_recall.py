@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Gallery compression recall report for Smart Vision Clinic
+Compares projected/quantized shortlist + exact re-rank against full-vector search:
+match agreement, identity accuracy, bytes scanned, gallery RAM and scan time per query
+Usage: python3 benchmarks/compression_recall.py [--patients 20000] [--dims 128,256,512]
+       python3 benchmarks/compression_recall.py --gallery face_encodings/gallery.bin
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from face_gallery import FaceGallery
+from embedding_compression import EmbeddingCompressor, PROJECTIONS, CODE_DTYPES
+from embedding_store import EmbeddingStore
+from metrics import resident_memory_bytes
+
+
+def synthetic_gallery(patients: int, dim: int, latent: int, noise: float, lookalikes: int, seed: int = 0):
+    """
+    Face-like embeddings: non-negative (ReLU) vectors driven by a lower-dimensional
+    identity code, so most of the 4096 dimensions are correlated as in VGG-Face.
+    The code's variance decays over its dimensions, so truncating it loses some
+    identity, and patients come in groups of `lookalikes` with nearby codes.
+    Returns (gallery rows, probe rows); probe i is a new capture of patient i
+    """
+    rng = np.random.default_rng(seed)
+    mixing = rng.normal(size=(latent, dim)).astype(np.float32)
+    spectrum = (1 / np.sqrt(1 + np.arange(latent) / 32)).astype(np.float32)
+    groups = rng.normal(size=((patients + lookalikes - 1) // lookalikes, latent)).astype(np.float32)
+    identities = groups[np.arange(patients) // lookalikes] + 0.6 * rng.normal(size=(patients, latent)).astype(np.float32)
+    
+    def capture() -> np.ndarray:
+        codes = identities + noise * rng.normal(size=identities.shape).astype(np.float32)
+        return np.maximum((codes * spectrum) @ mixing, 0)
+    
+    return capture(), capture()
+
+
+def stored_gallery(path: str, noise: float, seed: int = 0):
+    """Live rows of a gallery file, with noisy copies as probes"""
+    store = EmbeddingStore(path)
+    live = [row for row, patient_id in enumerate(store.entries(0)) if patient_id is not None]
+    rows = np.asarray(store.rows[live], dtype=np.float32)
+    store.close()
+    rng = np.random.default_rng(seed)
+    probes = rows + noise * rng.normal(size=rows.shape).astype(np.float32) * rows.std()
+    return rows, probes
+
+
+def mapped_resident_bytes(path: str) -> Optional[int]:
+    """Resident bytes of this process's mappings of a file (Linux only)"""
+    try:
+        with open('/proc/self/smaps') as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+    resident, in_file = 0, False
+    for line in lines:
+        fields = line.split()
+        if '-' in fields[0] and not fields[0].endswith(':'):
+            in_file = line.rstrip().endswith(path)
+        elif in_file and fields[0] == 'Rss:':
+            resident += int(fields[1]) * 1024
+    return resident
+
+
+def run(gallery_rows: np.ndarray, probes: np.ndarray, compressor, top_k: int) -> dict:
+    """
+    Match every probe against a file-backed gallery, as the service uses it
+    Returns best rows, scan latency, the bytes scanned per probe and the
+    gallery's resident memory after the queries (mapped matrix pages + codes)
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store_path = os.path.join(temp_dir, "gallery.bin")
+        gallery = FaceGallery(initial_capacity=len(gallery_rows), store_path=store_path, compressor=compressor)
+        gallery.add_batch([str(i) for i in range(len(gallery_rows))], gallery_rows)
+        # Writing the rows mapped them all in; start from a cold mapping like a restarted service
+        gallery.release_matrix()
+        result = search(gallery, probes, compressor, top_k)
+        mapped = mapped_resident_bytes(store_path)
+        if mapped is None:
+            mapped = gallery.matrix.nbytes
+        result['ram_mb'] = (mapped + gallery.code_bytes) / 2 ** 20
+        gallery.clear()
+    return result
+
+
+def search(gallery: FaceGallery, probes: np.ndarray, compressor, top_k: int) -> dict:
+    """Fit the compressor (if any) and match every probe; returns best rows, latency and bytes scanned"""
+    if compressor is not None:
+        compressor.top_k = top_k
+        compressor.fit(gallery.matrix)
+        gallery.set_codes(compressor, gallery.encode_rows(compressor))
+        scanned = gallery.codes()
+    else:
+        scanned = gallery.matrix
+    
+    matches, latencies = [], []
+    for probe in probes:
+        start = time.perf_counter()
+        match = gallery.best_match(probe, threshold=-1.0)
+        latencies.append(time.perf_counter() - start)
+        matches.append(int(match[0]) if match else -1)
+    return {
+        'matches': np.array(matches),
+        'p50_ms': float(np.percentile(latencies, 50) * 1e3),
+        'scan_mb': scanned.nbytes / 2 ** 20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall and speed of compressed gallery search")
+    parser.add_argument("--gallery", help="gallery.bin to evaluate instead of synthetic embeddings")
+    parser.add_argument("--patients", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=4096, help="synthetic embedding size")
+    parser.add_argument("--latent", type=int, default=512, help="synthetic identity dimensions")
+    parser.add_argument("--synthetic-noise", type=float, default=1.2,
+                        help="capture noise of synthetic probes, relative to the identity code")
+    parser.add_argument("--lookalikes", type=int, default=10, help="synthetic patients per group of similar faces")
+    parser.add_argument("--noise", type=float, default=0.5, help="probe noise for --gallery")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--dims", default="128,256,512", help="comma-separated projected sizes")
+    parser.add_argument("--methods", default=",".join(PROJECTIONS))
+    parser.add_argument("--dtypes", default="float16,int8")
+    parser.add_argument("--top-k", type=int, default=64)
+    args = parser.parse_args()
+    
+    if args.gallery:
+        gallery_rows, probes = stored_gallery(args.gallery, args.noise)
+    else:
+        gallery_rows, probes = synthetic_gallery(args.patients, args.dim, args.latent,
+                                                 args.synthetic_noise, args.lookalikes)
+    rng = np.random.default_rng(1)
+    queries = np.sort(rng.choice(len(probes), min(args.queries, len(probes)), replace=False))
+    probes = probes[queries]
+    print(f"{len(gallery_rows)} templates x {gallery_rows.shape[1]} dims, {len(probes)} queries\n")
+    
+    exact = run(gallery_rows, probes, None, args.top_k)
+    print(f"{'config':<22} {'agree':>7} {'accuracy':>9} {'scan MB':>9} {'scan cut':>9} {'RAM MB':>8} "
+          f"{'p50 ms':>8} {'speedup':>8}")
+    print(f"{'exact float32':<22} {1.0:>7.3f} {np.mean(exact['matches'] == queries):>9.3f} "
+          f"{exact['scan_mb']:>9.1f} {1.0:>8.1f}x {exact['ram_mb']:>8.1f} {exact['p50_ms']:>8.2f} {1.0:>7.1f}x")
+    
+    for method in args.methods.split(","):
+        for dim in (int(d) for d in args.dims.split(",")):
+            for dtype in args.dtypes.split(","):
+                if dtype not in CODE_DTYPES:
+                    parser.error(f"unknown dtype {dtype}")
+                result = run(gallery_rows, probes, EmbeddingCompressor(method, dim, dtype), args.top_k)
+                print(f"{f'{method} {dim} {dtype}':<22} "
+                      f"{np.mean(result['matches'] == exact['matches']):>7.3f} "
+                      f"{np.mean(result['matches'] == queries):>9.3f} "
+                      f"{result['scan_mb']:>9.1f} {exact['scan_mb'] / result['scan_mb']:>8.1f}x "
+                      f"{result['ram_mb']:>8.1f} {result['p50_ms']:>8.2f} {exact['p50_ms'] / result['p50_ms']:>7.1f}x")
+    
+    # Exact search maps the whole matrix in; shortlisting keeps it on disk
+    print("\nRAM MB: gallery file pages mapped in after the queries, plus the codes")
+    resident = resident_memory_bytes()
+    if resident is not None:
+        print(f"Process resident memory: {resident / 2 ** 20:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
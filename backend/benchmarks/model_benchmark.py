@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Embedding model benchmark for Smart Vision Clinic
+Runs each candidate DeepFace model over a labeled image folder (<person>/<image>.jpg)
+and reports cold-load time, per-image latency, throughput, peak RSS and
+verification accuracy on same/different-person pairs. The best threshold is the
+value to configure as FACE_MATCH_THRESHOLD for that model
+Usage: python3 benchmarks/model_benchmark.py <image_dir> [--models VGG-Face,Facenet512,ArcFace,SFace]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import itertools
+import multiprocessing
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is not reported
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+DEFAULT_MODELS = "VGG-Face,Facenet,Facenet512,ArcFace,SFace"
+
+
+def read_labeled_images(image_dir: str) -> List[Tuple[str, str]]:
+    """(person, image_path) for every image in a per-person subfolder"""
+    images = []
+    for person in sorted(os.listdir(image_dir)):
+        folder = os.path.join(image_dir, person)
+        if not os.path.isdir(folder):
+            continue
+        for filename in sorted(os.listdir(folder)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                images.append((person, os.path.join(folder, filename)))
+    return images
+
+
+def verification_pairs(labels: List[str], max_pairs: int, seed: int = 0) -> Tuple[List, List]:
+    """Same-person pairs and as many random different-person pairs"""
+    rng = random.Random(seed)
+    genuine = [(i, j) for i, j in itertools.combinations(range(len(labels)), 2) if labels[i] == labels[j]]
+    if len(genuine) > max_pairs:
+        genuine = rng.sample(genuine, max_pairs)
+    impostor = set()
+    attempts = 0
+    while len(impostor) < len(genuine) and attempts < 100 * max_pairs:
+        i, j = rng.randrange(len(labels)), rng.randrange(len(labels))
+        attempts += 1
+        if labels[i] != labels[j]:
+            impostor.add((min(i, j), max(i, j)))
+    return genuine, sorted(impostor)
+
+
+def best_threshold_accuracy(genuine: np.ndarray, impostor: np.ndarray) -> Tuple[float, float]:
+    """Highest verification accuracy over all cosine thresholds, and that threshold"""
+    scores = np.concatenate([genuine, impostor])
+    same = np.concatenate([np.ones(len(genuine), bool), np.zeros(len(impostor), bool)])
+    best_accuracy, best_threshold = 0.0, 0.0
+    for threshold in np.unique(scores):
+        accuracy = float(np.mean((scores >= threshold) == same))
+        if accuracy > best_accuracy:
+            best_accuracy, best_threshold = accuracy, float(threshold)
+    return best_accuracy, best_threshold
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def benchmark_model(model_name: str, detector: Optional[str], detector_backend: str, image_paths: List[str],
+                    labels: List[str], max_pairs: int) -> Dict:
+    """
+    Runs in a fresh process so load time and RSS belong to this model only
+    detector: local face detector, as in the worker and clinic app (None: DeepFace's detector_backend)
+    """
+    from face_recognition_module import FaceRecognitionSystem, MATCH_THRESHOLDS
+    
+    with tempfile.TemporaryDirectory() as encodings_dir:
+        start = time.perf_counter()
+        system = FaceRecognitionSystem(encodings_dir, use_ann_index=False, detector=detector,
+                                       model_name=model_name, detector_backend=detector_backend)
+        system.warm_up()
+        load_s = time.perf_counter() - start
+        
+        embeddings, latencies = [], []
+        start = time.perf_counter()
+        for path in image_paths:
+            image_start = time.perf_counter()
+            embeddings.append(system.extract_face_embedding(path))
+            latencies.append(time.perf_counter() - image_start)
+        total_s = time.perf_counter() - start
+    
+    failed = sum(embedding is None for embedding in embeddings)
+    result = {
+        'model': model_name,
+        'dim': next((len(e) for e in embeddings if e is not None), None),
+        'load_s': load_s,
+        'p50_ms': float(np.percentile(latencies, 50) * 1e3),
+        'p95_ms': float(np.percentile(latencies, 95) * 1e3),
+        'images_per_s': len(image_paths) / total_s if total_s else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+        'failed': failed,
+        'accuracy': None,
+        'threshold': None,
+        'default_threshold': MATCH_THRESHOLDS.get(model_name),
+    }
+    
+    # Images without a face count as neither match nor mismatch
+    vectors = [None if e is None else e / (np.linalg.norm(e) or 1) for e in embeddings]
+    genuine, impostor = verification_pairs(labels, max_pairs)
+    genuine = [float(vectors[i] @ vectors[j]) for i, j in genuine if vectors[i] is not None and vectors[j] is not None]
+    impostor = [float(vectors[i] @ vectors[j]) for i, j in impostor if vectors[i] is not None and vectors[j] is not None]
+    if genuine and impostor:
+        result['accuracy'], result['threshold'] = best_threshold_accuracy(np.array(genuine), np.array(impostor))
+        result['pairs'] = len(genuine) + len(impostor)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare DeepFace embedding models on a labeled image folder")
+    parser.add_argument("image_dir", help="folder with one subfolder of face images per person")
+    parser.add_argument("--models", default=DEFAULT_MODELS, help="comma-separated DeepFace model names")
+    parser.add_argument("--detector", default="haar",
+                        help="local face detector used by the worker and clinic app ('haar', 'yunet'), "
+                             "or 'none' for DeepFace's own")
+    parser.add_argument("--detector-backend", default="opencv", help="DeepFace detector with --detector none")
+    parser.add_argument("--max-images", type=int, default=500)
+    parser.add_argument("--max-pairs", type=int, default=2000, help="same-person pairs (as many different-person)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    
+    images = read_labeled_images(args.image_dir)
+    if not images:
+        print(f"Error: No labeled images found in {args.image_dir}")
+        sys.exit(1)
+    images = images[:args.max_images]
+    labels = [person for person, _ in images]
+    paths = [path for _, path in images]
+    print(f"{len(paths)} images of {len(set(labels))} people\n")
+    
+    results = []
+    context = multiprocessing.get_context("spawn")
+    print(f"{'model':<12} {'dim':>5} {'load s':>7} {'p50 ms':>8} {'p95 ms':>8} {'img/s':>7} "
+          f"{'RSS MB':>7} {'failed':>6} {'accuracy':>9} {'threshold':>9}")
+    for model_name in args.models.split(","):
+        try:
+            with context.Pool(1) as pool:
+                detector = None if args.detector == "none" else args.detector
+                result = pool.apply(benchmark_model, (model_name, detector, args.detector_backend, paths,
+                                                      labels, args.max_pairs))
+        except Exception as e:
+            print(f"Error benchmarking {model_name}: {e}")
+            continue
+        results.append(result)
+        fmt = lambda value, spec: format(value, spec) if value is not None else "-"
+        print(f"{model_name:<12} {fmt(result['dim'], '>5')} {result['load_s']:>7.1f} "
+              f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['images_per_s']:>7.1f} "
+              f"{fmt(result['peak_rss_mb'], '>7.0f')} {result['failed']:>6} "
+              f"{fmt(result['accuracy'], '>9.3f')} {fmt(result['threshold'], '>9.3f')}")
+    print("\nSet FACE_MATCH_THRESHOLD (or --threshold) to the threshold of the model you deploy")
+    
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'image_dir': args.image_dir, 'images': len(paths), 'results': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite for Smart Vision Clinic
+Measures gallery startup and find_matching_patient on synthetic galleries,
+ClinicDatabase read/write throughput on a synthetic SQLite dataset and
+end-to-end frame processing of a recorded video; no camera or network needed.
+Writes a JSON report that benchmarks/compare_reports.py diffs between versions
+Usage: python3 benchmarks/run_suite.py [--gallery-sizes 1000,10000,100000] [--video clip.mp4]
+                                       [--output report.json]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import cv2
+import numpy as np
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+from synthetic import write_gallery, gallery_probes, patient_rows, visit_rows, patient_id
+from embedding_store import LEGACY_MODEL
+from clinic_database import ClinicDatabase
+from patient_cache import PatientCache
+from metrics import MetricsRegistry
+
+REPORT_VERSION = 1
+SECTIONS = ('gallery', 'database', 'video')
+
+
+def latency_summary(seconds: List[float]) -> Dict[str, Optional[float]]:
+    """p50/p95/p99 and mean in milliseconds"""
+    if not seconds:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'mean_ms': None}
+    ms = np.asarray(seconds) * 1e3
+    return {
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'mean_ms': float(ms.mean()),
+    }
+
+
+def best_of_rounds(rounds: List[Dict]) -> Dict:
+    """
+    Lowest value of each statistic over repeated rounds of the same measurement
+    Other load on the machine only ever adds time, so the best round is the
+    one closest to the code's own cost (as with timeit)
+    """
+    return {key: float(min(r[key] for r in rounds)) if rounds[0][key] is not None else None
+            for key in rounds[0]}
+
+
+def time_calls(call, items, repeats: int) -> Dict:
+    """
+    latency_summary of call(item) over all items, repeated `repeats` times
+    Single microsecond-scale rounds are too noisy to compare between runs,
+    so each statistic is the best over the rounds
+    """
+    rounds = []
+    for _ in range(max(1, repeats)):
+        latencies = []
+        for item in items:
+            start = time.perf_counter()
+            call(item)
+            latencies.append(time.perf_counter() - start)
+        rounds.append(latency_summary(latencies))
+    return best_of_rounds(rounds)
+
+
+def write_rate(write, rows: List, batch_size: int, repeats: int) -> float:
+    """Rows per second of write(batch) over all rows: the best of `repeats` equal slices"""
+    rates = []
+    slice_size = -(-len(rows) // max(1, repeats))
+    for first in range(0, len(rows), slice_size):
+        part = rows[first:first + slice_size]
+        start = time.perf_counter()
+        for i in range(0, len(part), batch_size):
+            write(part[i:i + batch_size])
+        rates.append(len(part) / (time.perf_counter() - start))
+    return float(max(rates))
+
+
+def available_memory_bytes() -> Optional[int]:
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def time_matches(system, probes: np.ndarray, expected: List[str], threshold: float, repeats: int) -> Dict:
+    found = {}
+    
+    def match(i):
+        found[i] = system.find_matching_patient(probes[i], threshold)
+    
+    summary = time_calls(match, range(len(expected)), repeats)
+    correct = sum(found[i] == patient for i, patient in enumerate(expected))
+    return {**summary, 'accuracy': correct / len(expected) if expected else None}
+
+
+def bench_gallery(patients: int, args, work_dir: str) -> Dict:
+    """Startup and matching on a gallery of random unit vectors"""
+    from face_recognition_module import FaceRecognitionSystem
+    
+    result = {'patients': patients, 'dim': args.dim}
+    needed = patients * args.dim * 4
+    # The whole matrix is scanned per exact match; paging it from disk would measure the disk
+    available = available_memory_bytes()
+    if not args.force and available is not None and needed > 0.8 * available:
+        result['skipped'] = f"needs {needed / 2 ** 30:.1f} GiB, {available / 2 ** 30:.1f} GiB available"
+        return result
+    if not args.force and needed * 1.1 > shutil.disk_usage(work_dir).free:
+        result['skipped'] = f"needs {needed / 2 ** 30:.1f} GiB of free disk"
+        return result
+    
+    encodings_dir = os.path.join(work_dir, f"gallery_{patients}")
+    os.makedirs(encodings_dir)
+    start = time.perf_counter()
+    write_gallery(os.path.join(encodings_dir, "gallery.bin"), patients, args.dim, seed=args.seed)
+    result['write_s'] = time.perf_counter() - start
+    probes, expected = gallery_probes(os.path.join(encodings_dir, "gallery.bin"), args.queries,
+                                      seed=args.seed + 1)
+    
+    for mode, use_ann_index in (('exact', False), ('ann', True)):
+        start = time.perf_counter()
+        system = FaceRecognitionSystem(encodings_dir, use_ann_index=use_ann_index, detector=None,
+                                       model_name=LEGACY_MODEL, metrics=MetricsRegistry())
+        startup_s = time.perf_counter() - start
+        
+        # load_all_encodings alone, without model or detector setup
+        system.gallery.clear()
+        start = time.perf_counter()
+        system.load_all_encodings()
+        load_s = time.perf_counter() - start
+        system.load_index()
+        
+        # Training normally runs in the background; wait for it so matches use the index
+        start = time.perf_counter()
+        system.build_index()
+        index_build_s = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        system.find_matching_patient(probes[0], args.threshold)
+        first_match_s = time.perf_counter() - start
+        
+        result[mode] = {
+            'startup_s': startup_s,
+            'load_all_encodings_s': load_s,
+            'index_build_s': index_build_s,
+            'first_match_s': first_match_s,
+            **time_matches(system, probes, expected, args.threshold, args.repeats),
+        }
+        system.gallery.clear()
+        # Keep the next mode from loading the index this one saved
+        if os.path.exists(system.ann_index_path):
+            os.remove(system.ann_index_path)
+    return result
+
+
+def bench_database(args, work_dir: str) -> Dict:
+    """Write throughput and cached/uncached read latency of ClinicDatabase"""
+    db_path = os.path.join(work_dir, "bench_clinic.db")
+    # max_entries=0: every read goes to SQLite
+    db = ClinicDatabase(db_path, cache=PatientCache(max_entries=0), metrics=MetricsRegistry())
+    result = {'patients': args.patients, 'visits': args.visits}
+    
+    result['add_patients_per_s'] = write_rate(db.add_patients, patient_rows(args.patients), 1000, args.repeats)
+    # Batches the size VisitWriter commits
+    visits = list(visit_rows(args.visits, args.patients, args.seed))
+    result['add_visits_batched_per_s'] = write_rate(db.add_visits, visits, 50, args.repeats)
+    
+    result['add_visit'] = time_calls(lambda i: db.add_visit(patient_id(i % args.patients), "General Checkup"),
+                                     range(args.queries), args.repeats)
+    
+    lookups = [patient_id(int(i)) for i in np.random.default_rng(args.seed).integers(0, args.patients, args.queries)]
+    for name, method in (('get_patient_by_id', db.get_patient_by_id),
+                         ('get_patient_visits', db.get_patient_visits)):
+        result[name] = time_calls(method, lookups, args.repeats)
+    db.close()
+    
+    # The same reads with the app's cache, after one warm-up pass
+    db = ClinicDatabase(db_path, cache=PatientCache(max_entries=2 * args.queries), metrics=MetricsRegistry())
+    for patient in lookups:
+        db.get_patient_by_id(patient)
+    result['get_patient_by_id_cached'] = time_calls(db.get_patient_by_id, lookups, args.repeats)
+    db.close()
+    return result
+
+
+def bench_video(args, work_dir: str) -> Dict:
+    """Detection and recognition of every frame of a recorded video, one frame at a time"""
+    from face_recognition_module import FaceRecognitionSystem
+    
+    if not args.video:
+        return {'skipped': "no --video given"}
+    capture = cv2.VideoCapture(args.video)
+    if not capture.isOpened():
+        return {'skipped': f"could not open {args.video}"}
+    
+    metrics = MetricsRegistry()
+    encodings_dir = args.encodings_dir or os.path.join(work_dir, "video_encodings")
+    start = time.perf_counter()
+    system = FaceRecognitionSystem(encodings_dir, detection_scale=args.detection_scale, metrics=metrics)
+    system.warm_up()
+    startup_s = time.perf_counter() - start
+    
+    latencies = []
+    frames = faces = recognized = matched = 0
+    start = time.perf_counter()
+    while args.max_frames is None or frames < args.max_frames:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frame_start = time.perf_counter()
+        boxes = system.detect_faces_in_frame(frame)
+        if boxes and frames % args.recognize_every == 0:
+            results = system.recognize_faces(frame, boxes)
+            recognized += len(results)
+            matched += sum(1 for _, match in results if match)
+        latencies.append(time.perf_counter() - frame_start)
+        frames += 1
+        faces += len(boxes)
+    total_s = time.perf_counter() - start
+    capture.release()
+    
+    # Per-stage quantiles from the system's own timers (see metrics.py)
+    stages = {entry['labels']['stage']: {f"{key}_ms": entry[key] * 1e3 for key in ('p50', 'p95', 'p99')}
+              for entry in metrics.as_dict()['face_stage_seconds']['values'] if entry['count']}
+    return {
+        'video': os.path.basename(args.video),
+        'model': system.model_name,
+        'engine': system.embedder.engine if system.embedder is not None else "deepface",
+        'startup_s': startup_s,
+        'frames': frames,
+        'faces': faces,
+        'faces_recognized': recognized,
+        'faces_matched': matched,
+        'frames_per_s': frames / total_s if total_s else 0.0,
+        'frame': latency_summary(latencies),
+        'stages': stages,
+    }
+
+
+def environment() -> Dict:
+    """What the numbers were measured on"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=BENCHMARKS_DIR, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'git_commit': commit,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline recognition benchmark suite")
+    parser.add_argument("--sections", default=",".join(SECTIONS), help="comma-separated: " + ", ".join(SECTIONS))
+    parser.add_argument("--gallery-sizes", default="1000,10000,100000",
+                        help="patients per synthetic gallery (1000000 needs ~16 GiB at 4096 dims)")
+    parser.add_argument("--dim", type=int, default=4096, help="embedding dimensions (VGG-Face: 4096)")
+    parser.add_argument("--queries", type=int, default=200, help="timed matches / database reads")
+    parser.add_argument("--repeats", type=int, default=5,
+                        help="rounds of each latency and throughput measurement; the report keeps the best")
+    parser.add_argument("--threshold", type=float, default=0.6)
+    parser.add_argument("--patients", type=int, default=10000, help="patients in the synthetic database")
+    parser.add_argument("--visits", type=int, default=100000, help="visits in the synthetic database")
+    parser.add_argument("--video", help="recorded video for the end-to-end section")
+    parser.add_argument("--encodings-dir", help="gallery to match video faces against (default: empty)")
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--recognize-every", type=int, default=1, help="recognize faces on every Nth frame")
+    parser.add_argument("--detection-scale", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", help="where synthetic data is written (default: a temp dir)")
+    parser.add_argument("--force", action="store_true", help="run gallery sizes that exceed free RAM or disk")
+    parser.add_argument("--output", default="benchmark_report.json")
+    args = parser.parse_args()
+    sections = [section for section in args.sections.split(",") if section]
+    unknown = set(sections) - set(SECTIONS)
+    if unknown:
+        parser.error(f"unknown sections: {', '.join(sorted(unknown))}")
+    
+    report = {
+        'report_version': REPORT_VERSION,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': environment(),
+        'config': vars(args),
+        'results': {},
+    }
+    
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as work_dir:
+        if 'gallery' in sections:
+            report['results']['gallery'] = []
+            for size in (int(size) for size in args.gallery_sizes.split(",")):
+                print(f"Gallery of {size} patients...")
+                result = bench_gallery(size, args, work_dir)
+                report['results']['gallery'].append(result)
+                if 'skipped' in result:
+                    print(f"  skipped: {result['skipped']}")
+                else:
+                    for mode in ('exact', 'ann'):
+                        print(f"  {mode:<5} load {result[mode]['load_all_encodings_s']:.2f} s, match p50 "
+                              f"{result[mode]['p50_ms']:.2f} ms p95 {result[mode]['p95_ms']:.2f} ms, "
+                              f"accuracy {result[mode]['accuracy']:.3f}")
+                # Each gallery file can be gigabytes; drop it before writing the next
+                shutil.rmtree(os.path.join(work_dir, f"gallery_{size}"), ignore_errors=True)
+        
+        if 'database' in sections:
+            print(f"Database with {args.patients} patients, {args.visits} visits...")
+            result = report['results']['database'] = bench_database(args, work_dir)
+            print(f"  add_patients {result['add_patients_per_s']:.0f}/s, add_visits "
+                  f"{result['add_visits_batched_per_s']:.0f}/s, get_patient_visits p95 "
+                  f"{result['get_patient_visits']['p95_ms']:.3f} ms")
+        
+        if 'video' in sections:
+            print("End-to-end video...")
+            result = report['results']['video'] = bench_video(args, work_dir)
+            if 'skipped' in result:
+                print(f"  skipped: {result['skipped']}")
+            else:
+                print(f"  {result['frames']} frames at {result['frames_per_s']:.1f}/s, "
+                      f"frame p95 {result['frame']['p95_ms']:.1f} ms")
+    
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
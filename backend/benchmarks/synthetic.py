@@ -0,0 +1,76 @@
+"""
+Synthetic datasets for the Smart Vision Clinic benchmarks
+Galleries of random unit vectors and populated clinic databases, generated
+from a seed so that every run measures the same data
+"""
+
+import os
+import sys
+import random
+import numpy as np
+from typing import Iterator, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embedding_store import EmbeddingStore, LEGACY_MODEL
+
+PURPOSES = ("Face Recognition Check-in", "General Checkup", "Eye Test", "Follow-up")
+
+
+def patient_id(i: int) -> str:
+    return f"PAT{i:07d}"
+
+
+def random_unit_vectors(count: int, dim: int, rng: np.random.Generator) -> np.ndarray:
+    vectors = rng.standard_normal((count, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def write_gallery(path: str, patients: int, dim: int = 4096, seed: int = 0,
+                  model: str = LEGACY_MODEL, chunk: int = 10000):
+    """One random unit vector per patient, written in chunks so RAM stays flat"""
+    rng = np.random.default_rng(seed)
+    store = EmbeddingStore.create(path, dim, capacity=max(patients, 1), model=model)
+    try:
+        for start in range(0, patients, chunk):
+            end = min(start + chunk, patients)
+            store.append_batch([patient_id(i) for i in range(start, end)],
+                               random_unit_vectors(end - start, dim, rng))
+    finally:
+        store.close()
+
+
+def gallery_probes(path: str, count: int, noise: float = 0.5,
+                   seed: int = 1) -> Tuple[np.ndarray, List[str]]:
+    """
+    New "captures" of random enrolled patients: their vector plus noise of the given
+    norm, renormalized (cosine ~0.9 to the original at noise 0.5)
+    Returns (probes, expected patient ids)
+    """
+    rng = np.random.default_rng(seed)
+    store = EmbeddingStore(path)
+    try:
+        rows = np.sort(rng.choice(store.count, size=min(count, store.count), replace=False))
+        probes = np.asarray(store.rows[rows], dtype=np.float32)
+        probes += noise * random_unit_vectors(len(rows), store.dim, rng)
+        probes /= np.linalg.norm(probes, axis=1, keepdims=True)
+        expected = [store.patient_id(int(row)) for row in rows]
+    finally:
+        store.close()
+    return probes, expected
+
+
+def patient_rows(patients: int) -> List[Tuple[str, str, str, str]]:
+    """(patient_id, name, phone, email) rows for ClinicDatabase.add_patients"""
+    return [(patient_id(i), f"Patient {i}", f"+1555{i:07d}", f"patient{i}@example.com")
+            for i in range(patients)]
+
+
+def visit_rows(visits: int, patients: int, seed: int = 0) -> Iterator[Tuple[str, str, str, str, str]]:
+    """(patient_id, purpose, notes, prescription, visit_date) rows for ClinicDatabase.add_visits"""
+    rng = random.Random(seed)
+    for _ in range(visits):
+        yield (patient_id(rng.randrange(patients)), rng.choice(PURPOSES), "", "",
+               f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} "
+               f"{rng.randint(8, 17):02d}:{rng.randint(0, 59):02d}:00")
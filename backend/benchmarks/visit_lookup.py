@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Visit lookup benchmark for Smart Vision Clinic
+Measures ClinicDatabase.get_patient_visits latency as visit_history grows,
+with the (patient_id, visit_date DESC) index and without it
+Usage: python3 benchmarks/visit_lookup.py [--sizes 10000,100000,1000000] [--patients 10000]
+"""
+
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clinic_database import ClinicDatabase
+from patient_cache import PatientCache
+from synthetic import patient_id, patient_rows, visit_rows
+
+VISIT_INDEX = "idx_visit_history_patient_date"
+
+
+def fill_visits(db_path: str, start: int, end: int, patients: int):
+    """Insert visits start..end spread over the patients, one transaction"""
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO visit_history (patient_id, purpose, notes, prescription, visit_date) "
+            "VALUES (?, ?, ?, ?, ?)",
+            visit_rows(end - start, patients, seed=start)
+        )
+    conn.close()
+
+
+def time_lookups(db: ClinicDatabase, patients: int, queries: int) -> dict:
+    rng = random.Random(0)
+    latencies = []
+    for _ in range(queries):
+        start = time.perf_counter()
+        db.get_patient_visits(patient_id(rng.randrange(patients)), limit=10)
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies) * 1e6
+    return {"p50_us": float(np.percentile(latencies, 50)), "p95_us": float(np.percentile(latencies, 95))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark visit history lookups as the table grows")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma-separated visit counts")
+    parser.add_argument("--patients", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--unindexed-queries", type=int, default=20,
+                        help="lookups timed without the index (each is a full scan)")
+    args = parser.parse_args()
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = os.path.join(temp_dir, "bench_clinic.db")
+        # max_entries=0: every lookup goes to SQLite instead of the visit cache
+        db = ClinicDatabase(db_path, cache=PatientCache(max_entries=0))
+        # Visits reference patients, so create them first
+        db.add_patients(patient_rows(args.patients))
+        
+        print(f"{'visits':>10}  {'indexed p50':>12}  {'indexed p95':>12}  {'no index p50':>13}")
+        filled = 0
+        for size in sizes:
+            fill_visits(db_path, filled, size, args.patients)
+            filled = size
+            
+            indexed = time_lookups(db, args.patients, args.queries)
+            
+            conn = sqlite3.connect(db_path)
+            conn.execute(f"DROP INDEX {VISIT_INDEX}")
+            conn.close()
+            unindexed = time_lookups(db, args.patients, args.unindexed_queries)
+            
+            # Put the index back the way migration 2 created it
+            conn = sqlite3.connect(db_path)
+            conn.execute(f"CREATE INDEX {VISIT_INDEX} ON visit_history (patient_id, visit_date DESC)")
+            conn.close()
+            
+            print(f"{size:>10}  {indexed['p50_us']:>10.1f}us  {indexed['p95_us']:>10.1f}us  "
+                  f"{unindexed['p50_us']:>11.1f}us")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
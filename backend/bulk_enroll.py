@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Bulk face enrollment for Smart Vision Clinic
+Usage: python3 bulk_enroll.py <patients.csv | image_dir> [--workers N] [--batch-size N]
+
+CSV input needs patient_id and image_path columns (name, phone, email optional);
+a directory is enrolled as <patient_id>.<jpg|jpeg|png> files.
+Re-running after an interruption skips patients already listed in the checkpoint.
+"""
+
+import os
+import sys
+import csv
+import time
+import argparse
+import multiprocessing
+from typing import Dict, List, Optional, Tuple
+
+# Add current directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+_worker_system = None
+
+
+def read_entries(source: str) -> List[Dict[str, str]]:
+    """(patient_id, image_path, name, phone, email) records from a CSV file or image directory"""
+    if os.path.isdir(source):
+        return [
+            {'patient_id': os.path.splitext(filename)[0],
+             'image_path': os.path.join(source, filename)}
+            for filename in sorted(os.listdir(source))
+            if filename.lower().endswith(IMAGE_EXTENSIONS)
+        ]
+    
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source, newline='') as f:
+        entries = []
+        for row in csv.DictReader(f):
+            if not row.get('patient_id') or not row.get('image_path'):
+                continue
+            # Relative image paths are resolved against the CSV's folder
+            row['image_path'] = os.path.join(base_dir, row['image_path'])
+            entries.append(row)
+        return entries
+
+
+def read_checkpoint(path: str) -> set:
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def _init_worker(encodings_dir: str, threads: int, model_name: Optional[str]):
+    """Load the model once per worker process"""
+    global _worker_system
+    # Keep each process to its share of the cores; must be set before TensorFlow loads
+    for var in ('OMP_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS'):
+        os.environ.setdefault(var, str(threads))
+    
+    from face_recognition_module import FaceRecognitionSystem
+    _worker_system = FaceRecognitionSystem(encodings_dir, use_ann_index=False, model_name=model_name)
+    _worker_system.warm_up()
+
+
+def _embed_chunk(args: Tuple[List[str], List[str], int]) -> List[Tuple[str, Optional[list]]]:
+    patient_ids, image_paths, batch_size = args
+    embeddings = _worker_system.extract_image_embeddings(image_paths, batch_size)
+    return [
+        (patient_id, embedding.tolist() if embedding is not None else None)
+        for patient_id, embedding in zip(patient_ids, embeddings)
+    ]
+
+
+class BulkEnroller:
+    """Embeds images in a process pool and commits them to the gallery and database in chunks"""
+    
+    def __init__(self, encodings_dir: str = "face_encodings", db_path: str = "clinic.db",
+                 workers: Optional[int] = None, batch_size: int = 32, chunk_size: int = 256,
+                 checkpoint_path: Optional[str] = None, model_name: Optional[str] = None):
+        from face_recognition_module import FaceRecognitionSystem
+        from clinic_database import ClinicDatabase
+        
+        self.encodings_dir = encodings_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.checkpoint_path = checkpoint_path or os.path.join(encodings_dir, "bulk_enroll.checkpoint")
+        
+        # The parent only writes; the model is loaded in the workers
+        self.face_recognition = FaceRecognitionSystem(encodings_dir, detector=None, model_name=model_name)
+        self.db = ClinicDatabase(db_path)
+        
+        self.enrolled = 0
+        self.failed = 0
+        self.skipped = 0
+    
+    def run(self, entries: List[Dict[str, str]]) -> Dict:
+        done = read_checkpoint(self.checkpoint_path)
+        pending = [entry for entry in entries if entry['patient_id'] not in done]
+        self.skipped = len(entries) - len(pending)
+        if self.skipped:
+            print(f"Resuming: skipping {self.skipped} already enrolled patients")
+        
+        by_id = {entry['patient_id']: entry for entry in pending}
+        chunks = [
+            ([e['patient_id'] for e in pending[i:i + self.chunk_size]],
+             [e['image_path'] for e in pending[i:i + self.chunk_size]],
+             self.batch_size)
+            for i in range(0, len(pending), self.chunk_size)
+        ]
+        
+        print(f"Enrolling {len(pending)} patients with {self.workers} worker processes...")
+        start = time.time()
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(self.workers, initializer=_init_worker,
+                          initargs=(self.encodings_dir, threads, self.face_recognition.model_name)) as pool:
+            for results in pool.imap_unordered(_embed_chunk, chunks):
+                self._commit(results, by_id)
+                elapsed = time.time() - start
+                processed = self.enrolled + self.failed
+                print(f"  {processed}/{len(pending)} images, {processed / elapsed:.1f} images/s")
+        
+        # Train the ANN index here rather than in the first recognition after the import
+        self.face_recognition.build_index()
+        self.face_recognition.save_index()
+        elapsed = time.time() - start
+        report = {
+            "enrolled": self.enrolled,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "seconds": round(elapsed, 2),
+            "images_per_second": round((self.enrolled + self.failed) / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+        print(f"Enrolled {self.enrolled}, failed {self.failed}, skipped {self.skipped} "
+              f"in {elapsed:.1f}s ({report['images_per_second']} images/s)")
+        return report
+    
+    def _commit(self, results: List[Tuple[str, Optional[list]]], by_id: Dict[str, Dict[str, str]]):
+        """Write one chunk: patients, gallery rows, encoding records, then the checkpoint"""
+        enrolled = [(pid, embedding) for pid, embedding in results if embedding is not None]
+        for pid, embedding in results:
+            if embedding is None:
+                print(f"  No face found for {pid}: {by_id[pid]['image_path']}")
+        self.failed += len(results) - len(enrolled)
+        if not enrolled:
+            return
+        
+        patient_ids = [pid for pid, _ in enrolled]
+        self.db.add_patients([
+            (pid, by_id[pid].get('name') or pid, by_id[pid].get('phone') or "",
+             by_id[pid].get('email') or "")
+            for pid in patient_ids
+        ])
+        if not self.face_recognition.save_encodings(patient_ids, [emb for _, emb in enrolled]):
+            self.failed += len(enrolled)
+            return
+        self.db.add_face_encodings([(pid, self.face_recognition.store_path) for pid in patient_ids])
+        
+        # Only patients written to both the gallery and the database are checkpointed
+        with open(self.checkpoint_path, 'a') as f:
+            f.write("".join(f"{pid}\n" for pid in patient_ids))
+        self.enrolled += len(enrolled)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-enroll patient faces from a CSV file or image directory")
+    parser.add_argument("source", help="CSV with patient_id,image_path[,name,phone,email] or a directory of <patient_id>.jpg")
+    parser.add_argument("--encodings-dir", default="face_encodings")
+    parser.add_argument("--db", default="clinic.db")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=32, help="faces per model call")
+    parser.add_argument("--chunk-size", type=int, default=256, help="images per worker task and per commit")
+    parser.add_argument("--checkpoint", default=None)
+    parser.add_argument("--model", default=None, help="DeepFace embedding model (default: $FACE_MODEL or VGG-Face)")
+    parser.add_argument("--metrics-json", default=None,
+                        help="write this process's database and gallery metrics here as JSON on exit")
+    args = parser.parse_args()
+    
+    # Embedding runs in the worker processes; this process times the database and gallery writes
+    from metrics import REGISTRY
+    REGISTRY.dump_on_exit(args.metrics_json)
+    
+    if not os.path.exists(args.source):
+        print(f"Error: Source not found: {args.source}")
+        sys.exit(1)
+    
+    entries = read_entries(args.source)
+    if not entries:
+        print("Error: No patient images found")
+        sys.exit(1)
+    
+    enroller = BulkEnroller(args.encodings_dir, args.db, args.workers, args.batch_size,
+                            args.chunk_size, args.checkpoint, args.model)
+    enroller.run(entries)
+
+
+if __name__ == "__main__":
+    main()
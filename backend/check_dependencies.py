@@ -1,26 +1,33 @@
 #!/usr/bin/env python3
 """
 Check if required Python dependencies are installed
+Packages are located without importing them, so the check takes milliseconds
+instead of the seconds TensorFlow needs to load
 """
 
 import sys
+import importlib.util
+
+# Import name -> pip package
+REQUIRED = {
+    "cv2": "opencv-python",
+    "numpy": "numpy",
+    "deepface": "deepface",
+    "PIL": "pillow",
+}
 
 try:
-    import cv2
-    import numpy
-    from deepface import DeepFace
-    from PIL import Image
+    missing = [package for module, package in REQUIRED.items() if importlib.util.find_spec(module) is None]
     
-    print("Success: All dependencies are installed")
-    sys.exit(0)
+    if not missing:
+        print("Success: All dependencies are installed")
+        sys.exit(0)
     
-except ImportError as e:
-    print(f"Error: Missing dependency - {str(e)}")
+    print(f"Error: Missing dependency - {', '.join(missing)}")
     print("\nPlease install dependencies using:")
     print("  pip3 install --user --break-system-packages -r requirements.txt")
     sys.exit(1)
-    
+
 except Exception as e:
     print(f"Error: {str(e)}")
     sys.exit(1)
-
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Enforce an import-time budget for the face recognition helpers
+Imports each module in a fresh interpreter with -X importtime, fails if one
+takes longer than the budget or pulls in a heavy package (TensorFlow, DeepFace...)
+that should only load when an embedding is computed
+Usage: python3 check_import_time.py [--budget-ms 500] [--script-budget-ms 1000]
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+import subprocess
+from typing import Dict, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MODULES = [
+    "face_recognition_module",
+    "face_worker",
+    "clinic_database",
+    "recognition_pipeline",
+    "multi_camera",
+    "metrics",
+]
+SCRIPTS = ["check_dependencies.py"]
+HEAVY_PACKAGES = ["tensorflow", "keras", "tf_keras", "deepface", "torch", "onnxruntime"]
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile_import(module: str) -> Tuple[float, Dict[str, int]]:
+    """Cumulative import time of module in ms, and cumulative us per imported module"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    
+    imported = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            imported[match.group(4)] = int(match.group(2))
+    return imported[module] / 1e3, imported
+
+
+def time_script(script: str) -> float:
+    """Wall time of running a script, interpreter startup included, in ms"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, script], cwd=BACKEND_DIR, capture_output=True)
+    return (time.perf_counter() - start) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check helper module import times against a budget")
+    parser.add_argument("--budget-ms", type=float, default=500.0, help="per-module import budget")
+    parser.add_argument("--script-budget-ms", type=float, default=1000.0, help="budget for a whole script run")
+    parser.add_argument("--top", type=int, default=5, help="slowest imports to list per module")
+    args = parser.parse_args()
+    
+    failures = []
+    for module in MODULES:
+        try:
+            total_ms, imported = profile_import(module)
+        except Exception as e:
+            failures.append(f"{module}: import failed ({e})")
+            continue
+        
+        heavy = [name for name in imported if name.split(".")[0] in HEAVY_PACKAGES]
+        slowest = sorted((name for name in imported if "." not in name and name != module),
+                         key=imported.get, reverse=True)[:args.top]
+        print(f"{module}: {total_ms:.0f} ms  (slowest: "
+              f"{', '.join(f'{name} {imported[name] / 1e3:.0f} ms' for name in slowest)})")
+        if total_ms > args.budget_ms:
+            failures.append(f"{module}: {total_ms:.0f} ms exceeds the {args.budget_ms:.0f} ms budget")
+        if heavy:
+            failures.append(f"{module}: imports {', '.join(sorted({n.split('.')[0] for n in heavy}))} at load time")
+    
+    for script in SCRIPTS:
+        elapsed_ms = time_script(script)
+        print(f"{script}: {elapsed_ms:.0f} ms")
+        if elapsed_ms > args.script_budget_ms:
+            failures.append(f"{script}: {elapsed_ms:.0f} ms exceeds the {args.script_budget_ms:.0f} ms budget")
+    
+    if failures:
+        print("\nError: Import budget exceeded")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("\nSuccess: All modules within the import budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Check that the ONNX engine reproduces DeepFace embeddings
+Embeds the same face crops with DeepFace.represent and with OnnxEmbedder and
+compares them by cosine similarity; exits 1 if any pair is below --min-similarity
+Usage: python3 check_onnx_parity.py <model.onnx> <image> [<image> ...] [--model VGG-Face]
+       python3 check_onnx_parity.py <model.onnx> --export --model VGG-Face
+"""
+
+import sys
+import os
+import time
+import argparse
+import tempfile
+import cv2
+import numpy as np
+
+# Add current directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from onnx_embedder import OnnxEmbedder, ENGINES, export_onnx_model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare ONNX and DeepFace embeddings")
+    parser.add_argument("onnx_model")
+    parser.add_argument("images", nargs="*", help="face images (cropped to the largest face first)")
+    parser.add_argument("--model", default="VGG-Face", help="DeepFace model the ONNX file was exported from")
+    parser.add_argument("--engine", default="auto", choices=ENGINES)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--min-similarity", type=float, default=0.99)
+    parser.add_argument("--export", action="store_true", help="export the DeepFace model to onnx_model first")
+    args = parser.parse_args()
+    
+    if args.export:
+        print(f"Exporting {args.model} to {args.onnx_model}...")
+        export_onnx_model(args.model, args.onnx_model)
+    if not args.images:
+        if args.export:
+            sys.exit(0)
+        parser.error("no images given")
+    
+    from face_recognition_module import FaceRecognitionSystem
+    system = FaceRecognitionSystem(tempfile.mkdtemp(), model_name=args.model, use_ann_index=False)
+    # Reference embeddings always come from DeepFace, even with $FACE_ONNX_MODEL set
+    system.embedder = None
+    embedder = OnnxEmbedder(args.onnx_model, args.model, engine=args.engine, threads=args.threads)
+    
+    faces = []
+    for path in args.images:
+        image = cv2.imread(path)
+        if image is None:
+            print(f"Error: Could not read image: {path}")
+            sys.exit(1)
+        faces.append(system._largest_face(image))
+    
+    system.warm_up()
+    start = time.perf_counter()
+    reference = system.extract_face_embeddings(faces)
+    deepface_s = time.perf_counter() - start
+    
+    embedder.embed(faces[:1])
+    start = time.perf_counter()
+    candidate = embedder.embed(faces)
+    onnx_s = time.perf_counter() - start
+    
+    worst = 1.0
+    for path, expected, actual in zip(args.images, reference, candidate):
+        if expected is None:
+            print(f"{path}: DeepFace returned no embedding")
+            worst = -1.0
+            continue
+        if expected.shape != actual.shape:
+            print(f"Error: ONNX embeddings have {actual.shape[0]} dimensions, {args.model} has {expected.shape[0]}")
+            sys.exit(1)
+        similarity = float(expected @ actual / (np.linalg.norm(expected) * np.linalg.norm(actual) or 1))
+        worst = min(worst, similarity)
+        print(f"{path}: cosine {similarity:.6f}, max abs diff {np.max(np.abs(expected - actual)):.2e}")
+    
+    print(f"\n{embedder.engine}: {onnx_s * 1e3:.1f} ms for {len(faces)} faces, "
+          f"DeepFace: {deepface_s * 1e3:.1f} ms")
+    if worst < args.min_similarity:
+        print(f"Error: lowest similarity {worst:.6f} is below {args.min_similarity}")
+        sys.exit(1)
+    print(f"Success: ONNX and DeepFace embeddings agree (lowest similarity {worst:.6f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,32 +4,91 @@ Real-time face recognition for patient management
 """
 
 import cv2
+import queue
+import signal
+import threading
 import numpy as np
 from clinic_database import ClinicDatabase
+from patient_cache import PatientCache
 from face_recognition_module import FaceRecognitionSystem
 from patient_display import PatientDisplay
+from multi_camera import MultiCameraService, Source, parse_source
+from visit_writer import VisitWriter
+from recognition_events import EventBroadcaster
 import os
 from datetime import datetime
+from typing import Dict, List, Optional
 
 
 class ClinicApp:
     """Main application for Smart Vision Clinic"""
     
-    def __init__(self):
-        """Initialize the clinic application"""
-        self.db = ClinicDatabase()
-        self.face_recognition = FaceRecognitionSystem()
+    def __init__(self, events: Optional[EventBroadcaster] = None, threshold: Optional[float] = None,
+                 compression: Optional[str] = None):
+        """
+        Initialize the clinic application
+        events: recognition events are published here when given
+        threshold: match similarity (default $FACE_MATCH_THRESHOLD or the model's default)
+        compression: gallery compression spec such as 'pca:256:int8' (default $FACE_COMPRESSION)
+        """
+        self.events = events
+        # One cache serves the render loop and the database layer
+        self.patient_cache = PatientCache(max_entries=1024, ttl=60)
+        self.db = ClinicDatabase(cache=self.patient_cache)
+        # Detect on a half-size frame to keep the 1280x720 preview real-time;
+        # confident check-ins are kept as extra templates, at most hourly per patient
+        self.face_recognition = FaceRecognitionSystem(detection_scale=0.5, threshold=threshold, auto_enroll=True,
+                                                      compressor=compression)
         self.display = PatientDisplay(width=900, height=700)
+        # Check-ins are written in the background; repeats within 5 minutes are merged
+        self.visit_writer = VisitWriter(self.db, coalesce_window=300, on_write=self._visits_written)
+        
+        # Profile cards are drawn in the background for the patient in view, so 'p' opens at once
+        self._prerender_queue = queue.Queue()
+        self._prerender_target = None
+        self._prerender_thread = threading.Thread(target=self._prerender_loop, daemon=True)
+        self._prerender_thread.start()
         
         # State management
-        self.current_patient_id = None
-        self.last_recognition_time = 0
-        self.recognition_interval = 2  # Recognize every 2 seconds
+        self.recognition_interval = 0.5  # Minimum seconds between recognition runs per camera
         self.profile_window_open = False
+        self._stop_requested = threading.Event()
         
         print("Smart Vision Clinic initialized")
         print(f"Database loaded with {len(self.face_recognition.patient_encodings)} registered patients")
     
+    def _load_profile(self, patient_id: str) -> Optional[Dict]:
+        """Patient record with its recent visits, as shown on the profile card"""
+        patient_data = self.db.get_patient_by_id(patient_id)
+        if patient_data:
+            patient_data['visits'] = self.db.get_patient_visits(patient_id, limit=10)
+        return patient_data
+    
+    def prerender_profile(self, patient_id: str):
+        """Queue the patient's profile card to be rendered in the background"""
+        self._prerender_target = patient_id
+        self._prerender_queue.put(patient_id)
+    
+    def _prerender_loop(self):
+        while True:
+            patient_id = self._prerender_queue.get()
+            # Only the newest request matters; skip whoever already left the camera
+            if patient_id != self._prerender_target:
+                continue
+            try:
+                patient_data = self._load_profile(patient_id)
+                if patient_data:
+                    self.display.prerender_profile(patient_data)
+            except Exception as e:
+                print(f"Error pre-rendering profile: {e}")
+    
+    def _visits_written(self, patient_ids: List[str]):
+        """Called by the visit writer: cards showing old visit lists are redrawn"""
+        for patient_id in patient_ids:
+            self.display.invalidate_profile(patient_id)
+            if patient_id == self._prerender_target:
+                self._prerender_queue.put(patient_id)
+    
     def add_new_patient(self, image_path: str, patient_id: str, name: str, 
                        phone: str = "", email: str = ""):
         """
@@ -54,7 +113,7 @@ class ClinicApp:
             return False
         
         # Save face encoding
-        encoding_path = f"face_encodings/{patient_id}.pkl"
+        encoding_path = self.face_recognition.store_path
         success = self.face_recognition.save_encoding(patient_id, embedding)
         if not success:
             print("Error: Failed to save face encoding")
@@ -66,133 +125,202 @@ class ClinicApp:
         print(f"Patient {name} successfully registered!")
         return True
     
-    def recognize_and_display(self, frame: np.ndarray) -> tuple:
-        """
-        Recognize patient from frame and return recognition info
-        Returns (recognized, patient_id, similarity_score)
-        """
-        import time
-        current_time = time.time()
-        
-        # Throttle recognition to avoid excessive processing
-        if current_time - self.last_recognition_time < self.recognition_interval:
-            return (False, None, 0.0)
-        
-        self.last_recognition_time = current_time
-        
-        # Perform face recognition
-        result = self.face_recognition.recognize_face_from_frame(frame)
-        
-        if result:
-            patient_id, similarity = result
-            return (True, patient_id, similarity)
-        
-        return (False, None, 0.0)
-    
-    def run_recognition_mode(self, camera_index: int = 0):
+    def run_recognition_mode(self, camera_index: int = 0, sources: Optional[Dict[str, Source]] = None,
+                             max_recognitions_per_second: Optional[float] = None,
+                             headless: bool = False, poll_interval: float = 0.02):
         """
         Run the real-time patient recognition system
+        sources: stream name -> camera index, RTSP URL or video file; all streams
+        share one model and gallery (default: a single camera at camera_index)
+        max_recognitions_per_second: cap on model runs across all streams
+        headless: no windows or keyboard; results only go to the visit log and
+        self.events, checked every poll_interval seconds
         """
         print("\nStarting patient recognition mode...")
-        print("Controls:")
-        print("  - 'q': Quit")
-        print("  - 'p': Show profile window")
-        print("  - 'a': Add new visit record")
-        print("  - 'r': Register new patient")
-        print("  - ESC: Close windows\n")
+        if headless:
+            print("Running headless (Ctrl+C or SIGTERM to stop)\n")
+        else:
+            print("Controls:")
+            print("  - 'q': Quit")
+            print("  - 'p': Show profile window")
+            print("  - 'a': Add new visit record")
+            print("  - 'r': Register new patient")
+            print("  - 's': Print pipeline stats")
+            print("  - ESC: Close windows\n")
         
-        # Open camera
-        cap = cv2.VideoCapture(camera_index)
-        if not cap.isOpened():
+        # Capture, detection and recognition run on their own threads;
+        # this loop only renders whatever they produced most recently
+        if sources is None:
+            sources = {'camera': camera_index}
+        service = MultiCameraService(self.face_recognition, sources,
+                                     recognition_interval=self.recognition_interval,
+                                     max_recognitions_per_second=max_recognitions_per_second)
+        if not service.start():
             print("Error: Could not open camera")
             return
+        self._publish('started', cameras=list(service.pipelines))
         
-        # Set camera resolution
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-        
+        # Recognition state per stream
+        streams = {
+            name: {'patient': None, 'confidence': 0.0, 'frame_id': 0, 'display': None,
+                   'present': frozenset()}
+            for name in service.pipelines
+        }
         recognized_patient = None
         recognition_confidence = 0.0
-        recognition_timeout = 0
         
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            # Create display frame
-            display_frame = frame.copy()
-            
-            # Detect faces in frame
-            faces = self.face_recognition.detect_faces_in_frame(frame)
-            
-            # Draw face rectangles
-            for (x, y, w, h) in faces:
-                cv2.rectangle(display_frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-            
-            # Perform recognition
-            import time
-            if time.time() - recognition_timeout > 2:
-                recognized, patient_id, confidence = self.recognize_and_display(frame)
+        try:
+            while service.running and not self._stop_requested.is_set():
+                # Apply recognition results that finished since the last frame;
+                # identities are only reported once a track's votes agree
+                for name, _, matches in service.poll_results():
+                    matched = [match for _, match in matches if match]
+                    for patient_id, confidence in matched:
+                        print(f"[{name}] Patient recognized: {patient_id} (Confidence: {confidence:.1%})")
+                        
+                        # Queue visit record (never blocks the video)
+                        checked_in = self.visit_writer.record(patient_id, "Face Recognition Check-in",
+                                                              f"Automated check-in at {datetime.now()} ({name})")
+                        if self.events:
+                            patient_data = self.db.get_patient_by_id(patient_id)
+                            self._publish('recognized', camera=name, patient_id=patient_id,
+                                          name=patient_data['name'] if patient_data else None,
+                                          confidence=float(confidence), checked_in=checked_in)
+                    
+                    # Keyboard actions apply to the latest recognition on any stream
+                    if matched:
+                        previous = recognized_patient
+                        recognized_patient, recognition_confidence = max(matched, key=lambda m: m[1])
+                        if recognized_patient != previous and not headless:
+                            self.prerender_profile(recognized_patient)
                 
-                if recognized:
-                    recognized_patient = patient_id
-                    recognition_confidence = confidence
-                    recognition_timeout = time.time()
-                    print(f"Patient recognized: {patient_id} (Confidence: {confidence:.1%})")
+                for name, pipeline in service.pipelines.items():
+                    state = streams[name]
+                    frame, frame_id, faces = pipeline.latest()
+                    if frame is None or frame_id == state['frame_id']:
+                        # Nothing new from this camera yet
+                        continue
+                    state['frame_id'] = frame_id
                     
-                    # Add visit record
-                    self.db.add_visit(patient_id, "Face Recognition Check-in", 
-                                    f"Automated check-in at {datetime.now()}")
-                else:
-                    # Clear after 5 seconds
-                    if time.time() - recognition_timeout > 5:
-                        recognized_patient = None
-            
-            # Overlay recognition info
-            if recognized_patient:
-                patient_data = self.db.get_patient_by_id(recognized_patient)
-                if patient_data:
-                    display_frame = self.display.overlay_info_on_frame(
-                        display_frame, 
-                        patient_data['name'], 
-                        recognition_confidence
+                    # The overlay follows the most confident identified face still in view
+                    identified = [(identity, confidence)
+                                  for _, _, identity, confidence in pipeline.active_tracks() if identity]
+                    state['patient'], state['confidence'] = (
+                        max(identified, key=lambda m: m[1]) if identified else (None, 0.0)
                     )
-            else:
-                display_frame = self.display.display_waiting_message(display_frame)
-            
-            # Display frame
-            cv2.imshow('Smart Vision Clinic - Patient Recognition', display_frame)
-            
-            # Handle keyboard input
-            key = cv2.waitKey(1) & 0xFF
+                    
+                    # Subscribers hear when someone enters or leaves a camera's view
+                    present = frozenset(identity for identity, _ in identified)
+                    if present != state['present']:
+                        state['present'] = present
+                        self._publish('presence', camera=name, patients=[
+                            {'patient_id': identity, 'confidence': float(confidence)}
+                            for identity, confidence in sorted(identified, key=lambda m: -m[1])
+                        ])
+                    if headless:
+                        continue
+                    
+                    # Create display frame (one buffer per stream, reused every frame)
+                    display_frame = state['display']
+                    if display_frame is None or display_frame.shape != frame.shape:
+                        display_frame = state['display'] = np.empty_like(frame)
+                    np.copyto(display_frame, frame)
+                    
+                    # Draw face rectangles
+                    for (x, y, w, h) in faces:
+                        cv2.rectangle(display_frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+                    
+                    # Overlay recognition info
+                    patient_data = self.db.get_patient_by_id(state['patient']) if state['patient'] else None
+                    if patient_data:
+                        self.display.overlay_info_on_frame(
+                            display_frame, 
+                            patient_data['name'], 
+                            state['confidence'],
+                            in_place=True
+                        )
+                    elif not state['patient']:
+                        self.display.display_waiting_message(display_frame, in_place=True)
+                    
+                    # Display frame
+                    title = 'Smart Vision Clinic - Patient Recognition'
+                    if len(streams) > 1:
+                        title = f"{title} ({name})"
+                    cv2.imshow(title, display_frame)
+                
+                # Forget the patient once no camera has them in view
+                if recognized_patient not in {state['patient'] for state in streams.values()}:
+                    recognized_patient = None
+                
+                if headless:
+                    self._stop_requested.wait(poll_interval)
+                    continue
+                
+                # Handle keyboard input
+                key = cv2.waitKey(1) & 0xFF
+                
+                if key == ord('q'):
+                    break
+                elif key == ord('p') and recognized_patient:
+                    self.show_patient_profile(recognized_patient, recognition_confidence)
+                elif key == ord('a') and recognized_patient:
+                    self.add_visit_dialog(recognized_patient)
+                elif key == ord('r'):
+                    self.register_patient_dialog()
+                elif key == ord('s'):
+                    self.print_pipeline_stats(service)
+                    cache = self.patient_cache.stats()
+                    print(f"  patient cache {cache['entries']} entries, {cache['hits']} hits, "
+                          f"{cache['misses']} misses ({cache['hit_rate']:.1%})")
+                    print(f"  profile cards {self.display.profile_hits} hits, "
+                          f"{self.display.profile_misses} rendered")
+                elif key == 27:  # ESC
+                    cv2.destroyAllWindows()
             
-            if key == ord('q'):
-                break
-            elif key == ord('p') and recognized_patient:
-                self.show_patient_profile(recognized_patient, recognition_confidence)
-            elif key == ord('a') and recognized_patient:
-                self.add_visit_dialog(recognized_patient)
-            elif key == ord('r'):
-                self.register_patient_dialog()
-            elif key == 27:  # ESC
+        finally:
+            # Also on errors, so the camera threads stop and the visit writer can drain
+            service.stop()
+            self._publish('stopped')
+            if not headless:
                 cv2.destroyAllWindows()
-        
-        cap.release()
-        cv2.destroyAllWindows()
         print("\nRecognition mode ended")
     
+    def stop(self):
+        """Ask the recognition loop to end (safe from signal handlers and other threads)"""
+        self._stop_requested.set()
+    
+    def _publish(self, event_type: str, **data):
+        if self.events:
+            self.events.publish(event_type, **data)
+    
+    @staticmethod
+    def print_pipeline_stats(service: MultiCameraService):
+        """Print per-stream stage throughput/latency and queue depths"""
+        stats = service.stats()
+        print("\n--- Pipeline Stats ---")
+        for stream, stream_stats in stats['streams'].items():
+            print(f" [{stream}]")
+            for name, stage in stream_stats['stages'].items():
+                print(f"  {name:<12} {stage['fps']:6.1f}/s  avg {stage['avg_ms']:7.1f} ms  "
+                      f"last {stage['last_ms']:7.1f} ms")
+            for name, q in stream_stats['queues'].items():
+                dropped = f"  dropped {q['dropped']}" if 'dropped' in q else ""
+                print(f"  queue {name:<12} depth {q['depth']}{dropped}")
+            tracker = stream_stats['tracker']
+            print(f"  tracks {tracker['active_tracks']} active, "
+                  f"{tracker['recognitions_requested']} faces sent for recognition")
+        wait = stats['scheduler']['budget_wait']
+        print(f" scheduler: {stats['scheduler']['workers']} worker(s), "
+              f"avg budget wait {wait['avg_ms']:.1f} ms")
+    
     def show_patient_profile(self, patient_id: str, similarity_score: float):
         """Display detailed patient profile window"""
-        patient_data = self.db.get_patient_by_id(patient_id)
+        # Patient and visit history (usually cached, like the card itself)
+        patient_data = self._load_profile(patient_id)
         if not patient_data:
             print(f"Patient {patient_id} not found in database")
             return
         
-        # Get visit history
-        visits = self.db.get_patient_visits(patient_id, limit=10)
-        patient_data['visits'] = visits
-        
         # Create and display overlay
         overlay = self.display.create_profile_overlay(patient_data, similarity_score)
         
@@ -220,6 +348,7 @@ class ClinicApp:
         prescription = input("Prescription (optional): ").strip()
         
         success = self.db.add_visit(patient_id, purpose, notes, prescription)
+        self.display.invalidate_profile(patient_id)
         if success:
             print(f"Visit record added successfully for {patient_id}")
         else:
@@ -253,7 +382,8 @@ class ClinicApp:
         else:
             print("Error registering patient")
     
-    def run(self):
+    def run(self, sources: Optional[Dict[str, Source]] = None,
+            max_recognitions_per_second: Optional[float] = None, headless: bool = False):
         """Main entry point for the application"""
         print("\n" + "="*60)
         print("    SMART VISION CLINIC - Patient Recognition System")
@@ -261,7 +391,9 @@ class ClinicApp:
         print("\nStarting the application...")
         
         try:
-            self.run_recognition_mode()
+            self.run_recognition_mode(sources=sources,
+                                      max_recognitions_per_second=max_recognitions_per_second,
+                                      headless=headless)
         except KeyboardInterrupt:
             print("\n\nApplication interrupted by user")
         except Exception as e:
@@ -269,13 +401,59 @@ class ClinicApp:
             import traceback
             traceback.print_exc()
         finally:
+            writer_stopped = self.visit_writer.close()
+            if self.events:
+                self.events.close()
+            if writer_stopped:
+                self.db.close()
+            else:
+                # Closing would pull the connection from under the writer's transaction
+                print(f"Visit writer still busy; {self.visit_writer.unwritten} check-ins not written")
             print("\nThank you for using Smart Vision Clinic!")
 
 
 def main():
     """Main function"""
-    app = ClinicApp()
-    app.run()
+    import argparse
+    parser = argparse.ArgumentParser(description="Smart Vision Clinic patient recognition")
+    parser.add_argument("--source", action="append", default=[], metavar="[NAME=]SOURCE",
+                        help="camera index, RTSP URL or video file; repeat for several cameras")
+    parser.add_argument("--max-recognitions-per-second", type=float, default=None,
+                        help="CPU budget for face embedding across all cameras")
+    parser.add_argument("--headless", action="store_true",
+                        help="no windows or keyboard controls (for servers without a display)")
+    parser.add_argument("--events-port", type=int, default=None,
+                        help="stream recognition events as Server-Sent Events on this port")
+    parser.add_argument("--events-host", default="127.0.0.1")
+    parser.add_argument("--events-socket", default=None,
+                        help="stream recognition events as JSON lines on this Unix socket")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="match similarity (default: $FACE_MATCH_THRESHOLD or the model's default)")
+    parser.add_argument("--compression", default=None,
+                        help="shortlist matches from compressed codes, method:dim:dtype[:top_k] such as "
+                             "pca:256:int8, or 'none' (default: $FACE_COMPRESSION)")
+    args = parser.parse_args()
+    
+    sources = None
+    if args.source:
+        sources = {}
+        for i, spec in enumerate(args.source):
+            # NAME=SOURCE; a bare URL may itself contain '='
+            name, _, source = spec.partition('=') if '=' in spec.split('://')[0] else ('', '', spec)
+            sources[name or f"camera{i}"] = parse_source(source)
+    
+    events = None
+    if args.events_port is not None or args.events_socket:
+        events = EventBroadcaster()
+        if args.events_port is not None:
+            events.start_http(args.events_port, args.events_host)
+        if args.events_socket:
+            events.start_socket(args.events_socket)
+    
+    app = ClinicApp(events, args.threshold, args.compression)
+    # A service manager's SIGTERM ends the loop like 'q', so pending check-ins are still written
+    signal.signal(signal.SIGTERM, lambda signum, frame: app.stop())
+    app.run(sources, args.max_recognitions_per_second, args.headless)
 
 
 if __name__ == "__main__":
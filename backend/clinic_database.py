@@ -6,25 +6,31 @@ Handles patient data storage and retrieval
 import sqlite3
 import json
 import os
+import threading
 from datetime import datetime
 from typing import Optional, Dict, List, Tuple
+from patient_cache import PatientCache
+from metrics import MetricsRegistry, REGISTRY, timed
 
 
-class ClinicDatabase:
-    """Manages patient database operations"""
-    
-    def __init__(self, db_path: str = "clinic.db"):
-        """Initialize database connection and create tables if needed"""
-        self.db_path = db_path
-        self.init_database()
-    
-    def init_database(self):
-        """Create database tables if they don't exist"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Create patients table
-        cursor.execute('''
+# Applied to every connection; WAL lets readers run alongside the check-in writer
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",  # Durable at checkpoints, safe against corruption in WAL mode
+    "PRAGMA cache_size = -16000",  # 16 MB page cache
+    "PRAGMA mmap_size = 268435456",  # 256 MB memory-mapped reads
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA foreign_keys = ON",
+)
+
+
+# Schema migrations as (version, description, statements); the database's
+# PRAGMA user_version records the last one applied. Append new migrations,
+# never edit released ones.
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, "create patients, face_encodings and visit_history", [
+        '''
             CREATE TABLE IF NOT EXISTS patients (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 patient_id TEXT UNIQUE NOT NULL,
@@ -34,10 +40,8 @@ class ClinicDatabase:
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
-        ''')
-        
-        # Create face encodings table
-        cursor.execute('''
+        ''',
+        '''
             CREATE TABLE IF NOT EXISTS face_encodings (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 patient_id TEXT NOT NULL,
@@ -45,10 +49,8 @@ class ClinicDatabase:
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
             )
-        ''')
-        
-        # Create visit history table
-        cursor.execute('''
+        ''',
+        '''
             CREATE TABLE IF NOT EXISTS visit_history (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 patient_id TEXT NOT NULL,
@@ -58,24 +60,122 @@ class ClinicDatabase:
                 prescription TEXT,
                 FOREIGN KEY (patient_id) REFERENCES patients(patient_id)
             )
-        ''')
+        ''',
+    ]),
+    (2, "index visit and face encoding lookups by patient", [
+        # Serves WHERE patient_id = ? ORDER BY visit_date DESC LIMIT ? without a sort
+        '''
+            CREATE INDEX IF NOT EXISTS idx_visit_history_patient_date
+            ON visit_history (patient_id, visit_date DESC)
+        ''',
+        '''
+            CREATE INDEX IF NOT EXISTS idx_face_encodings_patient
+            ON face_encodings (patient_id)
+        ''',
+    ]),
+]
+
+# Latency of each public query method, cache hits included, labeled op=<method>
+DB_TIMER = "clinic_db_seconds"
+DB_TIMER_HELP = "Clinic database call latency"
+
+
+class ClinicDatabase:
+    """Manages patient database operations"""
+    
+    def __init__(self, db_path: str = "clinic.db", cache: Optional[PatientCache] = None,
+                 metrics: Optional[MetricsRegistry] = None):
+        """
+        Initialize database connection and create tables if needed
+        cache: patient/visit cache, shareable with the app (a private one by default)
+        metrics: registry timing every query method (the process-wide one by default)
+        """
+        self.db_path = db_path
+        self.cache = cache if cache is not None else PatientCache()
+        self.metrics = metrics if metrics is not None else REGISTRY
+        # Foreign keys are enforced, so a visit for a patient without a patients row is refused
+        self._rejected_visits = self.metrics.counter(
+            "clinic_visits_rejected_total", "Visits refused because the patient is not in the patients table")
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self.init_database()
+    
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Connection owned by the calling thread, opened on first use
+        Statements are prepared once and reused from the connection's statement cache
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Only this thread runs statements on it, but close() may run on
+            # any thread, which SQLite's default same-thread check refuses
+            conn = sqlite3.connect(self.db_path, cached_statements=256, check_same_thread=False)
+            for pragma in CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+    
+    def close(self):
+        """Close every connection opened by this database object"""
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._connections = []
+        self._local = threading.local()
+    
+    def init_database(self):
+        """Create or upgrade the schema to the latest version"""
+        self.migrate()
+    
+    def schema_version(self) -> int:
+        """Version of the last migration applied (SQLite user_version)"""
+        return self._connection().execute('PRAGMA user_version').fetchone()[0]
+    
+    def migrate(self, target: Optional[int] = None):
+        """
+        Apply pending MIGRATIONS in order, each in its own transaction
+        A failed migration is rolled back and leaves the version unchanged
+        """
+        conn = self._connection()
+        target = MIGRATIONS[-1][0] if target is None else target
         
-        conn.commit()
-        conn.close()
+        for version, description, statements in MIGRATIONS:
+            if version > target:
+                break
+            # Re-read under the write lock in case another process migrated first
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if conn.execute('PRAGMA user_version').fetchone()[0] >= version:
+                    conn.execute('ROLLBACK')
+                    continue
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {int(version)}')
+                conn.execute('COMMIT')
+                print(f"Database migrated to version {version}: {description}")
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
     
+    @timed(DB_TIMER, DB_TIMER_HELP)
     def add_patient(self, patient_id: str, name: str, phone: str = "", email: str = "") -> bool:
         """Add a new patient to the database"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO patients (patient_id, name, phone, email)
-                VALUES (?, ?, ?, ?)
-            ''', (patient_id, name, phone, email))
-            
-            conn.commit()
-            conn.close()
+            # Commits on success, rolls back on error
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    INSERT INTO patients (patient_id, name, phone, email)
+                    VALUES (?, ?, ?, ?)
+                ''', (patient_id, name, phone, email))
+            self.cache.invalidate(patient_id)
             return True
         except sqlite3.IntegrityError:
             return False  # Patient ID already exists
@@ -83,67 +183,153 @@ class ClinicDatabase:
             print(f"Error adding patient: {e}")
             return False
     
+    @timed(DB_TIMER, DB_TIMER_HELP)
+    def add_patients(self, patients: List[Tuple[str, str, str, str]]) -> int:
+        """
+        Add many (patient_id, name, phone, email) rows in one transaction
+        Existing patient IDs are skipped; returns the number inserted
+        """
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                
+                before = conn.total_changes
+                cursor.executemany('''
+                    INSERT OR IGNORE INTO patients (patient_id, name, phone, email)
+                    VALUES (?, ?, ?, ?)
+                ''', patients)
+                inserted = conn.total_changes - before
+            for patient in patients:
+                self.cache.invalidate(patient[0], 'patient')
+            return inserted
+        except Exception as e:
+            print(f"Error adding patients: {e}")
+            return 0
+    
+    @timed(DB_TIMER, DB_TIMER_HELP)
     def add_face_encoding(self, patient_id: str, encoding_path: str) -> bool:
         """Store face encoding path for a patient"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO face_encodings (patient_id, encoding_path)
-                VALUES (?, ?)
-            ''', (patient_id, encoding_path))
-            
-            conn.commit()
-            conn.close()
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    INSERT INTO face_encodings (patient_id, encoding_path)
+                    VALUES (?, ?)
+                ''', (patient_id, encoding_path))
             return True
         except Exception as e:
             print(f"Error adding face encoding: {e}")
             return False
     
+    @timed(DB_TIMER, DB_TIMER_HELP)
+    def add_face_encodings(self, encodings: List[Tuple[str, str]]) -> bool:
+        """Store many (patient_id, encoding_path) rows in one transaction, skipping recorded ones"""
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                
+                cursor.executemany('''
+                    INSERT INTO face_encodings (patient_id, encoding_path)
+                    SELECT ?, ?
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM face_encodings WHERE patient_id = ? AND encoding_path = ?
+                    )
+                ''', [(pid, path, pid, path) for pid, path in encodings])
+            return True
+        except Exception as e:
+            print(f"Error adding face encodings: {e}")
+            return False
+    
+    @timed(DB_TIMER, DB_TIMER_HELP)
     def add_visit(self, patient_id: str, purpose: str = "", notes: str = "", prescription: str = "") -> bool:
         """Record a patient visit"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO visit_history (patient_id, purpose, notes, prescription)
-                VALUES (?, ?, ?, ?)
-            ''', (patient_id, purpose, notes, prescription))
-            
-            conn.commit()
-            conn.close()
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    INSERT INTO visit_history (patient_id, purpose, notes, prescription)
+                    VALUES (?, ?, ?, ?)
+                ''', (patient_id, purpose, notes, prescription))
+            self.cache.invalidate(patient_id, 'visits')
             return True
+        except sqlite3.IntegrityError as e:
+            self._rejected_visits.inc()
+            print(f"Error adding visit for {patient_id} (not in the patients table?): {e}")
+            return False
         except Exception as e:
             print(f"Error adding visit: {e}")
             return False
     
+    @timed(DB_TIMER, DB_TIMER_HELP)
+    def add_visits(self, visits: List[Tuple[str, str, str, str, str]]) -> int:
+        """
+        Record many (patient_id, purpose, notes, prescription, visit_date) rows in one transaction
+        If one row is rejected (e.g. unknown patient, counted in
+        clinic_visits_rejected_total) the others are still written
+        Returns the number of visits stored
+        """
+        insert = '''
+            INSERT INTO visit_history (patient_id, purpose, notes, prescription, visit_date)
+            VALUES (?, ?, ?, ?, ?)
+        '''
+        try:
+            try:
+                with self._connection() as conn:
+                    conn.executemany(insert, visits)
+                return len(visits)
+            except sqlite3.IntegrityError:
+                stored = 0
+                for visit in visits:
+                    try:
+                        with self._connection() as conn:
+                            conn.execute(insert, visit)
+                        stored += 1
+                    except sqlite3.IntegrityError as e:
+                        self._rejected_visits.inc()
+                        print(f"Error adding visit for {visit[0]} (not in the patients table?): {e}")
+                return stored
+            finally:
+                # After the last commit, so no reader can cache rows from before it
+                for patient_id in {visit[0] for visit in visits}:
+                    self.cache.invalidate(patient_id, 'visits')
+        except Exception as e:
+            print(f"Error adding visits: {e}")
+            return 0
+    
+    @timed(DB_TIMER, DB_TIMER_HELP)
     def get_patient_by_id(self, patient_id: str) -> Optional[Dict]:
-        """Retrieve patient information by ID"""
+        """Retrieve patient information by ID (served from the cache when possible)"""
+        found, patient = self.cache.get(patient_id, 'patient')
+        if found:
+            return dict(patient) if patient else None
+        generation = self.cache.generation(patient_id)
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
+            cursor = self._connection().cursor()
+            cursor.row_factory = sqlite3.Row
             
             cursor.execute('SELECT * FROM patients WHERE patient_id = ?', (patient_id,))
             row = cursor.fetchone()
             
-            conn.close()
-            
-            if row:
-                return dict(row)
-            return None
+            patient = dict(row) if row else None
+            self.cache.put(patient_id, 'patient', patient, generation=generation)
+            return dict(patient) if patient else None
         except Exception as e:
             print(f"Error getting patient: {e}")
             return None
     
+    @timed(DB_TIMER, DB_TIMER_HELP)
     def get_patient_visits(self, patient_id: str, limit: int = 10) -> List[Dict]:
-        """Get visit history for a patient"""
+        """Get visit history for a patient (served from the cache when possible)"""
+        found, visits = self.cache.get(patient_id, 'visits', limit)
+        if found:
+            return [dict(visit) for visit in visits]
+        # Taken before the read: a visit added meanwhile keeps these rows out of the cache
+        generation = self.cache.generation(patient_id)
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
+            cursor = self._connection().cursor()
+            cursor.row_factory = sqlite3.Row
             
             cursor.execute('''
                 SELECT * FROM visit_history 
@@ -153,38 +339,38 @@ class ClinicDatabase:
             ''', (patient_id, limit))
             
             rows = cursor.fetchall()
-            conn.close()
             
-            return [dict(row) for row in rows]
+            visits = [dict(row) for row in rows]
+            self.cache.put(patient_id, 'visits', visits, limit, generation=generation)
+            # Callers get copies so they can't alter the cached records
+            return [dict(visit) for visit in visits]
         except Exception as e:
             print(f"Error getting visits: {e}")
             return []
     
+    @timed(DB_TIMER, DB_TIMER_HELP)
     def get_all_patients(self) -> List[Dict]:
         """Get all patients"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
+            cursor = self._connection().cursor()
+            cursor.row_factory = sqlite3.Row
             
             cursor.execute('SELECT * FROM patients ORDER BY name')
             rows = cursor.fetchall()
-            conn.close()
             
             return [dict(row) for row in rows]
         except Exception as e:
             print(f"Error getting all patients: {e}")
             return []
     
+    @timed(DB_TIMER, DB_TIMER_HELP)
     def get_encoding_paths(self) -> List[Tuple[str, str]]:
         """Get all patient IDs and their encoding paths"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            cursor = self._connection().cursor()
             
             cursor.execute('SELECT patient_id, encoding_path FROM face_encodings')
             rows = cursor.fetchall()
-            conn.close()
             
             return rows
         except Exception as e:
@@ -208,7 +394,10 @@ if __name__ == "__main__":
     visits = db.get_patient_visits("PAT001")
     print(f"Visits: {visits}")
     
-    # Clean up test database
-    os.remove("test_clinic.db")
+    # Clean up test database (WAL mode also leaves -wal/-shm files)
+    db.close()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists("test_clinic.db" + suffix):
+            os.remove("test_clinic.db" + suffix)
     print("Database test complete!")
 
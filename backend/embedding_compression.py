@@ -0,0 +1,178 @@
+"""
+Embedding Compression for Smart Vision Clinic
+Projects gallery embeddings to fewer dimensions and quantizes them for a fast first-pass scan
+"""
+
+import os
+import numpy as np
+from typing import Optional
+
+
+PROJECTIONS = ('pca', 'random')
+CODE_DTYPES = {'float32': np.float32, 'float16': np.float16, 'int8': np.int8}
+
+
+class EmbeddingCompressor:
+    """
+    Linear projection (PCA or random orthonormal) followed by optional quantization
+    
+    The compressed codes are only used to shortlist the top_k rows of a
+    probe; those rows are then re-scored against the full vectors, so the
+    reported similarity stays exact. With 4096-d VGG-Face embeddings,
+    256 dimensions in int8 are 1/64 of the bytes scanned per probe. In a
+    file-backed gallery the float32 rows also stay on disk: only the codes
+    are held in memory, and re-ranked rows are read from the file.
+    
+    Tuning:
+      dim      - projected dimensions
+      dtype    - 'float32', 'float16' or 'int8' code storage
+      top_k    - rows re-ranked with the full vectors
+      min_size - templates needed before fitting (PCA needs more rows than dim)
+    """
+    
+    def __init__(self, method: str = "pca", dim: int = 256, dtype: str = "int8",
+                 top_k: int = 64, min_size: int = 2000, seed: int = 0):
+        if method not in PROJECTIONS:
+            raise ValueError(f"Unknown projection: {method} (expected one of {', '.join(PROJECTIONS)})")
+        if dtype not in CODE_DTYPES:
+            raise ValueError(f"Unknown code dtype: {dtype} (expected one of {', '.join(CODE_DTYPES)})")
+        self.method = method
+        self.dim = dim
+        self.dtype = dtype
+        self.top_k = top_k
+        self.min_size = min_size
+        self.seed = seed
+        
+        self.mean: Optional[np.ndarray] = None
+        self.components: Optional[np.ndarray] = None
+        self.step: Optional[np.ndarray] = None
+        self.fitted_size = 0
+    
+    @property
+    def spec(self) -> str:
+        """Settings as 'method:dim:dtype', the format create_compressor parses"""
+        return f"{self.method}:{self.dim}:{self.dtype}"
+    
+    @property
+    def is_fitted(self) -> bool:
+        return self.components is not None
+    
+    def needs_fitting(self, size: int) -> bool:
+        """Fit once the gallery is big enough and refit after it quadruples"""
+        if size < self.min_size:
+            return False
+        return not self.is_fitted or size >= 4 * self.fitted_size
+    
+    def fit(self, matrix: np.ndarray, rows: Optional[np.ndarray] = None, sample_size: int = 20000):
+        """
+        Fit the projection (and int8 scales) on gallery rows
+        rows: rows to fit on (default all); a random sample of at most sample_size is used
+        """
+        if rows is None:
+            rows = np.arange(matrix.shape[0])
+        self.fitted_size = len(rows)
+        rng = np.random.default_rng(self.seed)
+        if len(rows) > sample_size:
+            rows = rng.choice(rows, sample_size, replace=False)
+        sample = np.asarray(matrix[np.sort(rows)], dtype=np.float32)
+        dim = min(self.dim, sample.shape[1])
+        
+        if self.method == 'pca':
+            self.mean = sample.mean(axis=0)
+            # Right singular vectors of the centred sample are the principal axes
+            _, _, vt = np.linalg.svd(sample - self.mean, full_matrices=False)
+            self.components = vt[:dim].T.astype(np.float32)
+        else:
+            # Orthonormal Gaussian projection (Johnson-Lindenstrauss)
+            self.mean = np.zeros(sample.shape[1], dtype=np.float32)
+            gaussian = rng.normal(size=(sample.shape[1], dim))
+            self.components = np.linalg.qr(gaussian)[0].astype(np.float32)
+        
+        self.step = None
+        if self.dtype == 'int8':
+            # Symmetric per-dimension scale; values beyond the sample's range are clipped
+            extent = np.abs(self.project(sample)).max(axis=0)
+            self.step = (np.maximum(extent, 1e-6) / 127).astype(np.float32)
+    
+    def project(self, vectors: np.ndarray) -> np.ndarray:
+        """Projected float32 vectors (rows x dim)"""
+        return (np.atleast_2d(np.asarray(vectors, dtype=np.float32)) - self.mean) @ self.components
+    
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Compressed codes for rows of full vectors"""
+        projected = self.project(vectors)
+        if self.dtype == 'int8':
+            return np.clip(np.rint(projected / self.step), -127, 127).astype(np.int8)
+        return projected.astype(CODE_DTYPES[self.dtype])
+    
+    def scores(self, codes: np.ndarray, query: np.ndarray, batch_size: int = 16384) -> np.ndarray:
+        """
+        Approximate similarity of every code row to a full-length query
+        Codes are widened to float32 a batch at a time, never the whole matrix
+        """
+        # x . q ~= mean . q + code(x) . (components^T q) for a row x
+        query = np.asarray(query, dtype=np.float32).ravel()
+        projected = query @ self.components
+        if self.step is not None:
+            projected = projected * self.step
+        offset = float(self.mean @ query)
+        result = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], batch_size):
+            batch = codes[start:start + batch_size]
+            result[start:start + batch_size] = batch.astype(np.float32) @ projected
+        return result + offset
+    
+    def shortlist(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Rows of the top_k approximate scores"""
+        scores = self.scores(codes, query)
+        if len(scores) <= self.top_k:
+            return np.arange(len(scores))
+        return np.argpartition(-scores, self.top_k - 1)[:self.top_k]
+    
+    def save(self, path: str):
+        """Persist the fitted projection next to the gallery"""
+        if not self.is_fitted:
+            return
+        temp_path = path + ".tmp.npz"
+        np.savez(
+            temp_path,
+            method=np.array(self.method),
+            dtype=np.array(self.dtype),
+            mean=self.mean,
+            components=self.components,
+            step=self.step if self.step is not None else np.empty(0, dtype=np.float32),
+            fitted_size=np.int64(self.fitted_size),
+        )
+        os.replace(temp_path, path)
+    
+    def load(self, path: str) -> bool:
+        """Restore a saved projection; settings are taken from the file"""
+        if not os.path.exists(path):
+            return False
+        with np.load(path) as data:
+            self.method = str(data['method'])
+            self.dtype = str(data['dtype'])
+            self.mean = data['mean'].astype(np.float32)
+            self.components = data['components'].astype(np.float32)
+            self.dim = self.components.shape[1]
+            self.step = data['step'] if data['step'].size else None
+            self.fitted_size = int(data['fitted_size'])
+        return True
+
+
+def create_compressor(spec: Optional[str]) -> Optional[EmbeddingCompressor]:
+    """
+    Build a compressor from 'method:dim:dtype[:top_k]', e.g. 'pca:256:int8'
+    An empty spec or 'none' means no compression
+    """
+    if not spec or spec.lower() == 'none':
+        return None
+    parts = spec.split(':')
+    if len(parts) not in (3, 4):
+        raise ValueError(f"Invalid compression spec: {spec} (expected method:dim:dtype[:top_k])")
+    try:
+        dim = int(parts[1])
+        top_k = int(parts[3]) if len(parts) == 4 else 64
+    except ValueError:
+        raise ValueError(f"Invalid compression spec: {spec} (dim and top_k must be integers)")
+    return EmbeddingCompressor(parts[0], dim, parts[2], top_k=top_k)
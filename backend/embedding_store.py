@@ -0,0 +1,338 @@
+"""
+Embedding Store for Smart Vision Clinic
+Single memory-mapped file holding every patient face embedding
+
+File layout (little endian):
+    header   64 bytes   magic, version, dim, count, capacity, id_width, model name
+    rows     capacity x dim float32
+    id table capacity x id_width bytes (1 status byte + UTF-8 patient id)
+
+`count` is the commit point: a row only becomes visible once the header
+count is advanced past it, and deletes flip a single status byte, so a
+crash never leaves a half-written entry behind. The model name tags which
+embedding model produced the rows; files written before the tag existed
+were all VGG-Face and read back as such.
+"""
+
+import os
+import mmap
+import struct
+import pickle
+import numpy as np
+from contextlib import contextmanager
+from typing import Optional, List
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+
+MAGIC = b"SVCGAL01"
+VERSION = 1
+HEADER_SIZE = 64
+HEADER_FORMAT = "<8sIIQQI24s"
+COUNT_OFFSET = 16
+LEGACY_MODEL = "VGG-Face"
+
+SLOT_EMPTY = 0
+SLOT_LIVE = 1
+SLOT_DELETED = 2
+
+# A new row this close to one of the patient's live rows is the same face
+# image registered again (e.g. retried after a timeout) and is not appended
+IDENTICAL_SIMILARITY = 0.999
+
+
+class EmbeddingStore:
+    """Append-only float32 embedding file with tombstone deletes"""
+    
+    def __init__(self, path: str):
+        """Open an existing store file (see create() for new ones)"""
+        self.path = path
+        self._open()
+    
+    @classmethod
+    def create(cls, path: str, dim: int, capacity: int = 1024, id_width: int = 64,
+               model: str = LEGACY_MODEL) -> "EmbeddingStore":
+        """Create an empty store file for embeddings of the given model and open it"""
+        temp_path = path + ".tmp"
+        cls._write_empty(temp_path, dim, capacity, id_width, model)
+        os.replace(temp_path, path)
+        return cls(path)
+    
+    @staticmethod
+    def _file_size(dim: int, capacity: int, id_width: int) -> int:
+        return HEADER_SIZE + capacity * dim * 4 + capacity * id_width
+    
+    @classmethod
+    def _write_empty(cls, path: str, dim: int, capacity: int, id_width: int, model: str):
+        tag = model.encode('utf-8')
+        if len(tag) > 24:
+            raise ValueError(f"Model name longer than 24 bytes: {model}")
+        with open(path, 'wb') as f:
+            f.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, dim, 0, capacity, id_width, tag))
+            f.truncate(cls._file_size(dim, capacity, id_width))
+            f.flush()
+            os.fsync(f.fileno())
+    
+    def _open(self):
+        with open(self.path, 'rb') as f:
+            header = f.read(struct.calcsize(HEADER_FORMAT))
+            self._inode = os.fstat(f.fileno()).st_ino
+        
+        # Plain reads for read_rows, next to the mapping
+        if getattr(self, '_fd', None) is not None:
+            os.close(self._fd)
+        self._fd = os.open(self.path, os.O_RDONLY)
+        
+        magic, version, dim, _, capacity, id_width, tag = struct.unpack(HEADER_FORMAT, header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a face gallery file: {self.path}")
+        
+        self.model = tag.rstrip(b"\0").decode('utf-8') or LEGACY_MODEL
+        self.dim = dim
+        self.capacity = capacity
+        self.id_width = id_width
+        
+        # Pages are only read from disk when a row is actually touched
+        self._mm = np.memmap(self.path, dtype=np.uint8, mode='r+')
+        rows_end = HEADER_SIZE + capacity * dim * 4
+        self.rows = self._mm[HEADER_SIZE:rows_end].view(np.float32).reshape(capacity, dim)
+        self._slots = self._mm[rows_end:rows_end + capacity * id_width].reshape(capacity, id_width)
+        self._count = self._mm[COUNT_OFFSET:COUNT_OFFSET + 8].view('<u8')
+    
+    @property
+    def count(self) -> int:
+        """Rows committed so far, including deleted ones"""
+        return int(self._count[0])
+    
+    @contextmanager
+    def _locked(self):
+        """Serialize writers across processes (worker, CLI scripts)"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + ".lock", 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self.refresh()
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def refresh(self):
+        """Re-open if another process replaced the file while growing it"""
+        try:
+            if os.stat(self.path).st_ino != self._inode:
+                self._open()
+        except FileNotFoundError:
+            pass
+    
+    def patient_id(self, row: int) -> Optional[str]:
+        """Patient id stored in a row, or None for deleted/empty rows"""
+        slot = self._slots[row]
+        if slot[0] != SLOT_LIVE:
+            return None
+        return bytes(slot[1:]).rstrip(b"\0").decode('utf-8')
+    
+    def entries(self, start: int = 0) -> List[Optional[str]]:
+        """Patient ids for every committed row from start onwards"""
+        slots = self._slots[start:self.count]
+        live = slots[:, 0] == SLOT_LIVE
+        ids = np.ascontiguousarray(slots[:, 1:]).view(f"S{self.id_width - 1}").ravel()
+        return [pid.decode('utf-8') if alive else None for pid, alive in zip(ids, live)]
+    
+    def append(self, patient_id: str, vector: np.ndarray) -> int:
+        """
+        Atomically append one (normalized) row; returns its row number
+        A row identical to one the patient already has is not appended again
+        and its existing row number is returned, so concurrent retries of one
+        registration leave a single template
+        """
+        encoded = patient_id.encode('utf-8')
+        if len(encoded) >= self.id_width:
+            raise ValueError(f"Patient id longer than {self.id_width - 1} bytes: {patient_id}")
+        if vector.shape[-1] != self.dim:
+            raise ValueError(f"Embedding has {vector.shape[-1]} dimensions, gallery expects {self.dim}")
+        
+        with self._locked():
+            existing = self._identical_row(encoded, vector)
+            if existing is not None:
+                return existing
+            
+            row = self.count
+            if row >= self.capacity:
+                self._grow(self.capacity * 2)
+            
+            self.rows[row] = vector
+            slot = np.zeros(self.id_width, dtype=np.uint8)
+            slot[0] = SLOT_LIVE
+            slot[1:1 + len(encoded)] = np.frombuffer(encoded, dtype=np.uint8)
+            self._slots[row] = slot
+            self._mm.flush()
+            
+            # Commit point
+            self._count[0] = row + 1
+            self._mm.flush()
+        return row
+    
+    def append_batch(self, patient_ids: List[str], vectors: np.ndarray) -> int:
+        """
+        Append many rows under one lock with a single commit
+        Returns the row number of the first appended row
+        """
+        vectors = np.atleast_2d(vectors)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding has {vectors.shape[1]} dimensions, gallery expects {self.dim}")
+        encoded = [patient_id.encode('utf-8') for patient_id in patient_ids]
+        for patient_id, raw in zip(patient_ids, encoded):
+            if len(raw) >= self.id_width:
+                raise ValueError(f"Patient id longer than {self.id_width - 1} bytes: {patient_id}")
+        
+        with self._locked():
+            start = self.count
+            end = start + len(encoded)
+            capacity = self.capacity
+            while end > capacity:
+                capacity *= 2
+            if capacity != self.capacity:
+                self._grow(capacity)
+            
+            self.rows[start:end] = vectors
+            slots = np.zeros((len(encoded), self.id_width), dtype=np.uint8)
+            slots[:, 0] = SLOT_LIVE
+            for i, raw in enumerate(encoded):
+                slots[i, 1:1 + len(raw)] = np.frombuffer(raw, dtype=np.uint8)
+            self._slots[start:end] = slots
+            self._mm.flush()
+            
+            # Commit point for the whole batch
+            self._count[0] = end
+            self._mm.flush()
+        return start
+    
+    def _identical_row(self, encoded: bytes, vector: np.ndarray) -> Optional[int]:
+        """A live row of this patient holding (nearly) the same vector, if any"""
+        slot = np.zeros(self.id_width, dtype=np.uint8)
+        slot[0] = SLOT_LIVE
+        slot[1:1 + len(encoded)] = np.frombuffer(encoded, dtype=np.uint8)
+        rows = np.flatnonzero((self._slots[:self.count] == slot).all(axis=1))
+        if rows.size == 0:
+            return None
+        similarity = self.read_rows(rows) @ np.asarray(vector, dtype=np.float32).ravel()
+        best = int(np.argmax(similarity))
+        return int(rows[best]) if similarity[best] >= IDENTICAL_SIMILARITY else None
+    
+    def live_mask(self, end: Optional[int] = None) -> np.ndarray:
+        """Whether each committed row before end is live (not deleted)"""
+        end = self.count if end is None else end
+        return self._slots[:end, 0] == SLOT_LIVE
+    
+    def delete(self, row: int):
+        """Tombstone a row with a single status byte write"""
+        with self._locked():
+            if row < self.count and self._slots[row, 0] == SLOT_LIVE:
+                self._slots[row, 0] = SLOT_DELETED
+                self.rows[row] = 0
+                self._mm.flush()
+    
+    def read_rows(self, rows: np.ndarray) -> np.ndarray:
+        """
+        Copies of the given rows, read from the file instead of the mapping
+        Faulting a few scattered rows through the mapping can map in megabytes
+        around each one; reads only bring in the rows asked for
+        """
+        if not hasattr(os, 'pread'):
+            return np.asarray(self.rows[rows])
+        row_bytes = self.dim * 4
+        out = np.empty((len(rows), self.dim), dtype=np.float32)
+        for i, row in enumerate(rows):
+            out[i] = np.frombuffer(os.pread(self._fd, row_bytes, HEADER_SIZE + int(row) * row_bytes),
+                                   dtype=np.float32)
+        return out
+    
+    def release_rows(self, start: int = 0, end: Optional[int] = None):
+        """
+        Drop the mapped pages of rows [start, end) from this process's memory
+        The rows stay in the file (and the OS page cache); reading them maps them back in
+        """
+        handle = getattr(self._mm, '_mmap', None)
+        if handle is None or not hasattr(handle, 'madvise'):
+            return  # No madvise (Windows, Python < 3.8): pages stay until the OS reclaims them
+        end = self.count if end is None else end
+        # Only whole pages inside the rows; neighbouring header or slot bytes stay mapped
+        first = -(-(HEADER_SIZE + start * self.dim * 4) // mmap.PAGESIZE) * mmap.PAGESIZE
+        last = (HEADER_SIZE + end * self.dim * 4) // mmap.PAGESIZE * mmap.PAGESIZE
+        if last > first:
+            handle.madvise(mmap.MADV_DONTNEED, first, last - first)
+    
+    def _grow(self, capacity: int):
+        """Copy into a bigger file and swap it in atomically"""
+        count = self.count
+        temp_path = self.path + ".tmp"
+        self._write_empty(temp_path, self.dim, capacity, self.id_width, self.model)
+        
+        grown = EmbeddingStore(temp_path)
+        grown.rows[:count] = self.rows[:count]
+        grown._slots[:count] = self._slots[:count]
+        grown._mm.flush()
+        grown._count[0] = count
+        grown._mm.flush()
+        grown.close()
+        
+        self.close()
+        os.replace(temp_path, self.path)
+        self._open()
+    
+    def close(self):
+        if self._mm is not None:
+            self._mm.flush()
+            self.rows = self._slots = self._count = None
+            self._mm = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+    
+    @classmethod
+    def migrate_pickles(cls, encodings_dir: str, path: str, normalize=None) -> Optional["EmbeddingStore"]:
+        """
+        One-shot import of legacy <patient_id>.pkl files (VGG-Face) into a new store
+        Returns None when there is nothing to migrate
+        """
+        embeddings = []
+        for filename in sorted(os.listdir(encodings_dir)):
+            if not filename.endswith('.pkl'):
+                continue
+            try:
+                with open(os.path.join(encodings_dir, filename), 'rb') as f:
+                    embedding = np.asarray(pickle.load(f), dtype=np.float32).ravel()
+                if normalize is not None:
+                    embedding = normalize(embedding)
+                embeddings.append((filename[:-4], embedding))
+            except Exception as e:
+                print(f"Error migrating {filename}: {e}")
+        
+        if not embeddings:
+            return None
+        
+        dim = embeddings[0][1].shape[0]
+        embeddings = [(pid, emb) for pid, emb in embeddings
+                      if emb.shape[0] == dim and len(pid.encode('utf-8')) < 64]
+        count = len(embeddings)
+        
+        temp_path = path + ".migrating"
+        cls._write_empty(temp_path, dim, max(1024, count), 64, LEGACY_MODEL)
+        store = cls(temp_path)
+        for row, (patient_id, embedding) in enumerate(embeddings):
+            encoded = patient_id.encode('utf-8')
+            store.rows[row] = embedding
+            store._slots[row, 0] = SLOT_LIVE
+            store._slots[row, 1:1 + len(encoded)] = np.frombuffer(encoded, dtype=np.uint8)
+        store._mm.flush()
+        store._count[0] = count
+        store.close()
+        
+        os.replace(temp_path, path)
+        print(f"Migrated {count} pickle encodings into {path}")
+        return cls(path)
@@ -0,0 +1,98 @@
+"""
+Face Detectors for Smart Vision Clinic
+Reusable detection backends; each loads its model once and is called per frame
+"""
+
+import os
+import cv2
+import numpy as np
+from typing import List, Tuple, Optional
+
+
+Box = Tuple[int, int, int, int]
+
+DEFAULT_YUNET_MODEL = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "models", "face_detection_yunet_2023mar.onnx"
+)
+
+
+class HaarFaceDetector:
+    """OpenCV Haar cascade detector (fast, CPU only, frontal faces)"""
+    
+    def __init__(self, scale_factor: float = 1.1, min_neighbors: int = 4,
+                 min_size: Tuple[int, int] = (0, 0), cascade_path: Optional[str] = None):
+        if cascade_path is None:
+            cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+        self.cascade = cv2.CascadeClassifier(cascade_path)
+        if self.cascade.empty():
+            raise ValueError(f"Could not load Haar cascade: {cascade_path}")
+        
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+    
+    def detect(self, image: np.ndarray) -> List[Box]:
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        faces = self.cascade.detectMultiScale(gray, self.scale_factor, self.min_neighbors,
+                                              minSize=self.min_size)
+        return [(int(x), int(y), int(w), int(h)) for (x, y, w, h) in faces]
+
+
+class YuNetFaceDetector:
+    """
+    OpenCV DNN YuNet detector (cv2.FaceDetectorYN)
+    More robust to pose and lighting than Haar; needs the ONNX model
+    (face_detection_yunet_2023mar.onnx from the OpenCV model zoo) in backend/models/
+    """
+    
+    def __init__(self, model_path: str = DEFAULT_YUNET_MODEL, score_threshold: float = 0.8,
+                 nms_threshold: float = 0.3, top_k: int = 50):
+        if not os.path.exists(model_path):
+            raise ValueError(f"YuNet model not found: {model_path}")
+        
+        self.detector = cv2.FaceDetectorYN.create(model_path, "", (320, 320),
+                                                  score_threshold, nms_threshold, top_k)
+        self._input_size = (320, 320)
+    
+    def detect(self, image: np.ndarray) -> List[Box]:
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        
+        height, width = image.shape[:2]
+        if (width, height) != self._input_size:
+            self.detector.setInputSize((width, height))
+            self._input_size = (width, height)
+        
+        _, faces = self.detector.detect(image)
+        if faces is None:
+            return []
+        return [(int(f[0]), int(f[1]), int(f[2]), int(f[3])) for f in faces]
+
+
+DETECTORS = {
+    'haar': HaarFaceDetector,
+    'yunet': YuNetFaceDetector,
+}
+
+
+def create_face_detector(name: str = "haar", **options):
+    """Build a detector by name ('haar' or 'yunet')"""
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown face detector: {name} (choose from {', '.join(DETECTORS)})")
+    return DETECTORS[name](**options)
+
+
+def detect_scaled(detector, frame: np.ndarray, scale: float = 1.0) -> List[Box]:
+    """
+    Run a detector on a downscaled copy of the frame
+    Boxes are mapped back to full-frame coordinates
+    """
+    if scale >= 1.0:
+        return detector.detect(frame)
+    
+    small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+    inverse = 1.0 / scale
+    return [
+        (int(x * inverse), int(y * inverse), int(w * inverse), int(h * inverse))
+        for (x, y, w, h) in detector.detect(small)
+    ]
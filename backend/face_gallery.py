@@ -0,0 +1,448 @@
+"""
+Face Gallery for Smart Vision Clinic
+Keeps every patient embedding in one contiguous matrix for fast matching
+"""
+
+import os
+import numpy as np
+from collections.abc import Mapping
+from typing import Optional, Tuple, List, Iterator, Dict
+from embedding_store import EmbeddingStore, LEGACY_MODEL
+
+
+AGGREGATIONS = ('max', 'mean', 'centroid')
+
+# Compressed searches between dropping matrix pages that adds and lookups mapped in
+RELEASE_INTERVAL = 32
+
+
+class FaceGallery(Mapping):
+    """
+    L2-normalized float32 embedding matrix with a parallel patient-id list
+    Behaves like a read-only dict of patient_id -> embedding (mean of the patient's templates)
+    An optional ANN index (see ann_index.IVFIndex) narrows large searches, or
+    an optional EmbeddingCompressor shortlists rows from compact codes before
+    they are re-scored with the full vectors
+    
+    A patient holds up to max_templates rows (other sessions, lighting,
+    glasses...). A probe is scored against every row in one pass and the
+    scores are combined per patient by `aggregation`:
+      max      - best single template
+      mean     - average over the patient's templates
+      centroid - one normalized mean template per patient
+    
+    With a store_path the matrix is the memory-mapped EmbeddingStore itself,
+    so opening a gallery reads no rows until they are scored. Deleted and
+    evicted rows become zeroed tombstones, which never score above 0.
+    A gallery file only accepts embeddings of the model it was created for.
+    """
+    
+    def __init__(self, initial_capacity: int = 1024, index=None, store_path: Optional[str] = None,
+                 max_templates: int = 5, aggregation: str = "max", compressor=None,
+                 model: str = LEGACY_MODEL):
+        """Create an empty gallery; the dimension is fixed by the first add"""
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"Unknown aggregation: {aggregation} (expected one of {', '.join(AGGREGATIONS)})")
+        self.initial_capacity = initial_capacity
+        self.index = index
+        self.store_path = store_path
+        self.max_templates = max_templates
+        self.aggregation = aggregation
+        self.compressor = compressor
+        self.model = model
+        self.store: Optional[EmbeddingStore] = None
+        self.clear()
+        
+        if store_path and os.path.exists(store_path):
+            self.attach_store(EmbeddingStore(store_path))
+    
+    def clear(self):
+        """Drop every embedding from memory (a backing store file is kept)"""
+        if self.store is not None:
+            self.store.close()
+        self.store = None
+        self._matrix = None
+        self._size = 0
+        self.patient_ids: List[Optional[str]] = []
+        self._rows: Dict[str, List[int]] = {}
+        self._template_count = 0
+        
+        # Row -> patient slot (-1 for tombstones) and per-slot centroids, for mean/centroid scoring
+        self._owner = np.full(0, -1, dtype=np.int64)
+        self._slots: Dict[str, int] = {}
+        self._slot_ids: List[str] = []
+        self._centroids: Optional[np.ndarray] = None
+        self._stale_centroids = set()
+        
+        # Compressed codes of rows [0, _coded), encoded lazily in batches
+        self._codes: Optional[np.ndarray] = None
+        self._coded = 0
+        self._searches_since_release = 0
+        
+        if self.index is not None and self.index.is_trained:
+            self.index.clear_rows()
+    
+    def attach_store(self, store: EmbeddingStore):
+        """Use an opened store as the backing matrix"""
+        if store.model != self.model:
+            store.close()
+            raise ValueError(f"{store.path} holds {store.model} embeddings, not {self.model}")
+        self.clear()
+        self.store = store
+        self._sync_from_store(bulk=True)
+        
+        # Index every row in one batch rather than one product per row
+        if self.index is not None and self.index.is_trained:
+            self.index.clear_rows()
+            self.index.add_batch(self.live_rows(), self._matrix)
+    
+    def _sync_from_store(self, bulk: bool = False):
+        """Pick up rows committed to the store, by us or by another process"""
+        self.store.refresh()
+        self._matrix = self.store.rows
+        for patient_id in self.store.entries(self._size):
+            self._register_row(self._size, patient_id, index=not bulk)
+        # Tombstoning may have re-opened a store another process grew
+        self._matrix = self.store.rows
+    
+    def sync(self) -> bool:
+        """
+        Pick up rows another process appended to the store, and the rows it
+        deleted meanwhile; returns whether anything changed
+        Costs a stat and a header read when nothing did
+        """
+        if self.store is None:
+            return False
+        self.store.refresh()
+        if self.store.count == self._size:
+            return False
+        
+        deleted = (self._owner[:self._size] >= 0) & ~self.store.live_mask(self._size)
+        for row in np.flatnonzero(deleted):
+            patient_id = self.patient_ids[row]
+            rows = self._rows[patient_id]
+            rows.remove(row)
+            if not rows:
+                del self._rows[patient_id]
+            self._delete_row(int(row))
+            self._stale_centroids.add(patient_id)
+        self._sync_from_store()
+        return True
+    
+    def _register_row(self, row: int, patient_id: Optional[str], index: bool = True):
+        """Track a newly filled row as one more template of its patient"""
+        self._size = row + 1
+        self.patient_ids.append(patient_id)
+        if patient_id is None:
+            return
+        
+        self._rows.setdefault(patient_id, []).append(row)
+        self._template_count += 1
+        if row >= len(self._owner):
+            grown = np.full(max(2 * len(self._owner), self.initial_capacity, row + 1), -1, dtype=np.int64)
+            grown[:len(self._owner)] = self._owner
+            self._owner = grown
+        self._owner[row] = self._slot(patient_id)
+        self._stale_centroids.add(patient_id)
+        if index and self.index is not None:
+            self.index.add(row, self._matrix[row])
+    
+    def _slot(self, patient_id: str) -> int:
+        slot = self._slots.get(patient_id)
+        if slot is None:
+            slot = self._slots[patient_id] = len(self._slot_ids)
+            self._slot_ids.append(patient_id)
+        return slot
+    
+    @property
+    def dim(self) -> Optional[int]:
+        return None if self._matrix is None else self._matrix.shape[1]
+    
+    @property
+    def template_count(self) -> int:
+        """Live template rows across all patients"""
+        return self._template_count
+    
+    @property
+    def matrix(self) -> np.ndarray:
+        """View of the filled rows, tombstones included (no copy)"""
+        if self._matrix is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._matrix[:self._size]
+    
+    @property
+    def code_bytes(self) -> int:
+        """Memory held by the compressed codes (the matrix is kept as well)"""
+        return self._codes.nbytes if self._codes is not None else 0
+    
+    def live_rows(self) -> np.ndarray:
+        """Row numbers of every template that is not deleted"""
+        return np.flatnonzero(self._owner[:self._size] >= 0)
+    
+    def templates(self, patient_id: str) -> np.ndarray:
+        """A patient's template rows, oldest first (templates x dim)"""
+        return self._matrix[self._rows[patient_id]]
+    
+    @staticmethod
+    def normalize(embedding: np.ndarray) -> np.ndarray:
+        """Return embedding as a float32 unit vector (zero vectors stay zero)"""
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return vector
+        return vector / norm
+    
+    def _grow(self, dim: int):
+        """Make room for at least one more in-memory row, doubling the capacity"""
+        if self._matrix is None:
+            self._matrix = np.zeros((self.initial_capacity, dim), dtype=np.float32)
+            return
+        
+        if self._size < self._matrix.shape[0]:
+            return
+        
+        grown = np.zeros((self._matrix.shape[0] * 2, dim), dtype=np.float32)
+        grown[:self._size] = self._matrix[:self._size]
+        self._matrix = grown
+    
+    def add(self, patient_id: str, embedding: np.ndarray):
+        """Append a template for a patient, evicting one beyond max_templates"""
+        vector = self.normalize(embedding)
+        if self.dim is not None and vector.shape[0] != self.dim:
+            raise ValueError(f"Embedding has {vector.shape[0]} dimensions, gallery expects {self.dim}")
+        
+        if self.store_path:
+            if self.store is None:
+                self.attach_store(EmbeddingStore.create(self.store_path, vector.shape[0], self.initial_capacity,
+                                                        model=self.model))
+            self.store.append(patient_id, vector)
+            self._sync_from_store()
+        else:
+            self._grow(vector.shape[0])
+            self._matrix[self._size] = vector
+            self._register_row(self._size, patient_id)
+        self._enforce_cap(patient_id)
+    
+    def add_batch(self, patient_ids: List[str], embeddings: np.ndarray):
+        """Append many templates at once (one store commit when file-backed)"""
+        if not patient_ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(patient_ids), -1)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        if self.dim is not None and vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding has {vectors.shape[1]} dimensions, gallery expects {self.dim}")
+        
+        if self.store_path:
+            if self.store is None:
+                capacity = max(self.initial_capacity, len(patient_ids))
+                self.attach_store(EmbeddingStore.create(self.store_path, vectors.shape[1], capacity,
+                                                        model=self.model))
+            self.store.append_batch(patient_ids, vectors)
+            self._sync_from_store()
+        else:
+            for patient_id, vector in zip(patient_ids, vectors):
+                self._grow(vector.shape[0])
+                self._matrix[self._size] = vector
+                self._register_row(self._size, patient_id)
+        for patient_id in set(patient_ids):
+            self._enforce_cap(patient_id)
+    
+    def _enforce_cap(self, patient_id: str):
+        """
+        Evict templates beyond max_templates, most redundant first (the one
+        closest to the patient's other templates), so the kept set stays varied
+        """
+        rows = self._rows.get(patient_id, [])
+        while self.max_templates and len(rows) > self.max_templates:
+            templates = self._matrix[rows]
+            similarity = templates @ templates.T
+            redundancy = similarity.sum(axis=1) - np.diag(similarity)
+            self._delete_row(rows.pop(int(np.argmax(redundancy))))
+            self._stale_centroids.add(patient_id)
+    
+    def _delete_row(self, row: int):
+        self.patient_ids[row] = None
+        self._owner[row] = -1
+        self._template_count -= 1
+        if row < self._coded:
+            self._codes[row] = 0
+        if self.index is not None:
+            self.index.remove(row)
+        if self.store is not None:
+            self.store.delete(row)
+        else:
+            self._matrix[row] = 0
+    
+    def remove(self, patient_id: str) -> bool:
+        """Tombstone all of a patient's templates"""
+        rows = self._rows.pop(patient_id, None)
+        if rows is None:
+            return False
+        for row in rows:
+            self._delete_row(row)
+        self._stale_centroids.add(patient_id)
+        return True
+    
+    def scores(self, embedding: np.ndarray) -> np.ndarray:
+        """Cosine similarity of the probe against every row (0 for tombstones)"""
+        if self._size == 0:
+            return np.empty(0, dtype=np.float32)
+        return self.matrix @ self.normalize(embedding)
+    
+    @property
+    def codes_ready(self) -> bool:
+        """Whether set_codes has installed codes to shortlist from"""
+        return self._codes is not None
+    
+    def encode_rows(self, compressor, end: Optional[int] = None, batch_size: int = 8192) -> np.ndarray:
+        """
+        Codes of rows [0, end) under a fitted compressor, tombstones zeroed
+        Reads every row, so large galleries do this off the request path
+        """
+        end = self._size if end is None else end
+        codes = np.zeros((end, compressor.components.shape[1]), dtype=np.dtype(compressor.dtype))
+        for start in range(0, end, batch_size):
+            stop = min(start + batch_size, end)
+            codes[start:stop] = compressor.encode(self._matrix[start:stop])
+        codes[self._owner[:end] < 0] = 0
+        return codes
+    
+    def set_codes(self, compressor, codes: np.ndarray):
+        """
+        Shortlist from these codes of the first rows (see encode_rows) from now on
+        Rows added since they were encoded are encoded on the next search
+        """
+        coded = codes.shape[0]
+        if coded > self._size:
+            raise ValueError(f"Codes for {coded} rows, gallery has {self._size}")
+        # Rows deleted while the codes were being encoded
+        codes[self._owner[:coded] < 0] = 0
+        self.compressor = compressor
+        self._codes = codes
+        self._coded = coded
+        # Encoding read every row; from now on only re-ranked rows need to be mapped in
+        self.release_matrix()
+    
+    def release_matrix(self):
+        """Drop file-backed matrix pages from memory (no-op for in-memory galleries)"""
+        self._searches_since_release = 0
+        if self.store is not None:
+            self.store.release_rows(0, self._size)
+    
+    def codes(self) -> Optional[np.ndarray]:
+        """Compressed codes of the filled rows (None until set_codes)"""
+        if self._codes is None or self.compressor is None:
+            return None
+        
+        if self._codes.shape[0] < self._size:
+            grown = np.zeros((max(2 * self._codes.shape[0], self._size), self._codes.shape[1]),
+                             dtype=self._codes.dtype)
+            grown[:self._coded] = self._codes[:self._coded]
+            self._codes = grown
+        
+        # Only rows added since the last search, a few at a time
+        if self._coded < self._size:
+            start, end = self._coded, self._size
+            self._codes[start:end] = self.compressor.encode(self._matrix[start:end])
+            self._codes[start:end][self._owner[start:end] < 0] = 0
+            self._coded = end
+        return self._codes[:self._size]
+    
+    def _candidate_rows(self, probe: np.ndarray) -> Optional[np.ndarray]:
+        """Rows worth scoring exactly: ANN cells or the compressed shortlist (None means all)"""
+        if self.index is not None and self.index.should_search(self._template_count):
+            rows = self.index.candidates(probe)
+        else:
+            codes = self.codes()
+            if codes is None:
+                return None
+            # Keep the float32 matrix out of memory; re-ranking reads rows from the file
+            self._searches_since_release += 1
+            if self._searches_since_release >= RELEASE_INTERVAL:
+                self.release_matrix()
+            rows = self.compressor.shortlist(codes, probe)
+        
+        if self.aggregation == 'mean' and rows.size:
+            # Average over all templates of the candidate patients, not only the candidate rows
+            slots = np.unique(self._owner[rows])
+            return np.flatnonzero(np.isin(self._owner[:self._size], slots[slots >= 0]))
+        # Sorted rows read the memory-mapped matrix front to back
+        return np.sort(rows)
+    
+    def _candidate_matrix(self, rows: np.ndarray) -> np.ndarray:
+        """Candidate rows to re-score; read from the file once the gallery shortlists from codes"""
+        if self.store is not None and self._codes is not None:
+            return self.store.read_rows(rows)
+        return self._matrix[rows]
+    
+    def centroids(self) -> np.ndarray:
+        """Normalized mean template per patient slot, recomputed only for changed patients"""
+        slots = len(self._slot_ids)
+        if self._centroids is None or self._centroids.shape[0] < slots:
+            grown = np.zeros((max(self.initial_capacity, 2 * slots), self.dim), dtype=np.float32)
+            if self._centroids is not None:
+                grown[:self._centroids.shape[0]] = self._centroids
+            self._centroids = grown
+        
+        for patient_id in self._stale_centroids:
+            rows = self._rows.get(patient_id)
+            self._centroids[self._slots[patient_id]] = self.normalize(self._matrix[rows].mean(axis=0)) if rows else 0
+        self._stale_centroids.clear()
+        return self._centroids[:slots]
+    
+    def best_match(self, embedding: np.ndarray, threshold: float = 0.6) -> Optional[Tuple[str, float]]:
+        """
+        Score the probe against all templates with one matrix-vector product
+        (or only the ANN candidates / compressed shortlist once the gallery is large enough)
+        Returns (patient_id, similarity) of the best match at or above threshold
+        """
+        if not self._rows:
+            return None
+        
+        probe = self.normalize(embedding)
+        if self.aggregation == 'centroid':
+            # Removed patients keep a zero centroid, which never passes the threshold
+            scores = self.centroids() @ probe
+            best = int(np.argmax(scores))
+            patient_id, similarity = self._slot_ids[best], float(scores[best])
+        else:
+            rows = self._candidate_rows(probe)
+            if rows is None:
+                rows = np.arange(self._size)
+                scores = self.matrix @ probe
+            elif rows.size == 0:
+                return None
+            else:
+                scores = self._candidate_matrix(rows) @ probe
+            
+            if self.aggregation == 'max':
+                best = int(rows[np.argmax(scores)])
+                patient_id, similarity = self.patient_ids[best], float(scores.max())
+            else:
+                owners = self._owner[rows]
+                live = owners >= 0
+                counts = np.bincount(owners[live], minlength=len(self._slot_ids))
+                sums = np.bincount(owners[live], weights=scores[live], minlength=len(self._slot_ids))
+                means = np.where(counts > 0, sums / np.maximum(counts, 1), -1.0)
+                best = int(np.argmax(means))
+                patient_id, similarity = self._slot_ids[best], float(means[best])
+        
+        if patient_id is None or similarity <= 0.0 or similarity < threshold:
+            return None
+        return (patient_id, similarity)
+    
+    def __getitem__(self, patient_id: str) -> np.ndarray:
+        rows = self._rows[patient_id]
+        if len(rows) == 1:
+            return self._matrix[rows[0]]
+        return self.normalize(self._matrix[rows].mean(axis=0))
+    
+    def __contains__(self, patient_id) -> bool:
+        return patient_id in self._rows
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._rows))
+    
+    def __len__(self) -> int:
+        return len(self._rows)
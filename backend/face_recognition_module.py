@@ -1,38 +1,242 @@
 """
 Face Recognition Module for Smart Vision Clinic
 Uses DeepFace for face recognition and encoding
+DeepFace (and TensorFlow with it) is imported on the first embedding, not at import time
 """
 
 import cv2
 import numpy as np
 import os
-from deepface import DeepFace
-from typing import Optional, Tuple, List, Dict
-import pickle
+import copy
+import time
+import threading
+from typing import Optional, Tuple, List, Dict, Union
+from face_gallery import FaceGallery
+from embedding_store import EmbeddingStore, LEGACY_MODEL
+from face_detectors import Box, HaarFaceDetector, create_face_detector, detect_scaled
+from ann_index import IVFIndex
+from embedding_compression import EmbeddingCompressor, create_compressor
+from onnx_embedder import OnnxEmbedder
+from metrics import MetricsRegistry, REGISTRY, resident_memory_bytes
+
+
+# Per-deployment defaults; every entry point (worker, CLI scripts, clinic app) reads them
+DEFAULT_MODEL = os.environ.get("FACE_MODEL", "VGG-Face")
+DEFAULT_DETECTOR_BACKEND = os.environ.get("FACE_DETECTOR_BACKEND", "opencv")
+DEFAULT_ONNX_MODEL = os.environ.get("FACE_ONNX_MODEL")
+DEFAULT_INFERENCE_THREADS = int(os.environ.get("FACE_INFERENCE_THREADS", "0")) or None
+DEFAULT_MATCH_THRESHOLD = float(os.environ.get("FACE_MATCH_THRESHOLD", "0")) or None
+DEFAULT_COMPRESSION = os.environ.get("FACE_COMPRESSION")
+
+# Cosine similarity a probe needs to match, per model: 1 - DeepFace's cosine
+# distance threshold (VGG-Face keeps the 0.6 it was tuned to here). Scores of
+# different models are not comparable; the best threshold reported by
+# benchmarks/model_benchmark.py on your own photos is the value to configure.
+MATCH_THRESHOLDS = {
+    'VGG-Face': 0.6,
+    'Facenet': 0.6,
+    'Facenet512': 0.7,
+    'ArcFace': 0.32,
+    'SFace': 0.407,
+    'GhostFaceNet': 0.35,
+    'OpenFace': 0.9,
+    'DeepFace': 0.77,
+    'DeepID': 0.985,
+    'Dlib': 0.93,
+}
+
+# Auto-enroll and near-duplicate cut-offs sit at these fractions of the way from
+# the match threshold to 1.0 (0.85 and 0.95 for VGG-Face's 0.6)
+AUTO_ENROLL_MARGIN = 0.625
+DUPLICATE_MARGIN = 0.875
+
+
+def match_threshold(model_name: Optional[str] = None) -> float:
+    """Similarity needed for a match: $FACE_MATCH_THRESHOLD, else the model's default"""
+    if DEFAULT_MATCH_THRESHOLD is not None:
+        return DEFAULT_MATCH_THRESHOLD
+    return MATCH_THRESHOLDS.get(model_name or DEFAULT_MODEL, MATCH_THRESHOLDS[LEGACY_MODEL])
+
+
+def load_deepface():
+    """The DeepFace class, importing deepface/TensorFlow on first use (seconds, not milliseconds)"""
+    from deepface import DeepFace
+    return DeepFace
 
 
 class FaceRecognitionSystem:
     """Handles face recognition and encoding operations"""
     
-    def __init__(self, encodings_dir: str = "face_encodings"):
-        """Initialize face recognition system"""
+    def __init__(self, encodings_dir: str = "face_encodings",
+                 ann_index: Optional[IVFIndex] = None, use_ann_index: bool = True,
+                 detector="haar", detection_scale: float = 1.0,
+                 max_templates: int = 5, aggregation: str = "max", threshold: Optional[float] = None,
+                 auto_enroll: bool = False, auto_enroll_threshold: Optional[float] = None,
+                 auto_enroll_interval: float = 3600.0, duplicate_threshold: Optional[float] = None,
+                 compressor: Union[EmbeddingCompressor, str, None] = None,
+                 model_name: Optional[str] = None, detector_backend: Optional[str] = None,
+                 onnx_model: Optional[str] = None, inference_threads: Optional[int] = None,
+                 metrics: Optional[MetricsRegistry] = None):
+        """
+        Initialize face recognition system
+        ann_index: approximate index for large galleries (default IVFIndex(),
+        or none when a compressor is configured); small galleries are always
+        searched exactly. It is trained on a
+        background thread (see build_index); matches use exact search, or the
+        previous index, until the new one is swapped in
+        detector: 'haar', 'yunet' or a detector object with detect(image)
+        detection_scale: run detection on a frame resized by this factor
+        max_templates / aggregation: templates kept per patient and how their
+        scores combine ('max', 'mean' or 'centroid', see FaceGallery)
+        threshold: similarity a match needs (default match_threshold(model_name):
+        $FACE_MATCH_THRESHOLD or the model's entry in MATCH_THRESHOLDS)
+        auto_enroll: add live matches at or above auto_enroll_threshold as new
+        templates, at most once per auto_enroll_interval seconds per patient,
+        unless they are within duplicate_threshold of an existing template.
+        Both thresholds default to fixed fractions of the way from threshold to
+        1.0; giving auto_enroll_threshold also turns auto-enroll on
+        compressor: projection/quantization used to shortlist rows before exact
+        re-ranking, as an EmbeddingCompressor or a spec such as 'pca:256:int8'
+        (default $FACE_COMPRESSION; 'none' turns it off). Like the ANN index it
+        is fitted and the gallery encoded on a background thread once the
+        gallery is large enough; the projection is saved next to the gallery
+        model_name: DeepFace embedding model ('VGG-Face', 'Facenet512', 'ArcFace',
+        'SFace', ...; default $FACE_MODEL or VGG-Face). Each model has its own
+        gallery file, so embeddings of different models never mix
+        detector_backend: DeepFace detector for whole images when there is no
+        local `detector` (default $FACE_DETECTOR_BACKEND or opencv); crops
+        from `detector` skip it
+        onnx_model: exported ONNX file of model_name (default $FACE_ONNX_MODEL),
+        run with ONNX Runtime or OpenCV DNN instead of DeepFace/TensorFlow;
+        DeepFace is still used if it cannot be loaded or fails
+        inference_threads: intra-op threads for the ONNX engine ($FACE_INFERENCE_THREADS)
+        metrics: registry for stage timings, recognition counts and gallery gauges
+        (the process-wide metrics.REGISTRY by default)
+        """
+        self.metrics = metrics if metrics is not None else REGISTRY
+        self._stage_timers = {
+            stage: self.metrics.histogram("face_stage_seconds", "Face recognition stage latency", stage=stage)
+            for stage in ('detect', 'embed', 'match')
+        }
+        self._results = {
+            result: self.metrics.counter("face_recognitions_total",
+                                         "Recognition attempts by outcome", result=result)
+            for result in ('match', 'miss', 'no_face')
+        }
         self.encodings_dir = encodings_dir
         os.makedirs(self.encodings_dir, exist_ok=True)
+        self.model_name = model_name or DEFAULT_MODEL
+        self.detector_backend = detector_backend or DEFAULT_DETECTOR_BACKEND
+        
+        # Face detector is loaded once and reused for every frame
+        self.detection_scale = detection_scale
+        self.detector_name = detector if isinstance(detector, str) else None
+        self.detector = self._load_detector(detector)
+        self._batch_embeddings = True
+        self.embedder = self._load_embedder(onnx_model or DEFAULT_ONNX_MODEL,
+                                            inference_threads or DEFAULT_INFERENCE_THREADS)
+        
+        if compressor is None:
+            compressor = DEFAULT_COMPRESSION
+        if isinstance(compressor, str):
+            compressor = create_compressor(compressor)
         
-        # Store loaded encodings in memory for faster lookup
-        self.patient_encodings = {}
+        # The compressed shortlist and the ANN index are alternative ways to narrow a search
+        if use_ann_index and ann_index is None and compressor is None:
+            ann_index = IVFIndex()
+        self.ann_index = ann_index if use_ann_index else None
+        self.ann_index_path = self._model_file("ann_index", ".npz")
+        self._unsaved_index_changes = 0
+        self._index_thread: Optional[threading.Thread] = None
+        self._trained_index: Optional[IVFIndex] = None
+        self._compressor_thread: Optional[threading.Thread] = None
+        self._fitted_compressor: Optional[Tuple[EmbeddingCompressor, np.ndarray]] = None
+        
+        # All encodings live in one memory-mapped gallery file
+        self.store_path = self._model_file("gallery", ".bin")
+        self.compressor = compressor
+        self.compressor_path = self._model_file("projection", ".npz")
+        if compressor is not None:
+            self.load_compressor()
+        self.gallery = FaceGallery(index=self.ann_index, store_path=self.store_path,
+                                   max_templates=max_templates, aggregation=aggregation,
+                                   compressor=self.compressor, model=self.model_name)
+        self.patient_encodings = self.gallery
         self.load_all_encodings()
+        self.load_index()
+        
+        self.threshold = threshold if threshold is not None else match_threshold(self.model_name)
+        if auto_enroll and auto_enroll_threshold is None:
+            auto_enroll_threshold = self.threshold + AUTO_ENROLL_MARGIN * (1 - self.threshold)
+        self.auto_enroll_threshold = auto_enroll_threshold
+        self.auto_enroll_interval = auto_enroll_interval
+        if duplicate_threshold is None:
+            duplicate_threshold = self.threshold + DUPLICATE_MARGIN * (1 - self.threshold)
+        self.duplicate_threshold = duplicate_threshold
+        self._last_enrolled: Dict[str, float] = {}
+        self._enroll_lock = threading.Lock()
+        self.auto_enrolled = 0
+        
+        self.metrics.gauge("face_gallery_patients", "Patients in the gallery", fn=lambda: len(self.gallery))
+        self.metrics.gauge("face_gallery_templates", "Live face templates in the gallery",
+                           fn=lambda: self.gallery.template_count)
+        self.metrics.gauge("face_gallery_bytes", "Size of the gallery embedding matrix",
+                           fn=lambda: self.gallery.matrix.nbytes)
+        self.metrics.gauge("face_gallery_code_bytes", "Size of the compressed gallery codes",
+                           fn=lambda: self.gallery.code_bytes)
+        self.metrics.gauge("process_resident_memory_bytes", "Resident memory of this process",
+                           fn=resident_memory_bytes)
+    
+    def _model_file(self, name: str, extension: str) -> str:
+        """Path of a per-model file; VGG-Face keeps the original names"""
+        if self.model_name != LEGACY_MODEL:
+            name += "_" + "".join(c if c.isalnum() else "-" for c in self.model_name.lower())
+        return os.path.join(self.encodings_dir, name + extension)
     
-    def extract_face_embedding(self, image_path: str) -> Optional[np.ndarray]:
+    @staticmethod
+    def decode_image(image: Union[str, bytes, np.ndarray]) -> Union[str, np.ndarray]:
+        """
+        Normalize an image argument for DeepFace
+        Paths and BGR arrays pass through; encoded bytes (JPEG/PNG) are decoded in memory
+        """
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            decoded = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if decoded is None:
+                raise ValueError("Could not decode image bytes")
+            return decoded
+        return image
+    
+    def _load_embedder(self, onnx_model: Optional[str], threads: Optional[int]) -> Optional[OnnxEmbedder]:
+        """ONNX engine for the configured model, or None to use DeepFace"""
+        if not onnx_model:
+            return None
+        try:
+            return OnnxEmbedder(onnx_model, self.model_name, threads=threads)
+        except Exception as e:
+            print(f"Error loading ONNX model, using DeepFace: {e}")
+            return None
+    
+    def extract_face_embedding(self, image: Union[str, bytes, np.ndarray]) -> Optional[np.ndarray]:
         """
         Extract face embedding from an image
+        image: file path, BGR frame or encoded image bytes
+        The largest face is cropped by the local detector and embedded the same
+        way as faces in live frames, so enrolled templates and live probes share
+        preprocessing; without a local detector DeepFace finds the face itself
         Returns the embedding vector or None if no face found
         """
+        if self.detector is not None:
+            return self.extract_image_embeddings([image])[0]
+        with self._stage_timers['embed'].time():
+            return self._represent_image(image)
+    
+    def _represent_image(self, image: Union[str, bytes, np.ndarray]) -> Optional[np.ndarray]:
         try:
             # Use DeepFace to get embedding
-            embedding = DeepFace.represent(
-                img_path=image_path,
-                model_name="VGG-Face",  # Using VGG-Face for embeddings
+            embedding = load_deepface().represent(
+                img_path=self.decode_image(image),
+                model_name=self.model_name,
+                detector_backend=self.detector_backend,
                 enforce_detection=False  # Don't fail if face detection is uncertain
             )
             
@@ -43,45 +247,345 @@ class FaceRecognitionSystem:
             print(f"Error extracting face embedding: {e}")
             return None
     
-    def save_encoding(self, patient_id: str, embedding: np.ndarray) -> bool:
-        """Save face encoding to file"""
+    @staticmethod
+    def crop_faces(frame: np.ndarray, boxes: List[Box], margin: float = 0.2) -> List[np.ndarray]:
+        """
+        Square crops centred on each detection box
+        margin: extra context around the box, as a fraction of its size
+        """
+        height, width = frame.shape[:2]
+        crops = []
+        for (x, y, w, h) in boxes:
+            side = int(max(w, h) * (1 + margin))
+            cx, cy = x + w // 2, y + h // 2
+            # Slide the square inside the frame rather than cutting it short
+            x1 = min(max(cx - side // 2, 0), max(width - side, 0))
+            y1 = min(max(cy - side // 2, 0), max(height - side, 0))
+            x2, y2 = min(x1 + side, width), min(y1 + side, height)
+            crops.append(frame[y1:y2, x1:x2])
+        return crops
+    
+    def _represent_crop(self, face: np.ndarray) -> Optional[np.ndarray]:
         try:
-            encoding_path = os.path.join(self.encodings_dir, f"{patient_id}.pkl")
-            with open(encoding_path, 'wb') as f:
-                pickle.dump(embedding, f)
-            
-            # Also store in memory
-            self.patient_encodings[patient_id] = embedding
+            embedding = load_deepface().represent(
+                img_path=face,
+                model_name=self.model_name,
+                enforce_detection=False,
+                detector_backend="skip"  # Already cropped by our detector
+            )
+            if embedding:
+                return np.array(embedding[0]['embedding'])
+            return None
+        except Exception as e:
+            print(f"Error extracting face embedding: {e}")
+            return None
+    
+    def extract_face_embeddings(self, faces: List[np.ndarray]) -> List[Optional[np.ndarray]]:
+        """
+        Embed already-cropped faces, skipping DeepFace's own face detection
+        Several faces go to the model as one batch when DeepFace supports list input
+        Returns one embedding (or None) per face
+        """
+        # One observation per face of the batch's time split evenly, so 'embed'
+        # is per-face latency whether faces came one at a time or in a batch
+        start = time.perf_counter()
+        try:
+            return self._extract_face_embeddings(faces)
+        finally:
+            per_face = (time.perf_counter() - start) / max(len(faces), 1)
+            for _ in faces:
+                self._stage_timers['embed'].observe(per_face)
+    
+    def _extract_face_embeddings(self, faces: List[np.ndarray]) -> List[Optional[np.ndarray]]:
+        if self.embedder is not None and faces:
+            try:
+                return list(self.embedder.embed(faces))
+            except Exception as e:
+                print(f"Error embedding faces with ONNX, using DeepFace: {e}")
+        
+        if len(faces) > 1 and self._batch_embeddings:
+            try:
+                batch = load_deepface().represent(
+                    img_path=list(faces),
+                    model_name=self.model_name,
+                    enforce_detection=False,
+                    detector_backend="skip"
+                )
+                if len(batch) == len(faces) and all(isinstance(result, list) for result in batch):
+                    return [np.array(result[0]['embedding']) if result else None for result in batch]
+            except Exception:
+                pass
+            # Older DeepFace releases only take one image per call
+            self._batch_embeddings = False
+        
+        return [self._represent_crop(face) for face in faces]
+    
+    def _largest_face(self, image: np.ndarray) -> np.ndarray:
+        """Crop of the biggest detected face (the whole image if none is found)"""
+        boxes = self.detect_faces_in_frame(image)
+        if not boxes:
+            return image
+        largest = max(boxes, key=lambda box: box[2] * box[3])
+        return self.crop_faces(image, [largest])[0]
+    
+    def extract_image_embeddings(self, images: List[Union[str, bytes, np.ndarray]],
+                                 batch_size: int = 32) -> List[Optional[np.ndarray]]:
+        """
+        Embed one face per image for enrollment
+        Faces are cropped with the local detector and run through the model
+        batch_size at a time; unreadable images give None
+        """
+        faces = []
+        readable = []
+        for i, image in enumerate(images):
+            try:
+                decoded = self.decode_image(image)
+                if isinstance(decoded, str):
+                    decoded = cv2.imread(decoded)
+                if decoded is None:
+                    raise ValueError("Could not read image")
+                faces.append(self._largest_face(decoded))
+                readable.append(i)
+            except Exception as e:
+                print(f"Error reading image {image if isinstance(image, str) else i}: {e}")
+        
+        embeddings: List[Optional[np.ndarray]] = [None] * len(images)
+        for start in range(0, len(faces), batch_size):
+            batch = self.extract_face_embeddings(faces[start:start + batch_size])
+            for i, embedding in zip(readable[start:start + batch_size], batch):
+                embeddings[i] = embedding
+        return embeddings
+    
+    def warm_up(self):
+        """Load the embedding model now instead of on the first request"""
+        if self.embedder is not None:
+            try:
+                height, width = self.embedder.input_size
+                self.embedder.embed([np.zeros((height, width, 3), dtype=np.uint8)])
+                return
+            except Exception as e:
+                print(f"Error running ONNX model: {e}")
+        try:
+            load_deepface().build_model(self.model_name)
+        except Exception as e:
+            print(f"Error loading face model: {e}")
+    
+    def save_encoding(self, patient_id: str, embedding: np.ndarray, replace: bool = False) -> bool:
+        """
+        Add a face template for a patient to the gallery file
+        replace: drop the patient's earlier templates first
+        """
+        try:
+            if replace:
+                self.gallery.remove(patient_id)
+            self.gallery.add(patient_id, embedding)
+            self._index_changed()
             return True
         except Exception as e:
             print(f"Error saving encoding: {e}")
             return False
     
-    def load_encoding(self, patient_id: str) -> Optional[np.ndarray]:
-        """Load face encoding from file"""
-        try:
-            encoding_path = os.path.join(self.encodings_dir, f"{patient_id}.pkl")
-            if os.path.exists(encoding_path):
-                with open(encoding_path, 'rb') as f:
-                    embedding = pickle.load(f)
-                    self.patient_encodings[patient_id] = embedding
-                    return embedding
-            return None
+    def save_encodings(self, patient_ids: List[str], embeddings: List[np.ndarray]) -> bool:
+        """Save many face encodings with a single gallery commit"""
+        if not patient_ids:
+            return True
+        try:
+            self.gallery.add_batch(patient_ids, np.stack(embeddings))
+            self._unsaved_index_changes += len(patient_ids) - 1
+            self._index_changed()
+            return True
         except Exception as e:
-            print(f"Error loading encoding: {e}")
-            return None
+            print(f"Error saving encodings: {e}")
+            return False
+    
+    def delete_encoding(self, patient_id: str) -> bool:
+        """Tombstone all of a patient's face templates"""
+        try:
+            if not self.gallery.remove(patient_id):
+                return False
+            self._index_changed()
+            return True
+        except Exception as e:
+            print(f"Error deleting encoding: {e}")
+            return False
+    
+    def load_encoding(self, patient_id: str) -> Optional[np.ndarray]:
+        """Get a patient's (normalized) face encoding: the mean of their templates"""
+        return self.gallery.get(patient_id)
     
     def load_all_encodings(self):
-        """Load all encodings from the encodings directory"""
+        """Open the gallery file, migrating legacy .pkl encodings on first run"""
         try:
-            if os.path.exists(self.encodings_dir):
-                for filename in os.listdir(self.encodings_dir):
-                    if filename.endswith('.pkl'):
-                        patient_id = filename[:-4]  # Remove .pkl extension
-                        self.load_encoding(patient_id)
+            if self.gallery.store is not None:
+                return
+            if os.path.exists(self.store_path):
+                self.gallery.attach_store(EmbeddingStore(self.store_path))
+            elif self.model_name == LEGACY_MODEL:
+                # Pickled encodings predate model selection and are all VGG-Face
+                store = EmbeddingStore.migrate_pickles(self.encodings_dir, self.store_path,
+                                                       FaceGallery.normalize)
+                if store is not None:
+                    self.gallery.attach_store(store)
         except Exception as e:
             print(f"Error loading all encodings: {e}")
     
+    def sync_encodings(self) -> bool:
+        """
+        Pick up templates other processes (the one-off scripts) wrote to the
+        gallery file since it was loaded; returns whether anything changed
+        A delete without a later write is only seen by reload_encodings
+        """
+        if self.gallery.store is None:
+            if not os.path.exists(self.store_path):
+                return False
+            self.reload_encodings()
+            return True
+        if not self.gallery.sync():
+            return False
+        self._index_changed()
+        return True
+    
+    def reload_encodings(self):
+        """Rebuild the gallery from disk to pick up changes from other processes"""
+        self.gallery.clear()
+        self.load_all_encodings()
+        self.load_index()
+    
+    def load_index(self):
+        """Restore the saved ANN index onto the loaded gallery"""
+        if self.ann_index is None:
+            return
+        try:
+            self.ann_index.load(self.ann_index_path, self.gallery.patient_ids,
+                                self.gallery.live_rows(), self.gallery.matrix)
+        except Exception as e:
+            print(f"Error loading ANN index: {e}")
+    
+    def save_index(self):
+        """Persist the ANN index next to the encodings"""
+        if self.ann_index is None or not self.ann_index.is_trained:
+            return
+        try:
+            self.ann_index.save(self.ann_index_path, self.gallery.patient_ids)
+            self._unsaved_index_changes = 0
+        except Exception as e:
+            print(f"Error saving ANN index: {e}")
+    
+    def load_compressor(self):
+        """Restore the saved gallery projection, unless it was fitted with other settings"""
+        saved = copy.copy(self.compressor)
+        try:
+            if not saved.load(self.compressor_path):
+                return
+        except Exception as e:
+            print(f"Error loading gallery projection: {e}")
+            return
+        if saved.spec != self.compressor.spec:
+            print(f"Ignoring saved {saved.spec} gallery projection; fitting {self.compressor.spec}")
+            return
+        self.compressor = saved
+    
+    def _ensure_compressor(self):
+        """
+        Swap in freshly encoded gallery codes, or start fitting and encoding in
+        the background once the gallery is large enough (or outgrew the fit);
+        a saved projection only needs the encoding
+        """
+        if self.compressor is None:
+            return
+        self._swap_compressor()
+        if self._compressor_thread is not None:
+            return
+        if (self.compressor.needs_fitting(self.gallery.template_count)
+                or (self.compressor.is_fitted and not self.gallery.codes_ready)):
+            self._compressor_thread = threading.Thread(target=self._fit_compressor, daemon=True)
+            self._compressor_thread.start()
+    
+    def _fit_compressor(self):
+        """Fit a copy of the projection and encode the current rows with it (runs off the request path)"""
+        try:
+            compressor = copy.copy(self.compressor)
+            rows = self.gallery.live_rows()
+            matrix = self.gallery.matrix
+            if compressor.needs_fitting(len(rows)):
+                print(f"Fitting {compressor.method} projection on {len(rows)} templates...")
+                compressor.fit(matrix, rows)
+                compressor.save(self.compressor_path)
+            self._fitted_compressor = (compressor, self.gallery.encode_rows(compressor, len(matrix)))
+        except Exception as e:
+            # _compressor_thread stays set, so a failing fit is not retried on every match
+            print(f"Error fitting gallery projection: {e}")
+    
+    def _swap_compressor(self):
+        """Shortlist with the projection fitted in the background, if it is ready"""
+        fitted = self._fitted_compressor
+        if fitted is None:
+            return
+        compressor, codes = fitted
+        self._fitted_compressor = None
+        self._compressor_thread = None
+        try:
+            self.gallery.set_codes(compressor, codes)
+            self.compressor = compressor
+        except ValueError as e:
+            # The gallery was reloaded smaller meanwhile; the next match starts over
+            print(f"Discarding gallery codes: {e}")
+    
+    def _index_changed(self):
+        # Unsaved assignments are recomputed on load, so save in batches
+        self._unsaved_index_changes += 1
+        if self._unsaved_index_changes >= 256:
+            self.save_index()
+    
+    def _ensure_index(self):
+        """
+        Swap in a freshly trained ANN index, or start training one in the
+        background once the gallery outgrows exact search (or the current index)
+        """
+        if self.ann_index is None:
+            return
+        self._swap_index()
+        if self._index_thread is None and self.ann_index.needs_training(self.gallery.template_count):
+            self._index_thread = threading.Thread(target=self._train_index, daemon=True)
+            self._index_thread.start()
+    
+    def _train_index(self):
+        """Train a copy of the ANN index on the current rows (runs off the request path)"""
+        try:
+            print(f"Building ANN index for {self.gallery.template_count} templates...")
+            index = copy.copy(self.ann_index)
+            index.train(self.gallery.matrix, self.gallery.live_rows())
+            index.save(self.ann_index_path, self.gallery.patient_ids)
+            self._trained_index = index
+        except Exception as e:
+            # _index_thread stays set, so a failing build is not retried on every match
+            print(f"Error building ANN index: {e}")
+    
+    def _swap_index(self):
+        """Replace the ANN index with the one trained in the background, if it is ready"""
+        index = self._trained_index
+        if index is None:
+            return
+        # Rows added or deleted while the index was training
+        index.sync_rows(self.gallery.live_rows(), self.gallery.matrix)
+        self.ann_index = self.gallery.index = index
+        self._trained_index = None
+        self._index_thread = None
+    
+    def build_index(self):
+        """
+        Train the ANN index, or fit and encode the compressed codes, now if the
+        gallery needs it, waiting for it
+        For bulk enrollment and other offline jobs; matches never wait for training
+        """
+        self._ensure_index()
+        self._ensure_compressor()
+        for thread in (self._index_thread, self._compressor_thread):
+            if thread is not None:
+                thread.join()
+        self._swap_index()
+        self._swap_compressor()
+    
     def cosine_similarity(self, vec1: np.ndarray, vec2: np.ndarray) -> float:
         """Calculate cosine similarity between two vectors"""
         vec1_norm = np.linalg.norm(vec1)
@@ -92,71 +596,150 @@ class FaceRecognitionSystem:
         
         return np.dot(vec1, vec2) / (vec1_norm * vec2_norm)
     
-    def find_matching_patient(self, test_embedding: np.ndarray, threshold: float = 0.6) -> Optional[str]:
+    def match_patient(self, test_embedding: np.ndarray,
+                      threshold: Optional[float] = None) -> Optional[Tuple[str, float]]:
+        """
+        Find matching patient and its similarity in a single gallery pass
+        Returns (patient_id, similarity_score) if match found, None otherwise
+        threshold: similarity threshold (0-1), higher is stricter (default self.threshold)
+        """
+        self.sync_encodings()
+        self._ensure_index()
+        self._ensure_compressor()
+        if threshold is None:
+            threshold = self.threshold
+        with self._stage_timers['match'].time():
+            match = self.gallery.best_match(test_embedding, threshold)
+        self._results['match' if match else 'miss'].inc()
+        return match
+    
+    def count_no_face(self):
+        """Count a recognition attempt that found no face to match"""
+        self._results['no_face'].inc()
+    
+    def find_matching_patient(self, test_embedding: np.ndarray, threshold: Optional[float] = None) -> Optional[str]:
         """
         Find matching patient based on face embedding
         Returns patient_id if match found, None otherwise
-        threshold: similarity threshold (0-1), higher is stricter
+        threshold: similarity threshold (0-1), higher is stricter (default self.threshold)
         """
-        best_match = None
-        best_similarity = 0.0
-        
-        for patient_id, encoding in self.patient_encodings.items():
-            similarity = self.cosine_similarity(test_embedding, encoding)
-            
-            if similarity > best_similarity and similarity >= threshold:
-                best_similarity = similarity
-                best_match = patient_id
-        
-        return best_match
+        match = self.match_patient(test_embedding, threshold)
+        return match[0] if match else None
     
-    def recognize_face_from_frame(self, frame: np.ndarray) -> Optional[Tuple[str, float]]:
+    def recognize_faces(self, frame: np.ndarray, boxes: Optional[List[Box]] = None,
+                        threshold: Optional[float] = None) -> List[Tuple[Box, Optional[Tuple[str, float]]]]:
         """
-        Recognize face from a video frame
-        Returns (patient_id, similarity_score) or None
+        Identify every detected face in a frame
+        boxes: detections already made on this frame (detected here if omitted)
+        Returns (box, (patient_id, similarity_score) or None) for each box
         """
         try:
-            # Save frame temporarily for DeepFace processing
-            temp_path = os.path.join(self.encodings_dir, "temp_frame.jpg")
-            cv2.imwrite(temp_path, frame)
+            if boxes is None:
+                boxes = self.detect_faces_in_frame(frame)
+            if not boxes:
+                self.count_no_face()
+                return []
             
-            # Extract embedding from frame
-            embedding = self.extract_face_embedding(temp_path)
-            
-            # Clean up temp file
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+            embeddings = self.extract_face_embeddings(self.crop_faces(frame, boxes))
+            results = []
+            for box, embedding in zip(boxes, embeddings):
+                if embedding is None:
+                    self.count_no_face()
+                match = self.match_patient(embedding, threshold) if embedding is not None else None
+                if match:
+                    self.auto_enroll(match, embedding)
+                results.append((box, match))
+            return results
+        except Exception as e:
+            print(f"Error recognizing faces: {e}")
+            return []
+    
+    def auto_enroll(self, match: Tuple[str, float], embedding: np.ndarray) -> bool:
+        """
+        Keep a high-confidence live match as an extra template for the patient
+        Returns True if a template was added
+        """
+        patient_id, similarity = match
+        if self.auto_enroll_threshold is None or similarity < self.auto_enroll_threshold:
+            return False
+        with self._enroll_lock:
+            now = time.monotonic()
+            last = self._last_enrolled.get(patient_id)
+            if last is not None and now - last < self.auto_enroll_interval:
+                return False
+            self._last_enrolled[patient_id] = now
             
-            if embedding is not None:
-                # Find matching patient
-                patient_id = self.find_matching_patient(embedding)
-                if patient_id:
-                    # Calculate similarity score
-                    similarity = self.cosine_similarity(embedding, self.patient_encodings[patient_id])
-                    return (patient_id, similarity)
+            # A near copy of an existing template adds nothing but evicts a useful one
+            if patient_id not in self.gallery:
+                return False
+            closest = float(np.max(self.gallery.templates(patient_id) @ FaceGallery.normalize(embedding)))
+            if closest >= self.duplicate_threshold:
+                return False
+            if not self.save_encoding(patient_id, embedding):
+                return False
+            self.auto_enrolled += 1
+            return True
+    
+    def recognize_face_from_frame(self, frame: np.ndarray,
+                                  boxes: Optional[List[Box]] = None) -> Optional[Tuple[str, float]]:
+        """
+        Recognize face from a video frame
+        Returns (patient_id, similarity_score) of the best matching face or None
+        """
+        try:
+            if self.detector is None:
+                # No local detector: let DeepFace find the face in the full frame
+                embedding = self.extract_face_embedding(frame)
+                if embedding is None:
+                    self.count_no_face()
+                    return None
+                return self.match_patient(embedding)
             
-            return None
+            matches = [match for _, match in self.recognize_faces(frame, boxes) if match]
+            if not matches:
+                return None
+            return max(matches, key=lambda match: match[1])
         except Exception as e:
             print(f"Error recognizing face: {e}")
             return None
     
-    def detect_faces_in_frame(self, frame: np.ndarray) -> List[Tuple[int, int, int, int]]:
+    def _load_detector(self, detector):
+        """Build the configured detector, falling back to the Haar cascade"""
+        if not isinstance(detector, str):
+            return detector
+        try:
+            return create_face_detector(detector)
+        except Exception as e:
+            print(f"Error loading {detector} face detector, using Haar cascade: {e}")
+        try:
+            return HaarFaceDetector()
+        except Exception as e:
+            print(f"Error loading Haar cascade: {e}")
+            return None
+    
+    def create_detector(self):
         """
-        Detect faces in a frame and return bounding boxes
-        Returns list of (x, y, width, height) tuples
+        A separate instance of the configured detector
+        OpenCV detectors are not thread-safe, so each camera thread gets its own
         """
-        # Use OpenCV cascade for face detection (faster and more reliable)
-        return self._detect_faces_opencv(frame)
+        if self.detector_name is None:
+            return self.detector
+        return self._load_detector(self.detector_name)
     
-    def _detect_faces_opencv(self, frame: np.ndarray) -> List[Tuple[int, int, int, int]]:
-        """Fallback face detection using OpenCV"""
+    def detect_faces_in_frame(self, frame: np.ndarray, detector=None) -> List[Tuple[int, int, int, int]]:
+        """
+        Detect faces in a frame and return bounding boxes
+        detector: use this detector instead of the shared one (see create_detector)
+        Returns list of (x, y, width, height) tuples in full-frame coordinates
+        """
+        detector = detector or self.detector
+        if detector is None:
+            return []
         try:
-            face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = face_cascade.detectMultiScale(gray, 1.1, 4)
-            return [(x, y, w, h) for (x, y, w, h) in faces]
+            with self._stage_timers['detect'].time():
+                return detect_scaled(detector, frame, self.detection_scale)
         except Exception as e:
-            print(f"Error with OpenCV face detection: {e}")
+            print(f"Error with face detection: {e}")
             return []
 
 
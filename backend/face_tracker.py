@@ -0,0 +1,177 @@
+"""
+Face Tracker for Smart Vision Clinic
+IoU tracking of detection boxes so each person is embedded once, not every few seconds
+"""
+
+import time
+import threading
+import numpy as np
+from collections import deque, Counter
+from typing import Dict, List, Optional, Tuple
+from face_detectors import Box
+
+# A confirmed track is recognized again once its decayed confidence drops
+# below this fraction of the match threshold (0.5 for VGG-Face's 0.6)
+RECHECK_FRACTION = 5 / 6
+
+
+def iou_matrix(boxes_a: List[Box], boxes_b: List[Box]) -> np.ndarray:
+    """Pairwise intersection-over-union of (x, y, w, h) boxes"""
+    if not boxes_a or not boxes_b:
+        return np.zeros((len(boxes_a), len(boxes_b)), dtype=np.float32)
+    a = np.asarray(boxes_a, dtype=np.float32)[:, None, :]
+    b = np.asarray(boxes_b, dtype=np.float32)[None, :, :]
+    x1 = np.maximum(a[..., 0], b[..., 0])
+    y1 = np.maximum(a[..., 1], b[..., 1])
+    x2 = np.minimum(a[..., 0] + a[..., 2], b[..., 0] + b[..., 2])
+    y2 = np.minimum(a[..., 1] + a[..., 3], b[..., 1] + b[..., 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    union = a[..., 2] * a[..., 3] + b[..., 2] * b[..., 3] - intersection
+    return intersection / np.maximum(union, 1e-6)
+
+
+class Track:
+    """One face followed across frames, with its recent recognition votes"""
+    
+    def __init__(self, track_id: int, box: Box, vote_window: int):
+        self.track_id = track_id
+        self.box = box
+        self.misses = 0
+        self.last_attempt = 0.0
+        self.attempts = 0
+        self.last_recognized = 0.0
+        self.votes = deque(maxlen=vote_window)
+        self.identity: Optional[str] = None
+        self.similarity = 0.0
+    
+    def observe(self, match: Optional[Tuple[str, float]], min_votes: int):
+        """Add one recognition result and re-run the vote"""
+        self.votes.append(match)
+        counts = Counter(m[0] for m in self.votes if m)
+        if not counts:
+            self.identity = None
+            return
+        patient_id, count = counts.most_common(1)[0]
+        if count < min_votes:
+            self.identity = None
+            return
+        self.identity = patient_id
+        self.similarity = max(m[1] for m in self.votes if m and m[0] == patient_id)
+        # Only a result that agrees with the vote restores full confidence
+        if match and match[0] == patient_id:
+            self.last_recognized = time.monotonic()
+    
+    def confidence(self, half_life: float) -> float:
+        """Voted similarity, halved every half_life seconds since the last confirming match"""
+        if self.identity is None:
+            return 0.0
+        age = time.monotonic() - self.last_recognized
+        return self.similarity * 0.5 ** (age / half_life)
+
+
+class IoUTracker:
+    """
+    Greedy IoU association of detection boxes to tracks
+    
+    A track asks for recognition when it is new, until min_votes of its last
+    vote_window results agree (retrying every retry_interval seconds, backing
+    off to max_retry_interval for faces that never match), and again once its
+    confidence has decayed below min_confidence. Similarities are on the
+    model's scale, so min_confidence defaults to RECHECK_FRACTION of the
+    match_threshold the matches were made with.
+    """
+    
+    def __init__(self, iou_threshold: float = 0.3, max_misses: int = 10, vote_window: int = 5,
+                 min_votes: int = 2, retry_interval: float = 0.5, max_retry_interval: float = 10.0,
+                 half_life: float = 60.0, match_threshold: float = 0.6,
+                 min_confidence: Optional[float] = None):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.vote_window = vote_window
+        self.min_votes = min_votes
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.half_life = half_life
+        if min_confidence is None:
+            min_confidence = RECHECK_FRACTION * match_threshold
+        self.min_confidence = min_confidence
+        
+        self.tracks: Dict[int, Track] = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self.recognitions_requested = 0
+    
+    def update(self, boxes: List[Box]) -> List[Track]:
+        """Match this frame's boxes to tracks; returns the track for each box, in order"""
+        with self._lock:
+            track_ids = list(self.tracks)
+            overlaps = iou_matrix([self.tracks[t].box for t in track_ids], boxes)
+            assigned: List[Optional[Track]] = [None] * len(boxes)
+            matched_tracks = set()
+            
+            # Best-overlapping pairs first
+            for flat in np.argsort(-overlaps, axis=None):
+                t, b = np.unravel_index(flat, overlaps.shape)
+                if overlaps[t, b] < self.iou_threshold:
+                    break
+                if track_ids[t] in matched_tracks or assigned[b] is not None:
+                    continue
+                track = self.tracks[track_ids[t]]
+                track.box = boxes[b]
+                track.misses = 0
+                assigned[b] = track
+                matched_tracks.add(track_ids[t])
+            
+            for track_id in track_ids:
+                if track_id not in matched_tracks:
+                    track = self.tracks[track_id]
+                    track.misses += 1
+                    if track.misses > self.max_misses:
+                        del self.tracks[track_id]
+            
+            for b, box in enumerate(boxes):
+                if assigned[b] is None:
+                    track = Track(self._next_id, box, self.vote_window)
+                    self._next_id += 1
+                    self.tracks[track.track_id] = track
+                    assigned[b] = track
+            return assigned
+    
+    def needs_recognition(self, track: Track) -> bool:
+        if track.identity is not None:
+            if track.confidence(self.half_life) >= self.min_confidence:
+                return False
+            interval = self.retry_interval
+        else:
+            # Unknown faces (e.g. visitors) are retried less and less often
+            extra = max(track.attempts - self.vote_window, 0)
+            interval = min(self.retry_interval * 2 ** extra, self.max_retry_interval)
+        return time.monotonic() - track.last_attempt >= interval
+    
+    def select_for_recognition(self, tracks: List[Track]) -> List[Track]:
+        """Tracks from this frame that should be embedded now (marked as attempted)"""
+        with self._lock:
+            selected = [track for track in tracks if self.needs_recognition(track)]
+            now = time.monotonic()
+            for track in selected:
+                track.last_attempt = now
+                track.attempts += 1
+            self.recognitions_requested += len(selected)
+            return selected
+    
+    def observe(self, track_id: int, match: Optional[Tuple[str, float]]) -> Optional[Tuple[str, float]]:
+        """Record a recognition result; returns the track's voted (patient_id, similarity) if confirmed"""
+        with self._lock:
+            track = self.tracks.get(track_id)
+            if track is None:
+                return None
+            track.observe(match, self.min_votes)
+            return (track.identity, track.similarity) if track.identity else None
+    
+    def active_tracks(self) -> List[Tuple[int, Box, Optional[str], float]]:
+        """(track_id, box, identity, current confidence) for tracks seen in the last frame"""
+        with self._lock:
+            return [
+                (track.track_id, track.box, track.identity, track.confidence(self.half_life))
+                for track in self.tracks.values() if track.misses == 0
+            ]
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Persistent face recognition worker for Smart Vision Clinic
+Loads the model and patient gallery once and serves jobs until stopped
+Usage: python3 face_worker.py [--socket <path>] [--metrics-port <port>] [--compression pca:256:int8]
+
+Protocol: one JSON object per line in, one JSON object per line out.
+    {"id": 1, "op": "recognize", "image_b64": "<base64 JPEG/PNG bytes>"}
+    {"id": 2, "op": "register", "image_path": "/tmp/face.jpg", "patient_id": "PAT001"}
+    {"id": 3, "op": "extract", "image_path": "/tmp/face.jpg"}
+    {"id": 4, "op": "delete", "patient_id": "PAT001"}
+    {"id": 5, "op": "list"}
+    {"id": 6, "op": "reload"}
+    {"id": 7, "op": "ping"}
+    {"id": 8, "op": "metrics", "format": "prometheus"}  ("json" for structured data)
+Images are sent inline as "image_b64" or by "image_path".
+Every response echoes the request "id". Without --socket the worker reads
+requests from stdin and answers on stdout.
+"""
+
+import sys
+import os
+import json
+import base64
+import threading
+import argparse
+import socketserver
+from typing import Dict, Optional, Union
+
+# Add current directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from face_recognition_module import FaceRecognitionSystem
+from metrics import start_http_server
+
+
+class FaceWorker:
+    """Serves extract/recognize/register jobs against a warm FaceRecognitionSystem"""
+    
+    def __init__(self, encodings_dir: str = "face_encodings", threshold: Optional[float] = None,
+                 model_name: Optional[str] = None, detector_backend: Optional[str] = None,
+                 compression: Optional[str] = None):
+        """
+        Load the gallery and the embedding model once
+        threshold: default match threshold (the model's default or $FACE_MATCH_THRESHOLD)
+        compression: gallery compression spec such as 'pca:256:int8' (default $FACE_COMPRESSION)
+        """
+        self.face_recognition = FaceRecognitionSystem(encodings_dir, model_name=model_name,
+                                                      detector_backend=detector_backend, threshold=threshold,
+                                                      compressor=compression)
+        self.face_recognition.warm_up()
+        self.threshold = self.face_recognition.threshold
+        
+        # The model and gallery are shared between connections
+        self._lock = threading.Lock()
+        
+        self.metrics = self.face_recognition.metrics
+        self.handlers = {
+            'ping': self.handle_ping,
+            'extract': self.handle_extract,
+            'recognize': self.handle_recognize,
+            'register': self.handle_register,
+            'delete': self.handle_delete,
+            'list': self.handle_list,
+            'reload': self.handle_reload,
+        }
+    
+    def handle(self, request: Dict) -> Dict:
+        """Dispatch a single request and return the response"""
+        op = request.get('op')
+        handler = self.handlers.get(op)
+        if op == 'metrics':
+            # Read-only, so a scrape never waits behind a recognition
+            response = self.handle_metrics(request)
+        elif handler is None:
+            response = {"error": "Invalid operation"}
+        else:
+            # Includes the wait for the lock, as the caller experiences it
+            with self.metrics.timer("face_worker_request_seconds", "Worker request latency", op=op):
+                try:
+                    with self._lock:
+                        response = handler(request)
+                except Exception as e:
+                    response = {"error": str(e)}
+            if 'error' in response:
+                self.metrics.counter("face_worker_errors_total", "Worker requests answered with an error",
+                                     op=op).inc()
+        
+        if 'id' in request:
+            response['id'] = request['id']
+        return response
+    
+    def handle_line(self, line: str) -> Optional[str]:
+        """Decode a request line and encode its response line"""
+        line = line.strip()
+        if not line:
+            return None
+        
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return json.dumps({"error": "Invalid JSON request"})
+        
+        if not isinstance(request, dict):
+            return json.dumps({"error": "Invalid JSON request"})
+        
+        return json.dumps(self.handle(request))
+    
+    def _image(self, request: Dict) -> Union[str, bytes]:
+        """Inline base64 image bytes, or a path to an image file"""
+        if request.get('image_b64'):
+            try:
+                return base64.b64decode(request['image_b64'])
+            except ValueError:
+                raise ValueError("Invalid base64 image data")
+        
+        image_path = request.get('image_path')
+        if not image_path:
+            raise ValueError("image_b64 or image_path is required")
+        if not os.path.exists(image_path):
+            raise ValueError(f"Image file not found: {image_path}")
+        return image_path
+    
+    def handle_ping(self, request: Dict) -> Dict:
+        return {"success": True, "patients": len(self.face_recognition.patient_encodings),
+                "model": self.face_recognition.model_name, "threshold": self.threshold}
+    
+    def handle_extract(self, request: Dict) -> Dict:
+        embedding = self.face_recognition.extract_face_embedding(self._image(request))
+        if embedding is None:
+            return {"error": "Could not detect face in image"}
+        
+        embedding_list = embedding.tolist()
+        return {
+            "success": True,
+            "descriptor": embedding_list,
+            "vector_length": len(embedding_list)
+        }
+    
+    def handle_recognize(self, request: Dict) -> Dict:
+        embedding = self.face_recognition.extract_face_embedding(self._image(request))
+        if embedding is None:
+            self.face_recognition.count_no_face()
+            return {"recognized": False, "message": "No face detected in image"}
+        
+        threshold = float(request.get('threshold', self.threshold))
+        match = self.face_recognition.match_patient(embedding, threshold)
+        if not match:
+            return {"recognized": False, "message": "No matching patient found"}
+        
+        patient_id, similarity = match
+        return {
+            "recognized": True,
+            "patientId": patient_id,
+            "confidence": float(similarity)
+        }
+    
+    def handle_register(self, request: Dict) -> Dict:
+        patient_id = request.get('patient_id')
+        if not patient_id:
+            return {"error": "patient_id is required"}
+        
+        embedding = self.face_recognition.extract_face_embedding(self._image(request))
+        if embedding is None:
+            return {"error": "Could not detect face in image"}
+        
+        # Registering again adds a template unless "replace" is set
+        if not self.face_recognition.save_encoding(patient_id, embedding, replace=bool(request.get('replace'))):
+            return {"error": "Failed to save face encoding"}
+        return {"success": True, "patient_id": patient_id}
+    
+    def handle_delete(self, request: Dict) -> Dict:
+        patient_id = request.get('patient_id')
+        if not patient_id:
+            return {"error": "patient_id is required"}
+        
+        # The patient may have been registered by a one-off script
+        self.face_recognition.sync_encodings()
+        if not self.face_recognition.delete_encoding(patient_id):
+            return {"error": "Face encoding not found"}
+        return {"success": True, "patient_id": patient_id}
+    
+    def handle_list(self, request: Dict) -> Dict:
+        self.face_recognition.sync_encodings()
+        return {"success": True, "patient_ids": list(self.face_recognition.patient_encodings)}
+    
+    def handle_metrics(self, request: Dict) -> Dict:
+        """Every metric of this process, as Prometheus text or JSON"""
+        if request.get('format') == 'json':
+            return {"success": True, "metrics": self.metrics.as_dict()}
+        return {"success": True, "metrics": self.metrics.to_prometheus()}
+    
+    def handle_reload(self, request: Dict) -> Dict:
+        """Pick up encodings written by other processes"""
+        self.face_recognition.reload_encodings()
+        return {"success": True, "patients": len(self.face_recognition.patient_encodings)}
+    
+    def serve_stdio(self, stdin, stdout):
+        """Answer JSON-line requests from stdin until EOF"""
+        stdout.write(json.dumps({"event": "ready", "patients": len(self.face_recognition.patient_encodings)}) + "\n")
+        stdout.flush()
+        
+        for line in stdin:
+            response = self.handle_line(line)
+            if response is not None:
+                stdout.write(response + "\n")
+                stdout.flush()
+    
+    def serve_socket(self, socket_path: str):
+        """Answer JSON-line requests on a local Unix socket"""
+        worker = self
+        
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for raw in self.rfile:
+                    response = worker.handle_line(raw.decode('utf-8'))
+                    if response is not None:
+                        self.wfile.write((response + "\n").encode('utf-8'))
+                        self.wfile.flush()
+        
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        
+        server = socketserver.ThreadingUnixStreamServer(socket_path, Handler)
+        server.daemon_threads = True
+        print(f"Face worker listening on {socket_path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Smart Vision Clinic face recognition worker")
+    parser.add_argument('--socket', help="Serve on this Unix socket instead of stdin/stdout")
+    parser.add_argument('--encodings-dir', default="face_encodings")
+    parser.add_argument('--threshold', type=float, default=None,
+                        help="match similarity (default: $FACE_MATCH_THRESHOLD or the model's default)")
+    parser.add_argument('--model', help="DeepFace embedding model (default: $FACE_MODEL or VGG-Face)")
+    parser.add_argument('--detector-backend', help="DeepFace face detector (default: $FACE_DETECTOR_BACKEND or opencv)")
+    parser.add_argument('--compression',
+                        help="shortlist matches from compressed codes, method:dim:dtype[:top_k] such as "
+                             "pca:256:int8, or 'none' (default: $FACE_COMPRESSION)")
+    parser.add_argument('--metrics-port', type=int, help="Serve Prometheus metrics on http://127.0.0.1:<port>/metrics")
+    args = parser.parse_args()
+    
+    # stdout carries the protocol, so library prints must go to stderr
+    protocol_out = sys.stdout
+    sys.stdout = sys.stderr
+    
+    worker = FaceWorker(args.encodings_dir, args.threshold, args.model, args.detector_backend, args.compression)
+    if args.metrics_port is not None:
+        port = start_http_server(args.metrics_port, registry=worker.metrics)
+        print(f"Face worker metrics on http://127.0.0.1:{port}/metrics", file=sys.stderr)
+    
+    try:
+        if args.socket:
+            worker.serve_socket(args.socket)
+        else:
+            worker.serve_stdio(sys.stdin, protocol_out)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+List or delete registered faces without the face worker
+Usage: python3 manage_faces.py list
+       python3 manage_faces.py delete <patient_id>
+Returns JSON like the worker's list/delete jobs
+"""
+
+import sys
+import os
+import json
+
+# Add current directory to path to import modules
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    from face_recognition_module import FaceRecognitionSystem
+    
+    operation = sys.argv[1] if len(sys.argv) > 1 else None
+    if operation not in ('list', 'delete') or (operation == 'delete') != (len(sys.argv) == 3):
+        print(json.dumps({"error": "Invalid arguments. Usage: python3 manage_faces.py list | delete <patient_id>"}))
+        sys.exit(1)
+    
+    # Only opens the gallery file; DeepFace is never imported
+    face_recognition = FaceRecognitionSystem()
+    
+    if operation == 'list':
+        print(json.dumps({"success": True, "patient_ids": list(face_recognition.patient_encodings)}))
+    else:
+        patient_id = sys.argv[2]
+        if not face_recognition.delete_encoding(patient_id):
+            print(json.dumps({"error": "Face encoding not found"}))
+            sys.exit(1)
+        print(json.dumps({"success": True, "patient_id": patient_id}))
+
+except Exception as e:
+    print(json.dumps({"error": str(e)}))
+    sys.exit(1)
@@ -0,0 +1,291 @@
+"""
+Metrics for Smart Vision Clinic
+Per-stage latency histograms, counters and gauges, exported in the Prometheus
+text format or as JSON
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import bisect
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows: only /proc-less fallbacks apply
+    resource = None
+
+
+# Seconds; spans a cached SQLite read up to a cold model load
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Counter:
+    """Count that only goes up"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+    
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+    
+    def get(self) -> float:
+        return self.value
+
+
+class Gauge:
+    """Current value, either set directly or read from fn when collected"""
+    
+    def __init__(self, fn: Optional[Callable[[], Optional[float]]] = None):
+        self.fn = fn
+        self.value = 0.0
+    
+    def set(self, value: float):
+        self.value = value
+    
+    def get(self) -> Optional[float]:
+        if self.fn is None:
+            return self.value
+        try:
+            return self.fn()
+        except Exception:
+            return None
+
+
+class Histogram:
+    """
+    Latency distribution
+    Cumulative buckets for Prometheus, plus the last `window` samples from
+    which p50/p95/p99 are computed exactly
+    """
+    
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS, window: int = 2048):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._recent = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+    
+    def observe(self, value: float):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._recent.append(value)
+            self.count += 1
+            self.sum += value
+    
+    @contextmanager
+    def time(self):
+        """Observe the duration of the with-block, also when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+    
+    def cumulative_counts(self) -> List[Tuple[float, int]]:
+        """(upper bound, observations at or below it), ending with +Inf"""
+        with self._lock:
+            counts = list(self._counts)
+        total = 0
+        cumulative = []
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            total += count
+            cumulative.append((bound, total))
+        return cumulative
+    
+    def quantiles(self, quantiles: Sequence[float] = QUANTILES) -> Dict[str, Optional[float]]:
+        with self._lock:
+            recent = sorted(self._recent)
+        result = {}
+        for q in quantiles:
+            key = f"p{q * 100:g}"
+            result[key] = recent[min(len(recent) - 1, int(q * len(recent)))] if recent else None
+        return result
+
+
+class MetricsRegistry:
+    """
+    Named metric families, each with one metric per label set
+    Asking for the same name and labels again returns the same metric
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        # name -> (type, help, {label items: metric})
+        self._families: Dict[str, Tuple[str, str, Dict[Tuple, object]]] = {}
+    
+    def _get(self, kind: str, name: str, help: str, labels: Dict[str, str], factory):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = (kind, help, {})
+            elif family[0] != kind:
+                raise ValueError(f"Metric {name} is a {family[0]}, not a {kind}")
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = factory()
+            return metric
+    
+    def counter(self, name: str, help: str = "", **labels) -> Counter:
+        return self._get('counter', name, help, labels, Counter)
+    
+    def gauge(self, name: str, help: str = "", fn: Optional[Callable[[], Optional[float]]] = None,
+              **labels) -> Gauge:
+        """A gauge; fn (if given) replaces the gauge's callback"""
+        gauge = self._get('gauge', name, help, labels, Gauge)
+        if fn is not None:
+            gauge.fn = fn
+        return gauge
+    
+    def histogram(self, name: str, help: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS,
+                  **labels) -> Histogram:
+        return self._get('histogram', name, help, labels, lambda: Histogram(buckets))
+    
+    def timer(self, name: str, help: str = "", **labels):
+        """Context manager recording the block's duration in a histogram"""
+        return self.histogram(name, help, **labels).time()
+    
+    def _collect(self):
+        with self._lock:
+            return [(name, kind, help, list(metrics.items()))
+                    for name, (kind, help, metrics) in sorted(self._families.items())]
+    
+    def to_prometheus(self) -> str:
+        """Every metric in the Prometheus text exposition format"""
+        lines = []
+        for name, kind, help, metrics in self._collect():
+            if help:
+                lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in metrics:
+                if kind == 'histogram':
+                    for bound, count in metric.cumulative_counts():
+                        le = "+Inf" if bound == float('inf') else f"{bound:g}"
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {metric.sum:.9g}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {metric.count}")
+                else:
+                    value = metric.get()
+                    if value is not None:
+                        lines.append(f"{name}{_format_labels(labels)} {float(value):.9g}")
+        return "\n".join(lines) + "\n"
+    
+    def as_dict(self) -> Dict:
+        """Every metric as JSON-ready data; histograms as count, sum and p50/p95/p99 in seconds"""
+        result = {}
+        for name, kind, _, metrics in self._collect():
+            values = []
+            for labels, metric in metrics:
+                entry = {'labels': dict(labels)}
+                if kind == 'histogram':
+                    entry.update(count=metric.count, sum=metric.sum, **metric.quantiles())
+                else:
+                    entry['value'] = metric.get()
+                values.append(entry)
+            result[name] = {'type': kind, 'values': values}
+        return result
+    
+    def write_json(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+    
+    def dump_on_exit(self, path: Optional[str]):
+        """Write the metrics to path as JSON when the process exits (no-op without a path)"""
+        if not path:
+            return
+        
+        def dump():
+            try:
+                self.write_json(path)
+            except Exception as e:
+                print(f"Error writing metrics: {e}", file=sys.stderr)
+        atexit.register(dump)
+
+
+def _format_labels(labels: Tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+# Shared by every module in the process, so one endpoint exports everything
+REGISTRY = MetricsRegistry()
+
+
+def timed(name: str, help: str = "", **labels):
+    """
+    Method decorator recording each call's duration in self.metrics
+    The label "op" defaults to the method name
+    """
+    def decorator(method):
+        op_labels = {'op': method.__name__, **labels}
+        
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.metrics.timer(name, help, **op_labels):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def resident_memory_bytes() -> Optional[float]:
+    """Current RSS on Linux, peak RSS elsewhere (None if unknown)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, other systems KiB
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def start_http_server(port: int, host: str = "127.0.0.1", registry: MetricsRegistry = REGISTRY) -> int:
+    """
+    Serve GET /metrics (Prometheus text) and GET /metrics.json on a background thread
+    Returns the port actually bound (pass 0 for any free port)
+    """
+    # Only processes that export metrics pay for importing the HTTP server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split('?')[0]
+            if path == '/metrics':
+                body = registry.to_prometheus().encode('utf-8')
+                content_type = 'text/plain; version=0.0.4; charset=utf-8'
+            elif path == '/metrics.json':
+                body = json.dumps(registry.as_dict()).encode('utf-8')
+                content_type = 'application/json'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            # Scrapes every few seconds would flood the log
+            pass
+    
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[1]
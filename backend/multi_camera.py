@@ -0,0 +1,153 @@
+"""
+Multi-Camera Service for Smart Vision Clinic
+Runs several camera streams in one process against a single loaded model and gallery
+"""
+
+import time
+import threading
+from typing import Dict, List, Optional, Tuple, Union
+from recognition_pipeline import RecognitionPipeline, StageStats
+from face_detectors import Box
+
+
+Source = Union[int, str]
+
+
+def parse_source(source: str) -> Source:
+    """Camera index for digits, otherwise an RTSP URL or video file path"""
+    return int(source) if source.isdigit() else source
+
+
+class RecognitionScheduler:
+    """
+    Shares the embedding model between camera streams
+    
+    Streams are served round-robin, so a busy camera cannot starve the
+    others. The CPU budget is the number of worker threads running the model
+    at once plus an optional cap on recognitions per second across all streams.
+    """
+    
+    def __init__(self, pipelines: List[RecognitionPipeline], workers: int = 1,
+                 max_recognitions_per_second: Optional[float] = None):
+        self.pipelines = pipelines
+        self.workers = workers
+        self.max_recognitions_per_second = max_recognitions_per_second
+        
+        self.work_ready = threading.Event()
+        for pipeline in pipelines:
+            pipeline.recognition_ready = self.work_ready
+        
+        self._lock = threading.Lock()
+        self._next_stream = 0
+        self._next_slot = 0.0
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self.wait_stats = StageStats()
+    
+    def start(self):
+        self._stop.clear()
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+    
+    def stop(self):
+        self._stop.set()
+        self.work_ready.set()
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self._threads = []
+    
+    def _next_job(self) -> Optional[Tuple[RecognitionPipeline, tuple]]:
+        """Take the next pending request, starting after the last stream served"""
+        with self._lock:
+            count = len(self.pipelines)
+            for offset in range(count):
+                index = (self._next_stream + offset) % count
+                item = self.pipelines[index].recognition_queue.get_nowait()
+                if item is not None:
+                    self._next_stream = (index + 1) % count
+                    return self.pipelines[index], item
+            self.work_ready.clear()
+            return None
+    
+    def _wait_for_budget(self):
+        """Space model calls evenly when a recognitions-per-second cap is set"""
+        if not self.max_recognitions_per_second:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1.0 / self.max_recognitions_per_second
+        if slot > now:
+            time.sleep(slot - now)
+        self.wait_stats.record(slot - now)
+    
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            job = self._next_job()
+            if job is None:
+                self.work_ready.wait(timeout=0.1)
+                continue
+            self._wait_for_budget()
+            pipeline, item = job
+            pipeline.recognize(item)
+
+
+class MultiCameraService:
+    """
+    Capture and detection per stream, recognition through one shared scheduler
+    Results are tagged with the stream name
+    """
+    
+    def __init__(self, face_recognition, sources: Dict[str, Source], recognition_interval: float = 0.5,
+                 workers: int = 1, max_recognitions_per_second: Optional[float] = None,
+                 width: int = 1280, height: int = 720):
+        self.face_recognition = face_recognition
+        self.pipelines: Dict[str, RecognitionPipeline] = {
+            name: RecognitionPipeline(
+                face_recognition, source, width, height, recognition_interval,
+                name=name, detector=face_recognition.create_detector(), scheduled=True
+            )
+            for name, source in sources.items()
+        }
+        self.scheduler = RecognitionScheduler(list(self.pipelines.values()), workers,
+                                              max_recognitions_per_second)
+    
+    def start(self) -> bool:
+        """Open every camera; streams that fail to open are skipped"""
+        started = {name: p for name, p in self.pipelines.items() if p.start()}
+        if not started:
+            return False
+        self.pipelines = started
+        self.scheduler.pipelines = list(started.values())
+        self.scheduler.start()
+        return True
+    
+    def stop(self):
+        self.scheduler.stop()
+        for pipeline in self.pipelines.values():
+            pipeline.stop()
+    
+    @property
+    def running(self) -> bool:
+        return any(pipeline.running for pipeline in self.pipelines.values())
+    
+    def poll_results(self) -> List[Tuple[str, int, List[Tuple[Box, Optional[Tuple[str, float]]]]]]:
+        """Drain results from every stream as (stream_name, frame_id, matches)"""
+        return [
+            (name, frame_id, matches)
+            for name, pipeline in self.pipelines.items()
+            for frame_id, matches in pipeline.poll_results()
+        ]
+    
+    def stats(self) -> Dict:
+        """Per-stream stage throughput/latency and queue depths"""
+        return {
+            'streams': {name: pipeline.stats() for name, pipeline in self.pipelines.items()},
+            'scheduler': {
+                'workers': self.scheduler.workers,
+                'max_recognitions_per_second': self.scheduler.max_recognitions_per_second,
+                'budget_wait': self.scheduler.wait_stats.as_dict(),
+            },
+        }
@@ -0,0 +1,143 @@
+"""
+ONNX Face Embedder for Smart Vision Clinic
+Runs an exported face embedding model through ONNX Runtime or OpenCV DNN, without TensorFlow
+"""
+
+import os
+import cv2
+import threading
+import importlib.util
+import numpy as np
+from typing import List, Optional, Tuple
+
+
+# Input size (height, width) DeepFace feeds each model
+MODEL_INPUT_SIZES = {
+    "VGG-Face": (224, 224),
+    "Facenet": (160, 160),
+    "Facenet512": (160, 160),
+    "OpenFace": (96, 96),
+    "DeepFace": (152, 152),
+    "DeepID": (47, 55),
+    "ArcFace": (112, 112),
+    "SFace": (112, 112),
+    "GhostFaceNet": (112, 112),
+}
+
+ENGINES = ('auto', 'onnxruntime', 'opencv')
+
+
+class OnnxEmbedder:
+    """
+    Batched face embeddings from an ONNX model
+    
+    Faces are preprocessed the way DeepFace does it for detector_backend="skip":
+    BGR to RGB, padded to the model's aspect ratio, resized and scaled to [0, 1].
+    Models exported from Keras take NHWC input; pass layout="NCHW" for others.
+    check_onnx_parity.py compares the result with DeepFace.represent.
+    """
+    
+    def __init__(self, model_path: str, model_name: str = "VGG-Face", engine: str = "auto",
+                 threads: Optional[int] = None, layout: str = "NHWC",
+                 input_size: Optional[Tuple[int, int]] = None):
+        """
+        model_path: exported .onnx file (see export_onnx_model)
+        engine: 'onnxruntime', 'opencv' or 'auto' (ONNX Runtime when installed)
+        threads: intra-op threads (default: runtime's choice, usually all cores)
+        input_size: (height, width); default from the model input or MODEL_INPUT_SIZES
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine: {engine} (expected one of {', '.join(ENGINES)})")
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"ONNX model not found: {model_path}")
+        self.model_path = model_path
+        self.model_name = model_name
+        self.layout = layout
+        self.threads = threads
+        
+        if engine == 'auto':
+            engine = 'onnxruntime' if importlib.util.find_spec("onnxruntime") else 'opencv'
+        self.engine = engine
+        if engine == 'onnxruntime':
+            self._load_onnxruntime()
+        else:
+            self._load_opencv()
+        self.input_size = input_size or self._model_input_size() or MODEL_INPUT_SIZES[model_name]
+    
+    def _load_onnxruntime(self):
+        # Imported here so that loading this module stays cheap
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+            # One graph branch at a time; parallelism comes from the intra-op threads
+            options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(self.model_path, options,
+                                                    providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+    
+    def _load_opencv(self):
+        self.net = cv2.dnn.readNetFromONNX(self.model_path)
+        # A Net is not safe to run from several threads at once
+        self._net_lock = threading.Lock()
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        if self.threads:
+            # OpenCV's thread pool is process-wide
+            cv2.setNumThreads(self.threads)
+    
+    def _model_input_size(self) -> Optional[Tuple[int, int]]:
+        """(height, width) from a static model input shape"""
+        if self.engine != 'onnxruntime':
+            return None
+        shape = self.session.get_inputs()[0].shape
+        height, width = (shape[1], shape[2]) if self.layout == "NHWC" else (shape[2], shape[3])
+        if isinstance(height, int) and isinstance(width, int):
+            return height, width
+        return None
+    
+    def preprocess(self, faces: List[np.ndarray]) -> np.ndarray:
+        """Stack BGR face crops into one float32 input batch"""
+        height, width = self.input_size
+        batch = np.zeros((len(faces), height, width, 3), dtype=np.float32)
+        for i, face in enumerate(faces):
+            scale = min(height / face.shape[0], width / face.shape[1])
+            resized = cv2.resize(face, (max(1, int(face.shape[1] * scale)), max(1, int(face.shape[0] * scale))))
+            top = (height - resized.shape[0]) // 2
+            left = (width - resized.shape[1]) // 2
+            batch[i, top:top + resized.shape[0], left:left + resized.shape[1]] = resized[:, :, ::-1]
+        batch /= 255.0
+        if self.layout == "NCHW":
+            batch = batch.transpose(0, 3, 1, 2)
+        return np.ascontiguousarray(batch)
+    
+    def embed(self, faces: List[np.ndarray]) -> np.ndarray:
+        """Embeddings (faces x dim) for already-cropped BGR faces, in one model call"""
+        if not faces:
+            return np.empty((0, 0), dtype=np.float32)
+        batch = self.preprocess(faces)
+        if self.engine == 'onnxruntime':
+            output = self.session.run(None, {self.input_name: batch})[0]
+        else:
+            with self._net_lock:
+                self.net.setInput(batch)
+                output = self.net.forward()
+        return output.reshape(len(faces), -1).astype(np.float32)
+
+
+def export_onnx_model(model_name: str, path: str, opset: int = 13) -> str:
+    """
+    Export a DeepFace Keras model to ONNX (needs deepface, tensorflow and tf2onnx)
+    Returns the path written
+    """
+    import tensorflow as tf
+    import tf2onnx
+    from deepface import DeepFace
+    
+    model = DeepFace.build_model(model_name)
+    keras_model = getattr(model, 'model', model)
+    height, width = MODEL_INPUT_SIZES[model_name]
+    signature = (tf.TensorSpec((None, height, width, 3), tf.float32, name="input"),)
+    tf2onnx.convert.from_keras(keras_model, input_signature=signature, opset=opset, output_path=path)
+    return path
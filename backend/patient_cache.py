@@ -0,0 +1,104 @@
+"""
+Patient Cache for Smart Vision Clinic
+Bounded LRU/TTL cache of patient records and recent visits
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Set, Tuple
+
+
+class PatientCache:
+    """
+    Least-recently-used cache keyed by patient
+    Entries expire after ttl seconds so changes made by other processes
+    are picked up; changes made through ClinicDatabase invalidate at once
+    
+    A reader takes generation() before loading from the database and passes
+    it to put(), which drops the value if the patient was invalidated in
+    between, so a read that raced a write never caches the older rows
+    """
+    
+    def __init__(self, max_entries: int = 1024, ttl: float = 60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        
+        self._entries: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        self._keys_by_patient: Dict[str, Set[Tuple]] = {}
+        self._lock = threading.Lock()
+        
+        # Invalidations per patient (one int per patient ever changed) and of the whole cache
+        self._generations: Dict[str, int] = {}
+        self._clears = 0
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, patient_id: str, kind: str, extra: Hashable = None) -> Tuple[bool, Any]:
+        """Return (found, value); a cached None is a valid value"""
+        key = (patient_id, kind, extra)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+    
+    def generation(self, patient_id: str) -> Tuple[int, int]:
+        """Token that changes whenever the patient's entries are invalidated"""
+        with self._lock:
+            return self._clears, self._generations.get(patient_id, 0)
+    
+    def put(self, patient_id: str, kind: str, value: Any, extra: Hashable = None,
+            generation: Optional[Tuple[int, int]] = None):
+        """Cache a value, unless the patient was invalidated since generation was taken"""
+        key = (patient_id, kind, extra)
+        with self._lock:
+            if generation is not None and generation != (self._clears, self._generations.get(patient_id, 0)):
+                return
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            self._keys_by_patient.setdefault(patient_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+    
+    def _remove(self, key: Tuple):
+        self._entries.pop(key, None)
+        keys = self._keys_by_patient.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_patient[key[0]]
+    
+    def invalidate(self, patient_id: str, kind: Optional[str] = None):
+        """Drop a patient's entries (only those of one kind if given)"""
+        with self._lock:
+            self._generations[patient_id] = self._generations.get(patient_id, 0) + 1
+            for key in list(self._keys_by_patient.get(patient_id, ())):
+                if kind is None or key[1] == kind:
+                    self._remove(key)
+    
+    def clear(self):
+        with self._lock:
+            self._clears += 1
+            self._entries.clear()
+            self._keys_by_patient.clear()
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
@@ -4,8 +4,10 @@ Shows patient information and history
 """
 
 import cv2
+import threading
 import numpy as np
-from typing import Dict, List
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
 from datetime import datetime
 
 
@@ -19,12 +21,86 @@ class PatientDisplay:
         self.font_scale = 0.7
         self.thickness = 2
         self.line_type = cv2.LINE_AA
+        
+        # Live label: rendered once per (patient, confidence %) and blended into its region only
+        self.label_box = ((10, 10), (300, 100))
+        self.label_color = (0, 100, 0)
+        self.label_cache_size = 256
+        self._label_cache: "OrderedDict[Tuple[str, int], Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        self._white = np.full((0, 0, 3), 255, dtype=np.uint8)
+        self._patch_buffer = None
+        self._waiting_origin: Dict[Tuple[int, int], Tuple[int, int]] = {}
+        
+        # Profile cards without the recognition score, per patient: (version, card, score origin)
+        self.profile_cache_size = 64
+        self._profile_cache: "OrderedDict[str, Tuple[Hashable, np.ndarray, Tuple[int, int]]]" = OrderedDict()
+        self._profile_lock = threading.Lock()
+        self.profile_hits = 0
+        self.profile_misses = 0
+    
+    @staticmethod
+    def profile_version(patient_data: Dict) -> Hashable:
+        """
+        Version stamp of a profile card: changes when a visit is added
+        (newest visit) or the patient record is updated
+        """
+        visits = patient_data.get('visits') or []
+        latest = (visits[0].get('id'), visits[0].get('visit_date')) if visits else None
+        return (latest, len(visits), patient_data.get('updated_at'),
+                patient_data.get('name'), patient_data.get('phone'), patient_data.get('email'))
+    
+    def _profile_card(self, patient_data: Dict) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """Cached card for the patient, rendered if missing or out of date"""
+        patient_id = patient_data.get('patient_id')
+        version = self.profile_version(patient_data)
+        with self._profile_lock:
+            entry = self._profile_cache.get(patient_id)
+            if entry is not None and entry[0] == version:
+                self._profile_cache.move_to_end(patient_id)
+                self.profile_hits += 1
+                return entry[1], entry[2]
+            self.profile_misses += 1
+        
+        # Rendered outside the lock; two threads racing on one patient draw the same card
+        card, score_origin = self._render_profile_card(patient_data)
+        card.flags.writeable = False
+        with self._profile_lock:
+            self._profile_cache[patient_id] = (version, card, score_origin)
+            self._profile_cache.move_to_end(patient_id)
+            while len(self._profile_cache) > self.profile_cache_size:
+                self._profile_cache.popitem(last=False)
+        return card, score_origin
+    
+    def prerender_profile(self, patient_data: Dict):
+        """Render and cache the patient's card ahead of time (safe to call from a worker thread)"""
+        self._profile_card(patient_data)
+    
+    def invalidate_profile(self, patient_id: str):
+        """Drop the patient's cached card, e.g. after a visit was added"""
+        with self._profile_lock:
+            self._profile_cache.pop(patient_id, None)
+    
+    def has_profile(self, patient_id: str, version: Optional[Hashable] = None) -> bool:
+        """Whether a card is cached for the patient (at this version if given)"""
+        with self._profile_lock:
+            entry = self._profile_cache.get(patient_id)
+            return entry is not None and (version is None or entry[0] == version)
     
     def create_profile_overlay(self, patient_data: Dict, similarity_score: float) -> np.ndarray:
         """
         Create a profile overlay window with patient information
         Returns image with patient profile displayed
+        The card is cached per patient; only the recognition score is drawn each time
         """
+        card, score_origin = self._profile_card(patient_data)
+        overlay = card.copy()
+        score_text = f"Recognition Score: {similarity_score:.1%}"
+        cv2.putText(overlay, score_text, score_origin, self.font, 
+                   self.font_scale, (0, 150, 255), self.thickness, self.line_type)
+        return overlay
+    
+    def _render_profile_card(self, patient_data: Dict) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """Draw the profile card, leaving out the score; returns it and the score's position"""
         # Create white background
         overlay = np.ones((self.height, self.width, 3), dtype=np.uint8) * 255
         
@@ -62,11 +138,9 @@ class PatientDisplay:
             cv2.putText(overlay, email, (30, y_offset), self.font, 
                        self.font_scale, (50, 50, 50), self.thickness, self.line_type)
         
-        # Recognition Score
+        # Recognition Score (drawn per call by create_profile_overlay)
         y_offset += line_height + 10
-        score_text = f"Recognition Score: {similarity_score:.1%}"
-        cv2.putText(overlay, score_text, (30, y_offset), self.font, 
-                   self.font_scale, (0, 150, 255), self.thickness, self.line_type)
+        score_origin = (30, y_offset)
         
         # Divider line
         y_offset += line_height
@@ -110,43 +184,92 @@ class PatientDisplay:
         cv2.putText(overlay, "Press 'A' to add new visit", (30, y_offset + 25), self.font, 
                   0.6, (100, 100, 100), 1, self.line_type)
         
-        return overlay
+        return overlay, score_origin
     
-    def overlay_info_on_frame(self, frame: np.ndarray, patient_name: str, 
-                              confidence: float) -> np.ndarray:
+    def _label_patch(self, patient_name: str, confidence_bucket: int) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Overlay simple recognition info on video frame
-        Useful for real-time display
+        Rendered recognition label, cached per (patient, confidence %)
+        Returns the background tint to add and the white-text coverage (0-255)
         """
-        frame_copy = frame.copy()
+        key = (patient_name, confidence_bucket)
+        patch = self._label_cache.get(key)
+        if patch is not None:
+            self._label_cache.move_to_end(key)
+            return patch
+        
+        (x1, y1), (x2, y2) = self.label_box
+        lines = [
+            ("RECOGNIZED", (20, 40), 1.0, 2),
+            (f"Name: {patient_name}", (20, 70), self.font_scale, self.thickness),
+            (f"Confidence: {confidence_bucket}%", (20, 100), self.font_scale, self.thickness),
+        ]
+        # The patch covers the box plus any text that runs past it (long names, descenders)
+        height, width = y2 - y1 + 1, x2 - x1 + 1
+        for text, (x, y), scale, thickness in lines:
+            (text_width, _), baseline = cv2.getTextSize(text, self.font, scale, thickness)
+            width = max(width, x - x1 + text_width + thickness + 1)
+            height = max(height, y - y1 + baseline + thickness + 1)
         
-        # Create semi-transparent overlay
-        overlay = np.zeros_like(frame)
+        # Same look as blending a filled rectangle at 0.7 over the frame
+        tint = np.zeros((height, width, 3), dtype=np.uint8)
+        tint[:y2 - y1 + 1, :x2 - x1 + 1] = np.round(np.array(self.label_color) * 0.7).astype(np.uint8)
+        
+        # Text drawn white on black is its own anti-aliased coverage mask
+        coverage = np.zeros((height, width, 3), dtype=np.uint8)
+        for text, (x, y), scale, thickness in lines:
+            cv2.putText(coverage, text, (x - x1, y - y1), self.font,
+                       scale, (255, 255, 255), thickness, self.line_type)
+        
+        patch = (tint, coverage)
+        self._label_cache[key] = patch
+        if len(self._label_cache) > self.label_cache_size:
+            self._label_cache.popitem(last=False)
+        return patch
+    
+    def overlay_info_on_frame(self, frame: np.ndarray, patient_name: str,
+                              confidence: float, in_place: bool = False) -> np.ndarray:
+        """
+        Overlay simple recognition info on video frame
+        Useful for real-time display; only the label's region is touched
+        in_place: draw on frame itself instead of a copy
+        """
+        frame_copy = frame if in_place else frame.copy()
+        tint, text = self._label_patch(patient_name, int(round(confidence * 100)))
         
-        # Recognition label background
-        cv2.rectangle(overlay, (10, 10), (300, 100), (0, 100, 0), -1)
-        frame_copy = cv2.addWeighted(frame_copy, 1.0, overlay, 0.7, 0)
+        (x1, y1), _ = self.label_box
+        height = min(tint.shape[0], frame_copy.shape[0] - y1)
+        width = min(tint.shape[1], frame_copy.shape[1] - x1)
+        if height <= 0 or width <= 0:
+            return frame_copy
+        roi = frame_copy[y1:y1 + height, x1:x1 + width]
         
-        # Recognition text
-        cv2.putText(frame_copy, "RECOGNIZED", (20, 40), self.font, 
-                   1.0, (255, 255, 255), 2, self.line_type)
-        cv2.putText(frame_copy, f"Name: {patient_name}", (20, 70), self.font, 
-                   self.font_scale, (255, 255, 255), self.thickness, self.line_type)
-        cv2.putText(frame_copy, f"Confidence: {confidence:.1%}", (20, 100), self.font, 
-                   self.font_scale, (255, 255, 255), self.thickness, self.line_type)
+        # Scratch buffers only grow, so a new name rarely allocates
+        if self._white.shape[0] < height or self._white.shape[1] < width:
+            shape = (max(height, self._white.shape[0]), max(width, self._white.shape[1]), 3)
+            self._white = np.full(shape, 255, dtype=np.uint8)
+            self._patch_buffer = np.empty(shape, dtype=np.uint8)
+        buffer = self._patch_buffer[:height, :width]
         
+        # roi += tint, then roi += (255 - roi) * coverage: white text over the tinted label
+        cv2.add(roi, tint[:height, :width], dst=roi)
+        cv2.subtract(self._white[:height, :width], roi, dst=buffer)
+        cv2.multiply(buffer, text[:height, :width], dst=buffer, scale=1 / 255)
+        cv2.add(roi, buffer, dst=roi)
         return frame_copy
     
-    def display_waiting_message(self, frame: np.ndarray) -> np.ndarray:
+    def display_waiting_message(self, frame: np.ndarray, in_place: bool = False) -> np.ndarray:
         """Display waiting/scanning message on frame"""
-        frame_copy = frame.copy()
+        frame_copy = frame if in_place else frame.copy()
         
+        # The text and frame size rarely change, so the position is worked out once
         text = "Scanning for faces..."
-        (text_width, text_height), _ = cv2.getTextSize(text, self.font, 1.0, 2)
-        x = (frame.shape[1] - text_width) // 2
-        y = (frame.shape[0] + text_height) // 2
+        origin = self._waiting_origin.get(frame.shape[:2])
+        if origin is None:
+            (text_width, text_height), _ = cv2.getTextSize(text, self.font, 1.0, 2)
+            origin = ((frame.shape[1] - text_width) // 2, (frame.shape[0] + text_height) // 2)
+            self._waiting_origin[frame.shape[:2]] = origin
         
-        cv2.putText(frame_copy, text, (x, y), self.font, 
+        cv2.putText(frame_copy, text, origin, self.font,
                    1.0, (0, 255, 0), 2, self.line_type)
         
         return frame_copy
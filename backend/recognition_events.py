@@ -0,0 +1,201 @@
+"""
+Recognition Event Stream for Smart Vision Clinic
+Publishes recognition events to local subscribers as Server-Sent Events over HTTP
+or as JSON lines over a Unix socket, so clients subscribe instead of polling
+"""
+
+import os
+import json
+import time
+import queue
+import threading
+import socketserver
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+
+class EventBroadcaster:
+    """
+    Fans every published event out to all subscribers
+    
+    Each subscriber has a bounded queue; one that falls behind loses its oldest
+    events instead of slowing down recognition. The last `history` events are
+    kept so an HTTP client reconnecting with Last-Event-ID misses nothing.
+    """
+    
+    def __init__(self, history: int = 100, subscriber_queue: int = 256, keepalive: float = 15.0):
+        self.subscriber_queue = subscriber_queue
+        self.keepalive = keepalive
+        
+        self._history = deque(maxlen=history)
+        self._subscribers: List[queue.Queue] = []
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._servers = []
+        self._closed = False
+        
+        self.published = 0
+        self.dropped = 0
+    
+    def publish(self, event_type: str, **data) -> Dict:
+        """Send an event to every subscriber without blocking; returns the event"""
+        with self._lock:
+            event = {'id': self._next_id, 'event': event_type, 'time': time.time(), **data}
+            self._next_id += 1
+            self.published += 1
+            self._history.append(event)
+            for subscriber in self._subscribers:
+                self._offer(subscriber, event)
+        return event
+    
+    def _offer(self, subscriber: queue.Queue, event: Optional[Dict]):
+        while True:
+            try:
+                subscriber.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    subscriber.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+    
+    def subscribe(self, last_event_id: Optional[int] = None) -> queue.Queue:
+        """
+        Queue receiving every event from now on (None once the stream closes)
+        Events after last_event_id that are still in the history are replayed first
+        """
+        subscriber = queue.Queue(maxsize=self.subscriber_queue)
+        with self._lock:
+            if last_event_id is not None:
+                for event in self._history:
+                    if event['id'] > last_event_id:
+                        self._offer(subscriber, event)
+            if self._closed:
+                self._offer(subscriber, None)
+            self._subscribers.append(subscriber)
+        return subscriber
+    
+    def unsubscribe(self, subscriber: queue.Queue):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+    
+    def events(self, subscriber: queue.Queue):
+        """Yield a subscriber's events, and None whenever keepalive seconds pass without one"""
+        while True:
+            try:
+                event = subscriber.get(timeout=self.keepalive)
+            except queue.Empty:
+                yield None
+                continue
+            if event is None:
+                return
+            yield event
+    
+    def start_http(self, port: int, host: str = "127.0.0.1") -> int:
+        """
+        Serve GET /events (text/event-stream) and GET /health on a background thread
+        Returns the port actually bound (pass 0 for any free port)
+        """
+        broadcaster = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?')[0]
+                if path == '/health':
+                    body = json.dumps(broadcaster.stats()).encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                if path != '/events':
+                    self.send_error(404)
+                    return
+                
+                last_event_id = self.headers.get('Last-Event-ID')
+                subscriber = broadcaster.subscribe(int(last_event_id) if last_event_id
+                                                   and last_event_id.isdigit() else None)
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Cache-Control', 'no-cache')
+                self.end_headers()
+                try:
+                    for event in broadcaster.events(subscriber):
+                        if event is None:
+                            # Comment line: keeps proxies open and finds dead clients
+                            self.wfile.write(b": keepalive\n\n")
+                        else:
+                            self.wfile.write(f"id: {event['id']}\nevent: {event['event']}\n"
+                                             f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    broadcaster.unsubscribe(subscriber)
+            
+            def log_message(self, format, *args):
+                # One line per subscriber would flood the recognition log
+                pass
+        
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        self._serve(server)
+        print(f"Recognition events on http://{host}:{server.server_address[1]}/events")
+        return server.server_address[1]
+    
+    def start_socket(self, socket_path: str):
+        """Stream events as JSON lines to every client of a local Unix socket"""
+        broadcaster = self
+        
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                subscriber = broadcaster.subscribe()
+                try:
+                    for event in broadcaster.events(subscriber):
+                        # A blank line is the keepalive
+                        line = json.dumps(event) + "\n" if event is not None else "\n"
+                        self.wfile.write(line.encode('utf-8'))
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    broadcaster.unsubscribe(subscriber)
+        
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        
+        server = socketserver.ThreadingUnixStreamServer(socket_path, Handler)
+        server.daemon_threads = True
+        self._serve(server)
+        print(f"Recognition events on unix socket {socket_path}")
+    
+    def _serve(self, server):
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self._servers.append(server)
+    
+    def close(self):
+        """End every subscriber's stream and stop the servers"""
+        with self._lock:
+            self._closed = True
+            for subscriber in self._subscribers:
+                self._offer(subscriber, None)
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+            if isinstance(server.server_address, str) and os.path.exists(server.server_address):
+                os.remove(server.server_address)
+        self._servers = []
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'published': self.published,
+                'dropped': self.dropped,
+                'last_event_id': self._next_id - 1,
+            }
@@ -0,0 +1,263 @@
+"""
+Recognition Pipeline for Smart Vision Clinic
+Runs capture, face detection and face recognition on separate threads
+so the preview never waits on the embedding model
+"""
+
+import cv2
+import time
+import queue
+import threading
+import numpy as np
+from typing import Optional, Dict, List, Tuple
+from face_detectors import Box
+from face_tracker import IoUTracker
+
+
+class LatestQueue:
+    """Bounded queue that drops the oldest item instead of blocking the producer"""
+    
+    def __init__(self, maxsize: int = 1):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+    
+    def put(self, item):
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+    
+    def get(self, timeout: float = 0.1):
+        """Return the next item, or None if nothing arrived within timeout"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+    
+    def get_nowait(self):
+        """Return the next item, or None if the queue is empty"""
+        try:
+            return self._queue.get_nowait()
+        except queue.Empty:
+            return None
+    
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+
+class StageStats:
+    """Throughput and latency counters for one pipeline stage"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.count = 0
+        self.total_time = 0.0
+        self.last_latency = 0.0
+    
+    def record(self, latency: float):
+        with self._lock:
+            self.count += 1
+            self.total_time += latency
+            self.last_latency = latency
+    
+    def as_dict(self) -> Dict:
+        with self._lock:
+            elapsed = max(time.time() - self.started, 1e-6)
+            return {
+                'count': self.count,
+                'fps': self.count / elapsed,
+                'avg_ms': 1000 * self.total_time / self.count if self.count else 0.0,
+                'last_ms': 1000 * self.last_latency,
+            }
+
+
+class RecognitionPipeline:
+    """
+    capture thread -> frame queue -> detection thread -> recognition queue -> recognition worker
+    
+    Detections are tracked across frames (face_tracker.IoUTracker) and only
+    tracks that are new, still unconfirmed or whose confidence has decayed are
+    sent for embedding; recognition_interval spaces those requests out.
+    
+    Queues hold at most one item and drop stale frames, so a slow stage only
+    lowers its own rate. The UI reads the most recent frame, boxes and
+    recognition results through latest() and poll_results().
+    
+    With scheduled=True there is no recognition thread; a shared
+    RecognitionScheduler (multi_camera.py) serves the recognition queue.
+    """
+    
+    def __init__(self, face_recognition, source=0, width: int = 1280, height: int = 720,
+                 recognition_interval: float = 0.5, name: str = "camera", detector=None,
+                 scheduled: bool = False, tracker: Optional[IoUTracker] = None):
+        self.face_recognition = face_recognition
+        self.source = source
+        self.name = name
+        self.detector = detector
+        self.scheduled = scheduled
+        self.recognition_ready: Optional[threading.Event] = None
+        # Re-checks follow the model's threshold (ArcFace matches score far below VGG-Face's)
+        self.tracker = tracker or IoUTracker(match_threshold=face_recognition.threshold)
+        self.width = width
+        self.height = height
+        self.recognition_interval = recognition_interval
+        
+        self.frame_queue = LatestQueue(maxsize=1)
+        self.recognition_queue = LatestQueue(maxsize=1)
+        self.results = queue.Queue()
+        
+        self.stats_by_stage = {
+            'capture': StageStats(),
+            'detection': StageStats(),
+            'recognition': StageStats(),
+        }
+        
+        self._lock = threading.Lock()
+        self._latest_frame: Optional[np.ndarray] = None
+        self._latest_frame_id = 0
+        self._latest_faces: List[Box] = []
+        self._last_recognition_request = 0.0
+        
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._capture = None
+    
+    def start(self) -> bool:
+        """Open the camera and start the worker threads"""
+        self._capture = cv2.VideoCapture(self.source)
+        if not self._capture.isOpened():
+            print(f"Error: Could not open camera {self.name} ({self.source})")
+            return False
+        
+        self._capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        self._capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        
+        self._stop.clear()
+        targets = [self._capture_loop, self._detection_loop]
+        if not self.scheduled:
+            targets.append(self._recognition_loop)
+        for target in targets:
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return True
+    
+    def stop(self):
+        """Stop all threads and release the camera"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self._threads = []
+        if self._capture is not None:
+            self._capture.release()
+            self._capture = None
+    
+    @property
+    def running(self) -> bool:
+        return not self._stop.is_set()
+    
+    def _capture_loop(self):
+        frame_id = 0
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            ret, frame = self._capture.read()
+            if not ret:
+                self._stop.set()
+                break
+            
+            frame_id += 1
+            with self._lock:
+                self._latest_frame = frame
+                self._latest_frame_id = frame_id
+            self.frame_queue.put((frame_id, frame))
+            self.stats_by_stage['capture'].record(time.perf_counter() - start)
+    
+    def _detection_loop(self):
+        while not self._stop.is_set():
+            item = self.frame_queue.get()
+            if item is None:
+                continue
+            
+            frame_id, frame = item
+            start = time.perf_counter()
+            faces = self.face_recognition.detect_faces_in_frame(frame, self.detector)
+            tracks = self.tracker.update(faces)
+            with self._lock:
+                self._latest_faces = faces
+            self.stats_by_stage['detection'].record(time.perf_counter() - start)
+            
+            # Embed only the faces whose tracks need an identity, at most once per interval
+            now = time.time()
+            if not faces or now - self._last_recognition_request < self.recognition_interval:
+                continue
+            selected = self.tracker.select_for_recognition(tracks)
+            if selected:
+                self._last_recognition_request = now
+                self.recognition_queue.put((frame_id, frame, [t.box for t in selected],
+                                            [t.track_id for t in selected]))
+                if self.recognition_ready is not None:
+                    self.recognition_ready.set()
+    
+    def _recognition_loop(self):
+        while not self._stop.is_set():
+            item = self.recognition_queue.get()
+            if item is not None:
+                self.recognize(item)
+    
+    def recognize(self, item: Tuple[int, np.ndarray, List[Box], List[int]]):
+        """
+        Run recognition for one queued (frame_id, frame, boxes, track_ids) item
+        Each result is a vote for its track; the reported identity is the voted one
+        """
+        frame_id, frame, faces, track_ids = item
+        start = time.perf_counter()
+        # Reuse this frame's detections; only the face crops are embedded
+        matches = self.face_recognition.recognize_faces(frame, faces)
+        self.stats_by_stage['recognition'].record(time.perf_counter() - start)
+        voted = [(box, self.tracker.observe(track_id, match))
+                 for (box, match), track_id in zip(matches, track_ids)]
+        self.results.put((frame_id, voted))
+    
+    def latest(self) -> Tuple[Optional[np.ndarray], int, List[Box]]:
+        """Most recent (frame, frame_id, face boxes) for rendering"""
+        with self._lock:
+            return self._latest_frame, self._latest_frame_id, list(self._latest_faces)
+    
+    def active_tracks(self) -> List[Tuple[int, Box, Optional[str], float]]:
+        """(track_id, box, identity, confidence) for faces in the latest frame"""
+        return self.tracker.active_tracks()
+    
+    def poll_results(self) -> List[Tuple[int, List[Tuple[Box, Optional[Tuple[str, float]]]]]]:
+        """
+        Drain recognition results produced since the last call
+        Each result is (frame_id, [(box, voted (patient_id, similarity) or None), ...])
+        """
+        results = []
+        while True:
+            try:
+                results.append(self.results.get_nowait())
+            except queue.Empty:
+                return results
+    
+    def stats(self) -> Dict:
+        """Per-stage throughput/latency and queue depths"""
+        return {
+            'stages': {name: stage.as_dict() for name, stage in self.stats_by_stage.items()},
+            'queues': {
+                'frames': {'depth': self.frame_queue.qsize(), 'dropped': self.frame_queue.dropped},
+                'recognition': {'depth': self.recognition_queue.qsize(),
+                                'dropped': self.recognition_queue.dropped},
+                'results': {'depth': self.results.qsize()},
+            },
+            'tracker': {
+                'active_tracks': len(self.tracker.active_tracks()),
+                'recognitions_requested': self.tracker.recognitions_requested,
+            },
+        }
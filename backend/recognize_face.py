@@ -2,6 +2,8 @@
 """
 Recognize a patient from an image
 Usage: python3 recognize_face.py <image_path>
+Pass "-" as image_path to stream the encoded image on stdin
+Set FACE_METRICS_JSON=<path> to write stage timings and counters there on exit
 Returns JSON with recognition result
 """
 
@@ -14,6 +16,9 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 try:
     from face_recognition_module import FaceRecognitionSystem
+    from metrics import REGISTRY
+    
+    REGISTRY.dump_on_exit(os.environ.get("FACE_METRICS_JSON"))
     
     if len(sys.argv) != 2:
         result = {
@@ -26,7 +31,7 @@ try:
     image_path = sys.argv[1]
     
     # Check if image exists
-    if not os.path.exists(image_path):
+    if image_path != '-' and not os.path.exists(image_path):
         result = {
             "recognized": False,
             "message": f"Image file not found: {image_path}"
@@ -37,10 +42,12 @@ try:
     # Initialize face recognition system
     face_recognition = FaceRecognitionSystem()
     
-    # Extract face embedding
-    embedding = face_recognition.extract_face_embedding(image_path)
+    # Extract face embedding ("-" means the image bytes arrive on stdin)
+    image = sys.stdin.buffer.read() if image_path == '-' else image_path
+    embedding = face_recognition.extract_face_embedding(image)
     
     if embedding is None:
+        face_recognition.count_no_face()
         result = {
             "recognized": False,
             "message": "No face detected in image"
@@ -48,12 +55,11 @@ try:
         print(json.dumps(result))
         sys.exit(0)
     
-    # Find matching patient
-    patient_id = face_recognition.find_matching_patient(embedding)
+    # Find matching patient together with its confidence
+    match = face_recognition.match_patient(embedding)
     
-    if patient_id:
-        # Calculate confidence
-        similarity = face_recognition.cosine_similarity(embedding, face_recognition.patient_encodings[patient_id])
+    if match:
+        patient_id, similarity = match
         result = {
             "recognized": True,
             "patientId": patient_id,
@@ -2,6 +2,8 @@
 """
 Register a patient's face for recognition
 Usage: python3 register_face.py <patient_id> <image_path>
+Pass "-" as image_path to stream the encoded image on stdin
+Set FACE_METRICS_JSON=<path> to write stage timings and counters there on exit
 """
 
 import sys
@@ -12,6 +14,9 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 try:
     from face_recognition_module import FaceRecognitionSystem
+    from metrics import REGISTRY
+    
+    REGISTRY.dump_on_exit(os.environ.get("FACE_METRICS_JSON"))
     
     if len(sys.argv) != 3:
         print("Error: Invalid arguments. Usage: python3 register_face.py <patient_id> <image_path>")
@@ -21,7 +26,7 @@ try:
     image_path = sys.argv[2]
     
     # Check if image exists
-    if not os.path.exists(image_path):
+    if image_path != '-' and not os.path.exists(image_path):
         print(f"Error: Image file not found: {image_path}")
         sys.exit(1)
     
@@ -30,7 +35,8 @@ try:
     
     # Extract face embedding
     print(f"Extracting face features for patient: {patient_id}")
-    embedding = face_recognition.extract_face_embedding(image_path)
+    image = sys.stdin.buffer.read() if image_path == '-' else image_path
+    embedding = face_recognition.extract_face_embedding(image)
     
     if embedding is None:
         print("Error: Could not detect face in image")
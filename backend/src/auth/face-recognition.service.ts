@@ -1,9 +1,10 @@
 import { Injectable, Logger } from '@nestjs/common';
 import { PrismaService } from '../prisma/prisma.service';
 import { spawn } from 'child_process';
-import { readFileSync, writeFileSync, unlinkSync, existsSync } from 'fs';
+import { existsSync } from 'fs';
 import { join } from 'path';
 import * as crypto from 'crypto';
+import { getFaceWorker, isWorkerUnavailable } from '../face-recognition/face-worker.client';
 
 @Injectable()
 export class FaceRecognitionService {
@@ -156,7 +157,7 @@ export class FaceRecognitionService {
       }
 
       // Try using Python DeepFace for real face recognition
-      const pythonResult = await this.runPythonFaceRecognition('extract', cleanBase64);
+      const pythonResult = await this.runFaceWorker('extract', cleanBase64);
       
       if (pythonResult.success && pythonResult.descriptor && Array.isArray(pythonResult.descriptor)) {
         // Convert descriptor array to JSON string for storage
@@ -180,13 +181,34 @@ export class FaceRecognitionService {
     }
   }
 
+  /**
+   * Run a job on the shared face worker, falling back to the helper script
+   * when the worker cannot be started, times out or exits
+   */
+  private async runFaceWorker(operation: string, imageBase64: string, patientId?: string): Promise<any> {
+    const payload: Record<string, any> = { image_b64: imageBase64 };
+    if (patientId) {
+      payload.patient_id = patientId;
+    }
+
+    try {
+      const result = await getFaceWorker().request(operation, payload);
+      if (!isWorkerUnavailable(result)) {
+        return result;
+      }
+    } catch (error: any) {
+      this.logger.warn(`Face worker request failed: ${error.message}`);
+    }
+
+    return this.runPythonFaceRecognition(operation, imageBase64, patientId);
+  }
+
   /**
    * Run Python face recognition scripts with proper error handling
+   * The image is streamed to the script on stdin ("-" image path)
    */
   private async runPythonFaceRecognition(operation: string, imageBase64: string, patientId?: string): Promise<any> {
     return new Promise((resolve) => {
-      const tempImagePath = join(process.cwd(), `temp_${Date.now()}_${crypto.randomBytes(8).toString('hex')}.jpg`);
-      
       try {
         // Decode base64 image to buffer
         let buffer: Buffer;
@@ -202,9 +224,6 @@ export class FaceRecognitionService {
           return;
         }
         
-        // Write image buffer to temp file
-        writeFileSync(tempImagePath, buffer);
-        
         // Build Python command - try multiple possible script locations
         const possibleScriptPaths = [
           join(process.cwd(), 'auth_face_helper.py'),
@@ -215,14 +234,11 @@ export class FaceRecognitionService {
         let pythonScript = possibleScriptPaths.find(path => existsSync(path));
         if (!pythonScript) {
           this.logger.warn('Python face recognition script not found, using fallback');
-          if (existsSync(tempImagePath)) {
-            unlinkSync(tempImagePath);
-          }
           resolve({ success: false, error: 'Python script not found' });
           return;
         }
         
-        const args = [pythonScript, operation, tempImagePath];
+        const args = [pythonScript, operation, '-'];
         if (patientId) {
           args.push(patientId);
         }
@@ -247,21 +263,19 @@ export class FaceRecognitionService {
         
         if (!pythonProcess) {
           this.logger.warn('Python not found, using fallback');
-          if (existsSync(tempImagePath)) {
-            unlinkSync(tempImagePath);
-          }
           resolve({ success: false, error: 'Python not installed' });
           return;
         }
         
+        // Stream the image bytes instead of writing a temp file
+        pythonProcess.stdin.on('error', () => undefined);
+        pythonProcess.stdin.end(buffer);
+        
         let output = '';
         let errorOutput = '';
         const timeout = 30000; // 30 second timeout
         const timeoutId = setTimeout(() => {
           pythonProcess.kill();
-          if (existsSync(tempImagePath)) {
-            unlinkSync(tempImagePath);
-          }
           this.logger.error('Python script timeout');
           resolve({ success: false, error: 'Python script timeout' });
         }, timeout);
@@ -277,15 +291,6 @@ export class FaceRecognitionService {
         pythonProcess.on('close', (code: number) => {
           clearTimeout(timeoutId);
           
-          // Clean up temp file
-          if (existsSync(tempImagePath)) {
-            try {
-            unlinkSync(tempImagePath);
-            } catch (cleanupError) {
-              this.logger.warn('Failed to cleanup temp file', cleanupError);
-            }
-          }
-          
           if (code === 0 && output) {
             try {
               const result = JSON.parse(output.trim());
@@ -308,26 +313,10 @@ export class FaceRecognitionService {
         
         pythonProcess.on('error', (err: Error) => {
           clearTimeout(timeoutId);
-          // Clean up temp file
-          if (existsSync(tempImagePath)) {
-            try {
-            unlinkSync(tempImagePath);
-            } catch (cleanupError) {
-              this.logger.warn('Failed to cleanup temp file', cleanupError);
-            }
-          }
           this.logger.error(`Python spawn error: ${err.message}`);
           resolve({ success: false, error: err.message });
         });
       } catch (error: any) {
-        // Clean up temp file
-        if (existsSync(tempImagePath)) {
-          try {
-          unlinkSync(tempImagePath);
-          } catch (cleanupError) {
-            this.logger.warn('Failed to cleanup temp file', cleanupError);
-          }
-        }
         this.logger.error(`Error running Python script: ${error.message}`);
         resolve({ success: false, error: error.message });
       }
@@ -1,11 +1,12 @@
-import { Injectable, Logger } from '@nestjs/common';
+import { Injectable, Logger, OnModuleDestroy, OnModuleInit } from '@nestjs/common';
 import { spawn } from 'child_process';
 import * as fs from 'fs';
 import * as path from 'path';
 import { PatientsService } from '../patients/patients.service';
+import { getFaceWorker, isWorkerUnavailable } from './face-worker.client';
 
 @Injectable()
-export class FaceRecognitionService {
+export class FaceRecognitionService implements OnModuleInit, OnModuleDestroy {
   private readonly logger = new Logger(FaceRecognitionService.name);
   private readonly pythonScriptsPath = path.join(__dirname, '../../../');
   private readonly encodingsPath = path.join(__dirname, '../../../face_encodings');
@@ -17,19 +18,49 @@ export class FaceRecognitionService {
     }
   }
 
+  /**
+   * Start the face worker with the app, so the first check-in does not pay for
+   * loading the model; requests made meanwhile wait for it to become ready
+   */
+  onModuleInit() {
+    void getFaceWorker().start();
+  }
+
+  onModuleDestroy() {
+    getFaceWorker().stop();
+  }
+
   /**
    * Register a patient's face encoding
    */
   async registerPatientFace(
     patientId: string,
     imagePath: string,
+  ): Promise<{ success: boolean; message: string }> {
+    return this.registerFace(patientId, { image_path: imagePath }, imagePath);
+  }
+
+  /**
+   * Register a face given either an image path or inline image bytes
+   */
+  private async registerFace(
+    patientId: string,
+    image: { image_path?: string; image_b64?: string },
+    scriptImageArg: string,
+    scriptInput?: Buffer,
   ): Promise<{ success: boolean; message: string }> {
     try {
       this.logger.log(`Registering face for patient: ${patientId}`);
 
-      // Run Python script to extract and save face encoding
-      const pythonScript = path.join(this.pythonScriptsPath, 'register_face.py');
-      const result = await this.runPythonScript(pythonScript, [patientId, imagePath]);
+      // Prefer the warm worker; fall back to a one-off script if it is unavailable
+      let result = await getFaceWorker().request('register', {
+        ...image,
+        patient_id: patientId,
+      });
+      if (isWorkerUnavailable(result)) {
+        const pythonScript = path.join(this.pythonScriptsPath, 'register_face.py');
+        result = await this.runPythonScript(pythonScript, [patientId, scriptImageArg], scriptInput);
+      }
 
       if (result.success) {
         this.logger.log(`Face registered successfully for patient: ${patientId}`);
@@ -51,24 +82,41 @@ export class FaceRecognitionService {
     patientId?: string;
     confidence?: number;
     message?: string;
+  }> {
+    return this.recognizeFace({ image_path: imagePath }, imagePath);
+  }
+
+  /**
+   * Recognize a face given either an image path or inline image bytes
+   */
+  private async recognizeFace(
+    image: { image_path?: string; image_b64?: string },
+    scriptImageArg: string,
+    scriptInput?: Buffer,
+  ): Promise<{
+    recognized: boolean;
+    patientId?: string;
+    confidence?: number;
+    message?: string;
   }> {
     try {
       this.logger.log('Attempting to recognize patient from image');
 
-      // Run Python script to recognize face
-      const pythonScript = path.join(this.pythonScriptsPath, 'recognize_face.py');
-      const result = await this.runPythonScript(pythonScript, [imagePath]);
-
-      if (result.success && result.output) {
-        const data = JSON.parse(result.output);
-        if (data.recognized && data.patientId) {
-          this.logger.log(`Patient recognized: ${data.patientId} (confidence: ${data.confidence})`);
-          return {
-            recognized: true,
-            patientId: data.patientId,
-            confidence: data.confidence,
-          };
-        }
+      // Prefer the warm worker; fall back to a one-off script if it is unavailable
+      let data = await getFaceWorker().request('recognize', image);
+      if (isWorkerUnavailable(data)) {
+        const pythonScript = path.join(this.pythonScriptsPath, 'recognize_face.py');
+        const result = await this.runPythonScript(pythonScript, [scriptImageArg], scriptInput);
+        data = result.success && result.output ? JSON.parse(result.output) : {};
+      }
+
+      if (data.recognized && data.patientId) {
+        this.logger.log(`Patient recognized: ${data.patientId} (confidence: ${data.confidence})`);
+        return {
+          recognized: true,
+          patientId: data.patientId,
+          confidence: data.confidence,
+        };
       }
 
       return { recognized: false, message: 'No matching patient found' };
@@ -83,14 +131,17 @@ export class FaceRecognitionService {
    */
   async getRegisteredPatients(): Promise<string[]> {
     try {
-      if (!fs.existsSync(this.encodingsPath)) {
-        return [];
+      // Registrations live in gallery.bin; leftover .pkl files are stale after migration
+      let result = await getFaceWorker().request('list');
+      if (isWorkerUnavailable(result)) {
+        result = await this.runGalleryScript(['list']);
+      }
+      if (result.success) {
+        return result.patient_ids;
       }
 
-      const files = fs.readdirSync(this.encodingsPath);
-      return files
-        .filter((file) => file.endsWith('.pkl'))
-        .map((file) => file.replace('.pkl', ''));
+      this.logger.error(`Error getting registered patients: ${result.error}`);
+      return [];
     } catch (error) {
       this.logger.error(`Error getting registered patients: ${error.message}`);
       return [];
@@ -102,32 +153,56 @@ export class FaceRecognitionService {
    */
   async deletePatientEncoding(patientId: string): Promise<{ success: boolean; message: string }> {
     try {
-      const encodingPath = path.join(this.encodingsPath, `${patientId}.pkl`);
-      if (fs.existsSync(encodingPath)) {
-        fs.unlinkSync(encodingPath);
+      // The worker tombstones the patient in the gallery file and in memory
+      let result = await getFaceWorker().request('delete', { patient_id: patientId });
+      if (isWorkerUnavailable(result)) {
+        result = await this.runGalleryScript(['delete', patientId]);
+        if (result.success) {
+          // A worker that only timed out still holds the patient in memory
+          void getFaceWorker().request('reload');
+        }
+      }
+      if (result.success) {
         this.logger.log(`Face encoding deleted for patient: ${patientId}`);
         return { success: true, message: 'Face encoding deleted successfully' };
       }
 
-      return { success: false, message: 'Face encoding not found' };
+      return { success: false, message: result.error || 'Failed to delete face encoding' };
     } catch (error) {
       this.logger.error(`Error deleting face encoding: ${error.message}`);
       return { success: false, message: error.message };
     }
   }
 
+  /**
+   * List or delete registrations with manage_faces.py while the worker is unavailable
+   */
+  private async runGalleryScript(args: string[]): Promise<any> {
+    const result = await this.runPythonScript(path.join(this.pythonScriptsPath, 'manage_faces.py'), args);
+    if (!result.success) {
+      return { success: false, error: result.error };
+    }
+    // The JSON result is the script's last line of output
+    return JSON.parse(result.output.split('\n').pop());
+  }
+
   /**
    * Run a Python script and return the result
    */
   private async runPythonScript(
     scriptPath: string,
     args: string[],
+    input?: Buffer,
   ): Promise<{ success: boolean; output?: string; error?: string }> {
     return new Promise((resolve) => {
       const python = spawn('python3', [scriptPath, ...args]);
       let output = '';
       let error = '';
 
+      // Image bytes are streamed on stdin instead of going through a temp file
+      python.stdin.on('error', () => undefined);
+      python.stdin.end(input);
+
       python.stdout.on('data', (data) => {
         output += data.toString();
       });
@@ -179,21 +254,14 @@ export class FaceRecognitionService {
     base64Image: string,
   ): Promise<{ success: boolean; message: string }> {
     try {
-      // Convert base64 to temporary file
-      const buffer = Buffer.from(base64Image, 'base64');
-      const tempImagePath = path.join(this.pythonScriptsPath, `temp_${Date.now()}.jpg`);
-      
-      fs.writeFileSync(tempImagePath, buffer);
-      
-      try {
-        const result = await this.registerPatientFace(patientId, tempImagePath);
-        return result;
-      } finally {
-        // Clean up temp file
-        if (fs.existsSync(tempImagePath)) {
-          fs.unlinkSync(tempImagePath);
-        }
-      }
+      // Stream the image bytes to Python instead of writing a temp file
+      const cleanBase64 = this.stripDataUrl(base64Image);
+      return await this.registerFace(
+        patientId,
+        { image_b64: cleanBase64 },
+        '-',
+        Buffer.from(cleanBase64, 'base64'),
+      );
     } catch (error) {
       this.logger.error(`Error registering face from base64: ${error.message}`);
       return { success: false, message: error.message };
@@ -210,25 +278,23 @@ export class FaceRecognitionService {
     message?: string;
   }> {
     try {
-      // Convert base64 to temporary file
-      const buffer = Buffer.from(base64Image, 'base64');
-      const tempImagePath = path.join(this.pythonScriptsPath, `temp_recognition_${Date.now()}.jpg`);
-      
-      fs.writeFileSync(tempImagePath, buffer);
-      
-      try {
-        const result = await this.recognizePatient(tempImagePath);
-        return result;
-      } finally {
-        // Clean up temp file
-        if (fs.existsSync(tempImagePath)) {
-          fs.unlinkSync(tempImagePath);
-        }
-      }
+      // Stream the image bytes to Python instead of writing a temp file
+      const cleanBase64 = this.stripDataUrl(base64Image);
+      return await this.recognizeFace(
+        { image_b64: cleanBase64 },
+        '-',
+        Buffer.from(cleanBase64, 'base64'),
+      );
     } catch (error) {
       this.logger.error(`Error recognizing face from base64: ${error.message}`);
       return { recognized: false, message: error.message };
     }
   }
-}
 
+  /**
+   * Remove a data URL prefix (data:image/jpeg;base64,...) if present
+   */
+  private stripDataUrl(base64Image: string): string {
+    return base64Image.includes(',') ? base64Image.split(',')[1] : base64Image;
+  }
+}
@@ -0,0 +1,227 @@
+import { Logger } from '@nestjs/common';
+import { spawn, ChildProcessWithoutNullStreams } from 'child_process';
+import { existsSync } from 'fs';
+import { join } from 'path';
+
+interface PendingJob {
+  resolve: (result: any) => void;
+  timeoutId: NodeJS.Timeout;
+}
+
+/**
+ * Errors meaning the job never ran to completion on the worker; callers
+ * should fall back to the one-off Python scripts on these
+ */
+const UNAVAILABLE_ERRORS = new Set(['Face worker not available', 'Face worker timeout', 'Face worker exited']);
+
+export function isWorkerUnavailable(result: any): boolean {
+  return !!result && UNAVAILABLE_ERRORS.has(result.error);
+}
+
+/**
+ * Client for the long-lived Python face worker (face_worker.py).
+ * The worker loads the model and patient gallery once and answers
+ * JSON-line jobs, so requests no longer pay the Python cold start.
+ */
+export class FaceWorkerClient {
+  private readonly logger = new Logger(FaceWorkerClient.name);
+  private process: ChildProcessWithoutNullStreams | null = null;
+  private buffer = '';
+  private nextId = 1;
+  private readonly pending = new Map<number, PendingJob>();
+
+  // Resolves once the worker prints its "ready" line (false if it dies first)
+  private ready: Promise<boolean> | null = null;
+  private settleReady: ((ready: boolean) => void) | null = null;
+  private isReady = false;
+
+  // Workers that die before becoming ready are respawned with exponential backoff
+  private failedStarts = 0;
+  private retryAt = 0;
+
+  constructor(
+    private readonly scriptPath: string,
+    private readonly timeout: number = 30000,
+    private readonly startupTimeout: number = 180000,
+    private readonly maxBackoff: number = 300000,
+  ) {}
+
+  /**
+   * Send a job to the worker, waiting for it to finish starting if needed.
+   * The job timeout only starts once the worker is ready.
+   */
+  async request(op: string, payload: Record<string, any> = {}): Promise<any> {
+    const ready = await this.start();
+    const worker = this.process;
+    if (!ready || !worker) {
+      return { success: false, error: 'Face worker not available' };
+    }
+
+    const id = this.nextId++;
+    return new Promise((resolve) => {
+      const timeoutId = setTimeout(() => {
+        this.pending.delete(id);
+        this.logger.error(`Face worker job ${id} (${op}) timed out`);
+        resolve({ success: false, error: 'Face worker timeout' });
+      }, this.timeout);
+
+      this.pending.set(id, { resolve, timeoutId });
+      worker.stdin.write(JSON.stringify({ ...payload, id, op }) + '\n');
+    });
+  }
+
+  /**
+   * Start the worker (model import and gallery load) unless it is running
+   * or backing off after failed starts. Resolves to whether it is ready.
+   */
+  start(): Promise<boolean> {
+    if (this.ready) {
+      return this.ready;
+    }
+
+    if (Date.now() < this.retryAt) {
+      return Promise.resolve(false);
+    }
+
+    if (!existsSync(this.scriptPath)) {
+      this.logger.warn(`Face worker script not found: ${this.scriptPath}`);
+      return Promise.resolve(false);
+    }
+
+    let worker: ChildProcessWithoutNullStreams;
+    try {
+      worker = spawn('python3', [this.scriptPath], {
+        cwd: process.cwd(),
+        env: { ...process.env, PYTHONUNBUFFERED: '1' },
+      });
+    } catch (error: any) {
+      this.logger.error(`Failed to start face worker: ${error.message}`);
+      this.startFailed();
+      return Promise.resolve(false);
+    }
+
+    this.ready = new Promise((resolve) => {
+      const startupTimer = setTimeout(() => {
+        this.logger.error(`Face worker not ready after ${this.startupTimeout}ms`);
+        worker.kill();
+      }, this.startupTimeout);
+
+      this.settleReady = (ready: boolean) => {
+        clearTimeout(startupTimer);
+        this.settleReady = null;
+        resolve(ready);
+      };
+    });
+
+    worker.stdout.on('data', (data: Buffer) => this.onData(data));
+    worker.stderr.on('data', (data: Buffer) => {
+      this.logger.debug(data.toString().trim());
+    });
+    worker.on('close', (code: number) => {
+      if (this.process === worker) {
+        this.logger.warn(`Face worker exited with code ${code}`);
+        this.onExit();
+      }
+    });
+    worker.on('error', (err: Error) => {
+      if (this.process === worker) {
+        this.logger.error(`Face worker spawn error: ${err.message}`);
+        this.onExit();
+      }
+    });
+
+    this.process = worker;
+    this.logger.log('Face worker starting');
+    return this.ready;
+  }
+
+  stop(): void {
+    const worker = this.process;
+    if (worker) {
+      this.onExit(false);
+      worker.kill();
+    }
+  }
+
+  private startFailed(): void {
+    this.failedStarts++;
+    const delay = Math.min(1000 * 2 ** (this.failedStarts - 1), this.maxBackoff);
+    this.retryAt = Date.now() + delay;
+    this.logger.warn(`Face worker failed to start ${this.failedStarts} time(s); retrying in ${delay}ms`);
+  }
+
+  private onData(data: Buffer): void {
+    this.buffer += data.toString();
+
+    let newline = this.buffer.indexOf('\n');
+    while (newline >= 0) {
+      const line = this.buffer.slice(0, newline).trim();
+      this.buffer = this.buffer.slice(newline + 1);
+      newline = this.buffer.indexOf('\n');
+
+      if (!line) {
+        continue;
+      }
+
+      let message: any;
+      try {
+        message = JSON.parse(line);
+      } catch (e) {
+        this.logger.warn(`Unparseable face worker output: ${line}`);
+        continue;
+      }
+
+      if (message.event === 'ready') {
+        this.isReady = true;
+        this.failedStarts = 0;
+        this.logger.log(`Face worker ready (${message.patients} patients)`);
+        this.settleReady?.(true);
+        continue;
+      }
+
+      const job = this.pending.get(message.id);
+      if (!job) {
+        continue;
+      }
+
+      clearTimeout(job.timeoutId);
+      this.pending.delete(message.id);
+      delete message.id;
+      job.resolve(message.error ? { success: false, error: message.error } : message);
+    }
+  }
+
+  private onExit(startFailed = true): void {
+    if (startFailed && !this.isReady) {
+      this.startFailed();
+    }
+    this.settleReady?.(false);
+    this.process = null;
+    this.ready = null;
+    this.isReady = false;
+    this.buffer = '';
+    for (const [id, job] of this.pending) {
+      clearTimeout(job.timeoutId);
+      job.resolve({ success: false, error: 'Face worker exited' });
+      this.pending.delete(id);
+    }
+  }
+}
+
+let sharedWorker: FaceWorkerClient | null = null;
+
+/**
+ * Process-wide worker shared by every service that needs face recognition
+ */
+export function getFaceWorker(): FaceWorkerClient {
+  if (!sharedWorker) {
+    const possibleScriptPaths = [
+      join(process.cwd(), 'face_worker.py'),
+      join(process.cwd(), 'backend', 'face_worker.py'),
+      join(__dirname, '..', '..', '..', 'face_worker.py'),
+    ];
+    const scriptPath = possibleScriptPaths.find((p) => existsSync(p)) || possibleScriptPaths[0];
+    sharedWorker = new FaceWorkerClient(scriptPath);
+  }
+  return sharedWorker;
+}
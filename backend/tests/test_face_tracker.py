@@ -0,0 +1,56 @@
+"""
+Tests for face_tracker re-check thresholds
+Run from backend/: python3 -m pytest tests
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from face_tracker import IoUTracker, RECHECK_FRACTION
+
+ARCFACE_THRESHOLD = 0.32
+
+
+def confirmed_track(tracker: IoUTracker, similarity: float):
+    """A track whose last two recognitions agreed on one patient"""
+    track = tracker.update([(10, 10, 50, 50)])[0]
+    for _ in range(tracker.min_votes):
+        track.observe(("PAT001", similarity), tracker.min_votes)
+    track.last_attempt = 0.0
+    return track
+
+
+def test_min_confidence_follows_match_threshold():
+    assert IoUTracker(match_threshold=ARCFACE_THRESHOLD).min_confidence == RECHECK_FRACTION * ARCFACE_THRESHOLD
+    assert abs(IoUTracker().min_confidence - 0.5) < 1e-9
+    assert IoUTracker(match_threshold=ARCFACE_THRESHOLD, min_confidence=0.2).min_confidence == 0.2
+
+
+def test_confirmed_arcface_match_is_not_re_embedded():
+    tracker = IoUTracker(match_threshold=ARCFACE_THRESHOLD)
+    track = confirmed_track(tracker, 0.36)
+    assert track.identity == "PAT001"
+    assert not tracker.needs_recognition(track)
+    
+    # An absolute 0.5 floor would re-embed every ArcFace match on every interval
+    assert IoUTracker(min_confidence=0.5).needs_recognition(confirmed_track(IoUTracker(), 0.36))
+
+
+def test_decayed_arcface_match_is_re_checked():
+    tracker = IoUTracker(match_threshold=ARCFACE_THRESHOLD, half_life=60.0)
+    track = confirmed_track(tracker, 0.36)
+    # One half-life later the confidence (0.18) is below 5/6 of 0.32
+    track.last_recognized = time.monotonic() - 60.0
+    assert tracker.needs_recognition(track)
+
+
+def test_pipeline_tracker_uses_the_model_threshold():
+    from types import SimpleNamespace
+    from recognition_pipeline import RecognitionPipeline
+    
+    # SFace's default threshold; the pipeline only reads it when building the tracker
+    pipeline = RecognitionPipeline(SimpleNamespace(threshold=0.407))
+    assert pipeline.tracker.min_confidence == RECHECK_FRACTION * 0.407
@@ -0,0 +1,144 @@
+"""
+Visit Writer for Smart Vision Clinic
+Records check-in visits on a background thread so recognition never waits on SQLite
+"""
+
+import time
+import queue
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class VisitWriter:
+    """
+    Queues check-in visits and writes them in batched transactions
+    
+    A batch is flushed once batch_size visits are queued or flush_interval
+    seconds after the first one arrived. A patient checked in again within
+    coalesce_window seconds is not recorded twice. on_write, if given, is called
+    from the writer thread with the patient ids of every batch written.
+    """
+    
+    def __init__(self, db, batch_size: int = 50, flush_interval: float = 1.0,
+                 coalesce_window: float = 300.0,
+                 on_write: Optional[Callable[[List[str]], None]] = None):
+        self.db = db
+        self.on_write = on_write
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.coalesce_window = coalesce_window
+        
+        self._queue = queue.Queue()
+        self._last_checkin: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        
+        self.queued = 0
+        self.coalesced = 0
+        self.written = 0
+        self.batches = 0
+        self.unwritten = 0
+        self._in_flight = 0
+        
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._closed = False
+        self._thread.start()
+    
+    def record(self, patient_id: str, purpose: str = "", notes: str = "",
+               prescription: str = "") -> bool:
+        """
+        Queue a visit without blocking
+        Returns False if it was coalesced into a recent check-in for the same patient
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("VisitWriter is closed")
+            last = self._last_checkin.get(patient_id)
+            if last is not None and now - last < self.coalesce_window:
+                self.coalesced += 1
+                return False
+            self._last_checkin[patient_id] = now
+            self.queued += 1
+        
+        # Same format and timezone as SQLite's CURRENT_TIMESTAMP, taken at check-in time
+        visit_date = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        self._queue.put((patient_id, purpose, notes, prescription, visit_date))
+        return True
+    
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            
+            self._in_flight = len(batch)
+            self._write(batch)
+            self._in_flight = 0
+            for _ in range(len(batch) + stop):
+                self._queue.task_done()
+            if stop:
+                return
+    
+    def _write(self, batch: List[Tuple[str, str, str, str, str]]):
+        try:
+            self.written += self.db.add_visits(batch)
+            self.batches += 1
+        except Exception as e:
+            print(f"Error writing visits: {e}")
+            return
+        if self.on_write:
+            try:
+                self.on_write(list(dict.fromkeys(visit[0] for visit in batch)))
+            except Exception as e:
+                print(f"Error in visit write callback: {e}")
+    
+    def flush(self):
+        """Block until every queued visit has been written"""
+        self._queue.join()
+    
+    def close(self, timeout: Optional[float] = 10.0) -> bool:
+        """
+        Write everything still queued and stop the writer thread
+        Returns False if the thread is still writing after timeout; the database
+        must then stay open, and the check-ins not yet written are counted in
+        `unwritten`
+        """
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(None)
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self.unwritten = 0
+            return True
+        # The stop marker is still queued behind the pending visits
+        self.unwritten = self._in_flight + max(self._queue.qsize() - 1, 0)
+        return False
+    
+    def stats(self) -> Dict:
+        return {
+            'queued': self.queued,
+            'coalesced': self.coalesced,
+            'written': self.written,
+            'batches': self.batches,
+            'unwritten': self.unwritten,
+            'pending': self._queue.qsize(),
+        }